@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+Almacén de planes compartido por todos los procesos del host.
+
+Con la validación repartida en varios procesos (servicio_validacion.py y su
+pool, o un proceso por petición desde server.js) cada uno tendría su propia
+copia de cada orden. Aquí cada orden vive una sola vez, codificada con
+formato_planes.py, en un archivo de ALMACEN_PLANES_DIR (por defecto en
+/dev/shm, es decir, en memoria). Los procesos la abren con mmap de solo
+lectura: todos comparten las mismas páginas y cada validación decodifica
+únicamente los carritos que escaneó.
+
+El nombre del archivo lleva la versión de la orden (cache_validaciones.
+version_orden), así que re-publicar un vuelo deja de encontrar el archivo
+anterior; la orden se vuelve a cargar una vez por host y no una vez por
+proceso. Cada archivo trae además su vencimiento en la cabecera.
+
+Uso:
+    python3 almacen_planes.py            # órdenes en el almacén
+    python3 almacen_planes.py --limpiar  # borra las vencidas
+"""
+
+import glob
+import json
+import mmap
+import os
+import re
+import sys
+import tempfile
+import time
+
+from cache_validaciones import version_orden
+from formato_planes import PlanesBinarios, codificar_orden
+
+ALMACEN_PLANES_DIR = os.getenv(
+    'ALMACEN_PLANES_DIR',
+    '/dev/shm/gategroup_planes' if os.path.isdir('/dev/shm')
+    else os.path.join(tempfile.gettempdir(), 'gategroup_planes')
+)
+
+# Vigencia de una orden que se cargó para validar (precarga_vuelos.py usa la suya)
+ALMACEN_PLANES_TTL_S = float(os.getenv('ALMACEN_PLANES_TTL_S', '300'))
+
+# Mapeos abiertos por proceso
+MAX_MAPEOS = 64
+
+EXTENSION = '.plan'
+
+_mapeos = {}
+
+
+def _nombre_seguro(parte):
+    return re.sub(r'[^A-Za-z0-9_.-]', '_', str(parte))
+
+
+def ruta_planes(flight_number, version=None):
+    """Archivo de la orden del vuelo en su versión vigente (o 'version')"""
+    version = version_orden(flight_number) if version is None else version
+    return os.path.join(ALMACEN_PLANES_DIR,
+                        f"{_nombre_seguro(flight_number)}_{_nombre_seguro(version)}{EXTENSION}")
+
+
+def _rutas_del_vuelo(flight_number):
+    return glob.glob(os.path.join(glob.escape(ALMACEN_PLANES_DIR),
+                                  glob.escape(_nombre_seguro(flight_number)) + '_*' + EXTENSION))
+
+
+def invalidar_planes(flight_number, conservar=None):
+    """Borra los archivos del vuelo (menos 'conservar'); quien ya los tenga mapeados los sigue leyendo"""
+    for ruta in _rutas_del_vuelo(flight_number):
+        if ruta != conservar:
+            try:
+                os.remove(ruta)
+            except FileNotFoundError:
+                pass
+
+
+def publicar_orden(flight_number, datos_orden, ttl_s=ALMACEN_PLANES_TTL_S):
+    """Escribe la orden en el almacén (archivo temporal + os.replace) y regresa su ruta"""
+    contenido = codificar_orden(flight_number, datos_orden["carritos"], expira=time.time() + ttl_s)
+    ruta = ruta_planes(flight_number)
+    os.makedirs(ALMACEN_PLANES_DIR, exist_ok=True)
+    fd, ruta_tmp = tempfile.mkstemp(dir=ALMACEN_PLANES_DIR, suffix='.tmp')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(contenido)
+    os.replace(ruta_tmp, ruta)
+    invalidar_planes(flight_number, conservar=ruta)
+    return ruta
+
+
+def _mapear(ruta):
+    """PlanesBinarios del archivo, reutilizando el mapeo mientras sea el mismo archivo"""
+    try:
+        estado = os.stat(ruta)
+    except FileNotFoundError:
+        _mapeos.pop(ruta, None)
+        return None
+
+    clave = (estado.st_ino, estado.st_mtime_ns)
+    mapeo = _mapeos.get(ruta)
+    if mapeo is not None and mapeo[0] == clave:
+        return mapeo[1]
+
+    try:
+        with open(ruta, 'rb') as f:
+            planes = PlanesBinarios(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+    except (FileNotFoundError, ValueError):
+        return None
+
+    if len(_mapeos) >= MAX_MAPEOS:
+        _mapeos.pop(next(iter(_mapeos)))
+    _mapeos[ruta] = (clave, planes)
+    return planes
+
+
+def abrir_planes(flight_number):
+    """PlanesBinarios de la orden vigente del vuelo, o None si no está en el almacén"""
+    planes = _mapear(ruta_planes(flight_number))
+    if planes is None or (planes.expira and planes.expira <= time.time()):
+        return None
+    return planes
+
+
+def orden_compartida(flight_number, cart_ids=None):
+    """La orden del almacén (solo los carritos 'cart_ids' si se pasan), o None si no está"""
+    planes = abrir_planes(flight_number)
+    return None if planes is None else planes.orden(cart_ids)
+
+
+def limpiar_vencidos():
+    """Borra los archivos vencidos o ilegibles; regresa cuántos"""
+    borrados = 0
+    ahora = time.time()
+    for ruta in glob.glob(os.path.join(glob.escape(ALMACEN_PLANES_DIR), '*' + EXTENSION)):
+        planes = _mapear(ruta)
+        if planes is None or (planes.expira and planes.expira <= ahora):
+            try:
+                os.remove(ruta)
+                borrados += 1
+            except FileNotFoundError:
+                pass
+            _mapeos.pop(ruta, None)
+    return borrados
+
+
+def resumen():
+    ordenes = []
+    for ruta in sorted(glob.glob(os.path.join(glob.escape(ALMACEN_PLANES_DIR), '*' + EXTENSION))):
+        planes = _mapear(ruta)
+        if planes is not None:
+            ordenes.append({"archivo": os.path.basename(ruta), "flight_number": planes.flight_number,
+                            "carritos": planes.n_carritos, "bytes": planes.tamano,
+                            "vence_en_s": round(planes.expira - time.time()) if planes.expira else None})
+    return {"directorio": ALMACEN_PLANES_DIR, "ordenes": ordenes}
+
+
+# --- MAIN EXECUTION ---
+if __name__ == "__main__":
+    if sys.argv[1:] == ["--limpiar"]:
+        print(json.dumps({"borrados": limpiar_vencidos()}))
+    elif sys.argv[1:]:
+        print(json.dumps({"error": "Uso: python3 almacen_planes.py [--limpiar]"}))
+        sys.exit(1)
+    else:
+        print(json.dumps(resumen(), ensure_ascii=False))
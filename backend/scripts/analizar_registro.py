@@ -1,75 +1,16 @@
 import json
-import itertools
 import os
 import sys
 from datetime import datetime
 
-# --- 1. ¡AJUSTA ESTE VALOR! ---
-# Define el peso (en gramos) que asumes para CADA caja vacía
-PESO_TARA_POR_CAJA_G = 721.0  # Ejemplo: 150 gramos por caja
-
-
-# --- (Las funciones formatear_solucion y resolver_discrepancia no cambian) ---
-def formatear_solucion(coeficientes, items):
-    """
-    Convierte una solución como (2, -1, 0) en un string legible.
-    'items' es una lista de tuplas: [('sku', peso), ...]
-    """
-    reporte_partes = []
-    for i, k in enumerate(coeficientes):
-        if k == 0:
-            continue
-
-        sku = items[i][0]
-        if k > 0:
-            reporte_partes.append(f"Faltan {k} {sku}")
-        else:
-            reporte_partes.append(f"Sobran {abs(k)} {sku}")
-
-    if not reporte_partes:
-        return "Sugerencia: No se encontró una causa simple para la discrepancia."
-
-    return "Sugerencia: " + ", ".join(reporte_partes) + "."
-
-
-def resolver_discrepancia(diferencia_peso, items_plan):
-    """
-    Resuelve una discrepancia de peso compleja encontrando la combinación
-    de items faltantes/sobrantes más simple que explique la diferencia.
-
-    'items_plan' es un dict: {'sku': {'peso': 30}}
-    """
-
-    items = [(sku, data['peso']) for sku, data in items_plan.items()]
-    if not items:
-        return "Discrepancia de peso no identificada (no hay items en el plan)."
-
-    for search_bound in [5, 10, 25]:
-        search_range = range(-search_bound, search_bound + 1)
-
-        mejor_solucion = None
-        min_coste = float('inf')
-
-        for coeficientes in itertools.product(search_range, repeat=len(items)):
-
-            if all(c == 0 for c in coeficientes):
-                continue
-
-            suma_actual = sum(k * items[i][1] for i, k in enumerate(coeficientes))
-            coste_actual = sum(abs(k) for k in coeficientes)
-
-            # Usar una tolerancia mayor (ej. 1g) puede ser necesario
-            # si los pesos unitarios tienen decimales o hay pequeñas variaciones
-            if abs(suma_actual - diferencia_peso) < 1.0:
-
-                if coste_actual < min_coste:
-                    min_coste = coste_actual
-                    mejor_solucion = coeficientes
-
-        if mejor_solucion:
-            return formatear_solucion(mejor_solucion, items)
-
-    return "Discrepancia de peso compleja no identificada."
+# El peso de cada caja vacía lo estima el modelo de tara (ver modelo_tara.py);
+# PESO_TARA_POR_CAJA_G es el valor que se usa mientras no hay calibración.
+from modelo_tara import ModeloTara, PESO_TARA_POR_CAJA_G
+from motor_discrepancias import resolver_discrepancia_mg
+from motor_tolerancia import banda_tolerancia_mg, compilar_planes
+from perfilado import extraer_bandera, perfilar
+from pesos_fijos import a_gramos, a_mg
+from tabla_skus import TablaSkus
 
 
 def analizar_registros(orden_file, registro_file):
@@ -89,19 +30,36 @@ def analizar_registros(orden_file, registro_file):
     except json.JSONDecodeError as e:
         return {"error": f"El archivo JSON está mal formateado. {e}"}
 
+    reporte_final = analizar_datos(datos_orden, datos_registro)
+    reporte_final["orden_file"] = orden_file
+    reporte_final["registro_file"] = registro_file
+    return reporte_final
+
+
+def analizar_datos(datos_orden, datos_registro, modelo_tara=None):
+    """
+    Igual que analizar_registros, pero sobre la orden y el registro ya cargados.
+    Lo usa replay_registros.py para re-analizar historiales sin pasar por disco.
+
+    Si no se pasa 'modelo_tara' se carga el de disco y se guarda lo aprendido;
+    si se pasa, guardarlo (o no) queda a cargo de quien llama.
+    """
+    guardar_tara = modelo_tara is None
+    if modelo_tara is None:
+        modelo_tara = ModeloTara.cargar()
+
     # --- 2. CREAR EL OBJETO DE REPORTE FINAL ---
     reporte_final = {
         "analysis_timestamp": datetime.now().isoformat(),
-        "orden_file": orden_file,
-        "registro_file": registro_file,
         "peso_tara_asumido_por_caja_g": PESO_TARA_POR_CAJA_G,  # Informa qué peso se usó
         "reporte_carritos": []
     }
 
-    plan_carritos = {
-        carrito['cart_id']: carrito
-        for carrito in datos_orden['carritos']
-    }
+    # Pesos esperados y bandas de tolerancia precalculados una vez por orden
+    plan_carritos = compilar_planes(datos_orden['carritos'])
+
+    # Los planes comparten la tabla de SKUs de la orden; la visión se compara con máscaras
+    tabla_skus = next((plan["tabla_skus"] for plan in plan_carritos.values()), None) or TablaSkus()
 
     # 3. Iterar sobre CADA CARRITO guardado en el archivo de registro
     for scan_carrito in datos_registro:
@@ -109,9 +67,15 @@ def analizar_registros(orden_file, registro_file):
         try:
             cajas_escaneadas = scan_carrito.get('cajas_escaneadas', [])
 
+            estacion = scan_carrito.get('estacion')
+
             # --- A. AGREGAR LA "REALIDAD" DEL SCAN (SUMAR LAS CAJAS) ---
-            peso_medido_bruto_total = 0.0  # Peso CON cajas
-            tipos_detectados_set = set()
+            # Pesos en miligramos enteros (pesos_fijos.py); a gramos solo en el reporte
+            peso_medido_bruto_mg = 0  # Peso CON cajas
+            peso_tara_estimado_mg = 0  # Suma de la tara estimada de cada caja
+            varianza_tara_total = 0.0  # Incertidumbre de esa tara (entra en la banda)
+            fuentes_tara = set()
+            mascara_detectada = 0
             numero_de_cajas = 0
 
             if not cajas_escaneadas:
@@ -127,26 +91,33 @@ def analizar_registros(orden_file, registro_file):
                 if peso_caja is None:
                     # Decide cómo manejar esto: ¿ignorar la caja, dar error?
                     # Por ahora, la ignoramos para el peso pero contamos la caja.
-                    print(f"Advertencia: Caja en carrito {cart_id} no tiene 'peso_medido_g'.")
+                    print(f"Advertencia: Caja en carrito {cart_id} no tiene 'peso_medido_g'.", file=sys.stderr)
                 else:
-                    peso_medido_bruto_total += float(peso_caja)
+                    peso_medido_bruto_mg += a_mg(peso_caja)
 
-                tipos_detectados_set.update(caja.get("tipos_detectados_vision", []))
+                # La tara depende del tipo de caja y la estación (cae al valor fijo sin calibración)
+                tara_caja, varianza_tara, fuente_tara = modelo_tara.estimar(caja.get("tipo_caja"), estacion)
+                peso_tara_estimado_mg += a_mg(tara_caja)
+                varianza_tara_total += varianza_tara
+                fuentes_tara.add(fuente_tara)
+
+                mascara_detectada |= tabla_skus.mascara(caja.get("tipos_detectados_vision", []))
                 numero_de_cajas += 1  # Contar cada entrada, incluso si no tenía peso
 
             # --- B. CALCULAR PESO NETO ---
-            peso_tara_total_estimado = numero_de_cajas * PESO_TARA_POR_CAJA_G
-            peso_medido_neto_total = peso_medido_bruto_total - peso_tara_total_estimado
+            peso_medido_neto_mg = peso_medido_bruto_mg - peso_tara_estimado_mg
 
             # Asegurarse de que el peso neto no sea negativo (podría pasar si la tara es muy alta)
-            peso_medido_neto_total = max(0, peso_medido_neto_total)
+            peso_medido_neto_mg = max(0, peso_medido_neto_mg)
+            peso_medido_neto_total = a_gramos(peso_medido_neto_mg)
 
             resultado_carrito = {
                 "cart_id": cart_id,
                 "numero_cajas_escaneadas": numero_de_cajas,
-                "peso_bruto_medido_g": round(peso_medido_bruto_total, 2),
-                "peso_tara_estimado_g": round(peso_tara_total_estimado, 2),
-                "peso_neto_medido_g": round(peso_medido_neto_total, 2),  # <-- Peso a comparar
+                "peso_bruto_medido_g": a_gramos(peso_medido_bruto_mg),
+                "peso_tara_estimado_g": a_gramos(peso_tara_estimado_mg),
+                "fuentes_tara": sorted(fuentes_tara),
+                "peso_neto_medido_g": peso_medido_neto_total,  # <-- Peso a comparar
                 "status": "OK",
                 "reporte": []
             }
@@ -159,65 +130,70 @@ def analizar_registros(orden_file, registro_file):
                 reporte_final["reporte_carritos"].append(resultado_carrito)
                 continue
 
-            # --- D. CALCULAR TOTALES DEL "PLAN" (Peso esperado de CONTENIDO) ---
-            peso_esperado_contenido = 0.0
-            tolerancia_total = 0.0
-            tipos_esperados_set = set()
-            items_plan_dict = {}
-
-            for item in plan["items_requeridos"]:
-                peso_item = item.get("peso_unitario_g", 0) * item.get("cantidad_requerida", 0)
-                peso_esperado_contenido += peso_item
-                tolerancia_total += item.get("peso_tolerancia", 0)
-                tipos_esperados_set.add(item["sku"])
-                items_plan_dict[item["sku"]] = {"peso": item.get("peso_unitario_g", 0)}
-
-            # Redondear para consistencia
-            peso_esperado_contenido = round(peso_esperado_contenido, 2)
-            tolerancia_total = round(tolerancia_total, 2)
+            # --- D. TOTALES DEL "PLAN" (Peso esperado de CONTENIDO, ya precalculado) ---
+            # La banda combina la varianza por unidad de cada SKU (crece con √cantidad)
+            # y la incertidumbre de la tara estimada de las cajas.
+            peso_esperado_mg = plan["peso_esperado_mg"]
+            peso_esperado_contenido = plan["peso_esperado_g"]
+            tolerancia_mg = banda_tolerancia_mg(plan, varianza_tara_total)
+            mascara_esperada = plan["mascara_esperada"]
+            items_plan_dict = plan["items_plan"]
+            resultado_carrito["peso_esperado_g"] = peso_esperado_contenido
 
             # --- E. COMPARAR Y GENERAR REPORTE ---
             # Comparar tipos
-            items_no_esperados = tipos_detectados_set - tipos_esperados_set
-            items_no_detectados = tipos_esperados_set - tipos_detectados_set
+            items_no_esperados = mascara_detectada & ~mascara_esperada
+            items_no_detectados = mascara_esperada & ~mascara_detectada
+
+            # Los nombres solo se decodifican para el reporte
+            resultado_carrito["productos_incorrectos"] = tabla_skus.nombres(items_no_esperados)
+            resultado_carrito["productos_faltantes"] = tabla_skus.nombres(items_no_detectados)
 
             if items_no_esperados:
                 resultado_carrito["status"] = "ERROR_VISUAL"
                 resultado_carrito["reporte"].append(
-                    f"Productos INCORRECTOS detectados: {sorted(list(items_no_esperados))}")
+                    f"Productos INCORRECTOS detectados: {resultado_carrito['productos_incorrectos']}")
             if items_no_detectados:
                 if resultado_carrito["status"] == "OK":  # Solo marcar si no hay otro error visual
                     resultado_carrito["status"] = "WARNING_VISUAL"  # O ERROR_VISUAL si quieres ser más estricto
                 resultado_carrito["reporte"].append(
-                    f"Productos FALTANTES (no vistos): {sorted(list(items_no_detectados))}")
+                    f"Productos FALTANTES (no vistos): {resultado_carrito['productos_faltantes']}")
 
             # Comparar peso NETO vs peso de CONTENIDO esperado
-            peso_min_esperado = peso_esperado_contenido - tolerancia_total
-            peso_max_esperado = peso_esperado_contenido + tolerancia_total
+            peso_min_esperado = a_gramos(peso_esperado_mg - tolerancia_mg)
+            peso_max_esperado = a_gramos(peso_esperado_mg + tolerancia_mg)
 
-            # Usar el peso NETO calculado
-            if not (peso_min_esperado <= peso_medido_neto_total <= peso_max_esperado):
+            # Usar el peso NETO calculado (comparación entera, exacta)
+            if abs(peso_medido_neto_mg - peso_esperado_mg) > tolerancia_mg:
                 # Marcar como error si no había ya uno visual más grave
                 if resultado_carrito["status"] == "OK" or resultado_carrito["status"] == "WARNING_VISUAL":
                     resultado_carrito["status"] = "ERROR_PESO"
 
                 # Calcular diferencia usando PESO NETO
-                diferencia = round(peso_esperado_contenido - peso_medido_neto_total, 2)
-                signo = "Faltan" if diferencia > 0 else "Sobran"
+                diferencia_mg = peso_esperado_mg - peso_medido_neto_mg
+                signo = "Faltan" if diferencia_mg > 0 else "Sobran"
                 reporte_detallado = (
-                    f"Discrepancia de peso (neto): {signo} {abs(diferencia)}g. "
+                    f"Discrepancia de peso (neto): {signo} {a_gramos(abs(diferencia_mg))}g. "
                     f"(Esperado: {peso_esperado_contenido}g [Rango: {peso_min_esperado:.2f}g a {peso_max_esperado:.2f}g], "
                     f"Medido Neto: {peso_medido_neto_total:.2f}g)"
                 )
                 resultado_carrito["reporte"].append(reporte_detallado)
 
-                sugerencia = resolver_discrepancia(diferencia, items_plan_dict)
+                # La visión acota la búsqueda: SKUs vistos en las cajas y SKUs no vistos
+                sugerencia = resolver_discrepancia_mg(
+                    diferencia_mg, items_plan_dict,
+                    tipos_detectados=tabla_skus.conjunto(mascara_detectada & mascara_esperada),
+                    tipos_faltantes=tabla_skus.conjunto(items_no_detectados))
                 resultado_carrito["reporte"].append(sugerencia)
+                resultado_carrito["sugerencia_encontrada"] = sugerencia.startswith(
+                    ("Sugerencia: Faltan", "Sugerencia: Sobran"))
 
             # Si después de todo, el status sigue OK
             if resultado_carrito["status"] == "OK":
                 resultado_carrito["reporte"].append(
                     f"Peso neto correcto (Esperado: {peso_esperado_contenido}g, Medido Neto: {peso_medido_neto_total:.2f}g)")
+                # Un carrito limpio es una buena muestra para calibrar la tara
+                modelo_tara.aprender_de_carrito(cajas_escaneadas, peso_esperado_contenido, estacion)
 
             reporte_final["reporte_carritos"].append(resultado_carrito)
 
@@ -226,11 +202,18 @@ def analizar_registros(orden_file, registro_file):
         except Exception as e:
             reporte_final["reporte_carritos"].append({"cart_id": cart_id, "error": f"Error procesando registro: {e}"})
 
+    if guardar_tara:
+        try:
+            modelo_tara.guardar()
+        except OSError as e:
+            print(f"Advertencia: no se pudo guardar el modelo de tara: {e}", file=sys.stderr)
+
     return reporte_final
 
 
 # --- EJEMPLO DE CÓMO USAR EL SCRIPT ---
 if __name__ == "__main__":
+    modo_perfil = extraer_bandera(sys.argv)
 
     # --- 1. DEFINE LOS NOMBRES DE TUS ARCHIVOS ---
     archivo_orden = "orden_por_carritos_AM241.json"
@@ -250,7 +233,7 @@ if __name__ == "__main__":
         print("Por favor, crea un 'registro_AM241.json' de prueba.")
         sys.exit(1)
 
-    reporte = analizar_registros(archivo_orden, archivo_registro)
+    reporte = perfilar('analizar_registro', analizar_registros, archivo_orden, archivo_registro, modo=modo_perfil)
 
     if isinstance(reporte, dict) and "error" in reporte:
         print(f"ERROR: {reporte['error']}")
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Benchmark de arranque en frío de los scripts que lanza server.js.
+
+Cada petición del backend lanza un proceso de Python nuevo, así que el tiempo
+de importación se paga en cada escaneo. Este script ejecuta los caminos que no
+tocan la base de datos (errores de uso, argumentos inválidos, modelo de tara
+local) con `python -X importtime`, y reporta:
+- tiempo de pared (mínimo y mediana de N repeticiones),
+- los módulos de primer nivel más caros,
+- si se importó alguna dependencia pesada que debería cargarse en diferido
+  (snowflake, dotenv, bcrypt).
+
+Uso:
+    python3 bench_arranque.py                   # 5 repeticiones por caso
+    python3 bench_arranque.py --repeticiones 20
+    python3 bench_arranque.py --max-ms 150      # sale con 1 si algún caso lo excede
+"""
+
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+DIRECTORIO_SCRIPTS = os.path.dirname(os.path.abspath(__file__))
+
+# (nombre, argumentos) — ninguno de estos caminos debe abrir una conexión
+CASOS = [
+    ("validate_inventory: sin argumentos", ["validate_inventory.py"]),
+    ("validate_inventory: JSON inválido", ["validate_inventory.py", "AM241", "{no-es-json"]),
+    ("crear_orden: sin argumentos", ["crear_orden.py"]),
+    ("get_inventory: sin argumentos", ["get_inventory.py"]),
+    ("replay_registros: --workers inválido", ["replay_registros.py", ".", "--workers", "x"]),
+    ("precarga_vuelos: --cada inválido", ["precarga_vuelos.py", "--cada", "x"]),
+    ("modelo_tara: resumen local", ["modelo_tara.py"]),
+]
+
+# Módulos que solo deben importarse cuando el script realmente los usa
+MODULOS_DIFERIDOS = ("snowflake", "dotenv", "bcrypt")
+
+TOP_IMPORTS = 5
+
+
+def _parsear_importtime(stderr):
+    """
+    Regresa {modulo_primer_nivel: microsegundos_acumulados} a partir de la
+    salida de -X importtime ("import time: self | cumulative | nombre").
+    """
+    acumulados = {}
+    for linea in stderr.splitlines():
+        if not linea.startswith("import time:"):
+            continue
+        partes = linea[len("import time:"):].split("|")
+        if len(partes) != 3:
+            continue
+        columna = partes[2].rstrip()
+        nombre = columna.lstrip()
+        # Los submódulos vienen con más sangría; solo interesan los de primer nivel
+        if len(columna) - len(nombre) > 1:
+            continue
+        try:
+            acumulados[nombre] = acumulados.get(nombre, 0) + int(partes[1])
+        except ValueError:
+            continue
+    return acumulados
+
+
+def _modulos_importados(stderr):
+    modulos = set()
+    for linea in stderr.splitlines():
+        if linea.startswith("import time:"):
+            modulos.add(linea.rsplit("|", 1)[-1].strip().split(".")[0])
+    return modulos
+
+
+def medir_caso(argumentos, repeticiones):
+    tiempos_ms = []
+    ultimo_stderr = ""
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        proceso = subprocess.run(
+            [sys.executable, "-X", "importtime"] + argumentos,
+            cwd=DIRECTORIO_SCRIPTS, capture_output=True, text=True
+        )
+        tiempos_ms.append((time.perf_counter() - inicio) * 1000)
+        ultimo_stderr = proceso.stderr
+
+    acumulados = _parsear_importtime(ultimo_stderr)
+    mas_caros = sorted(acumulados.items(), key=lambda par: par[1], reverse=True)[:TOP_IMPORTS]
+    importados = _modulos_importados(ultimo_stderr)
+
+    return {
+        "min_ms": round(min(tiempos_ms), 1),
+        "mediana_ms": round(statistics.median(tiempos_ms), 1),
+        "imports_mas_caros_ms": {nombre: round(us / 1000, 1) for nombre, us in mas_caros},
+        "diferidos_importados": sorted(set(MODULOS_DIFERIDOS) & importados),
+    }
+
+
+def ejecutar(repeticiones=5, max_ms=None):
+    resultados = {}
+    fallas = []
+    for nombre, argumentos in CASOS:
+        resultado = medir_caso(argumentos, repeticiones)
+        resultados[nombre] = resultado
+        print(f"  {nombre}: {resultado['mediana_ms']} ms (min {resultado['min_ms']})", file=sys.stderr)
+
+        if resultado["diferidos_importados"]:
+            fallas.append(f"{nombre}: importó {', '.join(resultado['diferidos_importados'])}")
+        if max_ms is not None and resultado["mediana_ms"] > max_ms:
+            fallas.append(f"{nombre}: {resultado['mediana_ms']} ms > {max_ms} ms")
+
+    return {"success": not fallas, "repeticiones": repeticiones, "casos": resultados, "fallas": fallas}
+
+
+def _valor_argumento(argumentos, nombre, default, tipo):
+    if nombre not in argumentos:
+        return default
+    i = argumentos.index(nombre)
+    try:
+        return tipo(argumentos[i + 1])
+    except (IndexError, ValueError):
+        print(json.dumps({"error": f"{nombre} requiere un número"}))
+        sys.exit(1)
+
+
+# --- MAIN EXECUTION ---
+if __name__ == "__main__":
+    argumentos = sys.argv[1:]
+    repeticiones = _valor_argumento(argumentos, "--repeticiones", 5, int)
+    max_ms = _valor_argumento(argumentos, "--max-ms", None, float)
+
+    reporte = ejecutar(repeticiones, max_ms)
+    print(json.dumps(reporte, indent=2, ensure_ascii=False))
+
+    if not reporte["success"]:
+        sys.exit(1)
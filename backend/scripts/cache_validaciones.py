@@ -0,0 +1,108 @@
+"""
+Cache idempotente de resultados de validación.
+
+Las estaciones reintentan /api/inventory/validate cuando el Wi-Fi falla, y
+cada reintento repetía la consulta de la orden y la búsqueda de
+discrepancias. Aquí el reporte se guarda con la clave
+
+    (vuelo, versión de la orden, sha256 del scanned_data canónico)
+
+en la misma cache de archivos de cargador_ordenes.py, así que:
+- un reenvío idéntico regresa el reporte guardado con una sola lectura,
+- los duplicados simultáneos esperan el lock del primero y leen su resultado,
+- los reportes con "error" (vuelo no encontrado, fallas) no se guardan, ni
+  los que se hicieron contra el respaldo de la orden ("orden_desactualizada",
+  ver resiliencia_ordenes.py): al volver el warehouse se validan de nuevo.
+
+La versión sale de un marcador local por vuelo que publicar_reparto()
+reescribe en cada re-publicación (marcar_republicacion), junto con el
+borrado de los reportes del vuelo; así la validación no tiene que ir al
+warehouse para saber si su reporte sigue vigente.
+"""
+
+import hashlib
+import json
+import os
+
+from cargador_ordenes import cargar_coalescido, escribir_entrada, invalidar_prefijo, leer_entrada, ruta_entrada
+
+# Cuánto se reutiliza un reporte (los reintentos llegan en segundos o minutos)
+VALIDACIONES_TTL_S = float(os.getenv('VALIDACIONES_TTL_S', '900'))
+
+# El marcador de versión solo tiene que sobrevivir a los reportes que distingue
+TTL_MARCADOR_VERSION_S = 7 * 24 * 3600
+
+
+class _NoGuardar(Exception):
+    """Lleva un resultado que se regresa sin guardarse en la cache"""
+
+    def __init__(self, resultado):
+        super().__init__()
+        self.resultado = resultado
+
+
+def huella_escaneo(scanned_data):
+    """sha256 del scanned_data en forma canónica (llaves ordenadas, sin espacios)"""
+    canonico = json.dumps(scanned_data, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha256(canonico.encode('utf-8')).hexdigest()
+
+
+def marcador_version(flight_number):
+    """{"departure_date", "version"} del marcador local del vuelo, o None"""
+    entrada = leer_entrada(ruta_entrada('version_orden', flight_number))
+    if entrada is None or entrada['negativo']:
+        return None
+    return entrada['resultado']
+
+
+def version_orden(flight_number):
+    """Versión publicada más reciente del vuelo según el marcador local ('0' si no hay)"""
+    marcador = marcador_version(flight_number)
+    if marcador is None:
+        return '0'
+    return f"{marcador['departure_date']}-v{marcador['version']}"
+
+
+def marcar_republicacion(flight_number, departure_date, version):
+    """Registra la nueva versión del vuelo y borra sus reportes guardados"""
+    escribir_entrada(ruta_entrada('version_orden', flight_number),
+                     {"departure_date": str(departure_date), "version": version}, TTL_MARCADOR_VERSION_S)
+    invalidar_prefijo('validacion', flight_number)
+
+
+def es_guardable(resultado):
+    return "error" not in resultado and "orden_desactualizada" not in resultado
+
+
+def clave_validacion(flight_number, scanned_data):
+    return (flight_number, version_orden(flight_number), huella_escaneo(scanned_data))
+
+
+def leer_validacion(clave):
+    """Reporte guardado para la clave o None"""
+    entrada = leer_entrada(ruta_entrada('validacion', *clave))
+    return None if entrada is None or entrada['negativo'] else entrada['resultado']
+
+
+def guardar_validacion(clave, resultado):
+    """Guarda el reporte si no es un error ni se hizo con una orden desactualizada"""
+    if es_guardable(resultado):
+        escribir_entrada(ruta_entrada('validacion', *clave), resultado, VALIDACIONES_TTL_S)
+
+
+def validar_idempotente(flight_number, scanned_data, validar):
+    """
+    Regresa validar(flight_number, scanned_data), reutilizando el reporte de
+    un envío idéntico contra la misma versión de la orden.
+    """
+    def calcular():
+        resultado = validar(flight_number, scanned_data)
+        if not es_guardable(resultado):
+            raise _NoGuardar(resultado)
+        return resultado
+
+    try:
+        return cargar_coalescido('validacion', clave_validacion(flight_number, scanned_data), calcular,
+                                 ttl_s=VALIDACIONES_TTL_S)
+    except _NoGuardar as e:
+        return e.resultado
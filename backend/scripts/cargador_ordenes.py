@@ -0,0 +1,191 @@
+"""
+Capa de coalescencia para la carga de órdenes de vuelo.
+
+server.js lanza un proceso de Python por petición, así que en los picos de
+salida varias estaciones piden la misma orden casi al mismo tiempo y cada una
+repetiría el mismo join en Snowflake. Esta capa usa un archivo por clave
+(vuelo, fecha) en un directorio local:
+
+- El primer proceso toma un lock exclusivo (flock) y hace la consulta.
+- Los demás esperan el lock y, al obtenerlo, leen el resultado que quedó
+  escrito en lugar de consultar de nuevo.
+- "Vuelo no encontrado" se guarda un rato corto (cache negativa).
+- Los errores de conexión/consulta nunca se guardan.
+
+flock también bloquea entre hilos del mismo proceso (cada llamada abre su
+propio descriptor), así que sirve igual para servicio_validacion.py.
+
+Cada carga se registra en metricas.py por origen: 'cache' (hit), 'coalescida'
+(otro proceso la consultó mientras se esperaba el lock) o 'warehouse' (miss).
+"""
+
+import fcntl
+import glob
+import json
+import os
+import re
+import sys
+import tempfile
+import time
+
+from metricas import incrementar, observar
+
+ORDENES_CACHE_DIR = os.getenv(
+    'ORDENES_CACHE_DIR',
+    os.path.join(tempfile.gettempdir(), 'gategroup_ordenes')
+)
+
+# Ventana en la que un resultado recién consultado se comparte con peticiones simultáneas
+TTL_COALESCENCIA_S = float(os.getenv('ORDENES_TTL_COALESCENCIA_S', '5'))
+
+# Cuánto se recuerda un "vuelo no encontrado"
+TTL_NEGATIVO_S = float(os.getenv('ORDENES_TTL_NEGATIVO_S', '30'))
+
+
+def _nombre_seguro(parte):
+    return re.sub(r'[^A-Za-z0-9_.-]', '_', str(parte))
+
+
+def ruta_entrada(tipo, *clave):
+    """Ruta del archivo de cache para una clave, p. ej. ('crear_orden', 'AM241', None)"""
+    nombre = "_".join([tipo] + [_nombre_seguro(parte) if parte is not None else 'any' for parte in clave])
+    return os.path.join(ORDENES_CACHE_DIR, nombre + '.json')
+
+
+def leer_entrada(ruta, ahora=None):
+    """
+    Regresa la entrada vigente {'resultado', 'negativo', 'expira'} o None
+    si no existe, expiró o está corrupta.
+    """
+    ahora = time.time() if ahora is None else ahora
+    try:
+        with open(ruta, 'r', encoding='utf-8') as f:
+            entrada = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+    if entrada.get('expira', 0) <= ahora:
+        return None
+    return entrada
+
+
+def escribir_entrada(ruta, resultado, ttl_s):
+    """Escribe la entrada de forma atómica (archivo temporal + os.replace)"""
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+    entrada = {
+        'expira': time.time() + ttl_s,
+        'negativo': resultado is None,
+        'resultado': resultado,
+    }
+    fd, ruta_tmp = tempfile.mkstemp(dir=os.path.dirname(ruta), suffix='.tmp')
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        json.dump(entrada, f, ensure_ascii=False)
+    os.replace(ruta_tmp, ruta)
+
+
+def invalidar(tipo, *clave):
+    """Borra la entrada de una clave (p. ej. después de re-publicar la orden)"""
+    try:
+        os.remove(ruta_entrada(tipo, *clave))
+    except FileNotFoundError:
+        pass
+
+
+def invalidar_prefijo(tipo, *clave):
+    """Borra todas las entradas cuya clave empieza con 'clave' (p. ej. todas las de un vuelo)"""
+    prefijo = ruta_entrada(tipo, *clave)[:-len('.json')]
+    for ruta in glob.glob(glob.escape(prefijo) + '_*.json'):
+        try:
+            os.remove(ruta)
+        except FileNotFoundError:
+            pass
+
+
+def parchar_entrada(tipo, clave, parche):
+    """
+    Aplica parche(resultado) a la entrada vigente de 'clave' y la reescribe con
+    el TTL que le quedaba. parche() regresa el resultado nuevo, o None si la
+    entrada ya no se puede corregir (en ese caso se borra).
+    Regresa True si la entrada quedó parchada.
+    """
+    ruta = ruta_entrada(tipo, *clave)
+    try:
+        lock = open(ruta + '.lock', 'w')
+    except OSError:
+        invalidar(tipo, *clave)
+        return False
+
+    with lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        ahora = time.time()
+        entrada = leer_entrada(ruta, ahora)
+        if entrada is None or entrada['negativo']:
+            invalidar(tipo, *clave)
+            return False
+
+        resultado = parche(entrada['resultado'])
+        if resultado is None:
+            invalidar(tipo, *clave)
+            return False
+        escribir_entrada(ruta, resultado, entrada['expira'] - ahora)
+        return True
+
+
+def _consultar_medido(tipo, consultar):
+    """consultar() con su resultado (encontrada/no_encontrada/error) registrado"""
+    try:
+        resultado = consultar()
+    except Exception:
+        incrementar('ordenes_consultas_total', tipo=tipo, resultado='error')
+        raise
+    incrementar('ordenes_consultas_total', tipo=tipo,
+                resultado='encontrada' if resultado is not None else 'no_encontrada')
+    return resultado
+
+
+def _registrar_carga(tipo, origen, inicio):
+    incrementar('ordenes_cargas_total', tipo=tipo, origen=origen)
+    observar('ordenes_carga_segundos', time.perf_counter() - inicio, tipo=tipo, origen=origen)
+
+
+def cargar_coalescido(tipo, clave, consultar, ttl_s=TTL_COALESCENCIA_S, ttl_negativo_s=TTL_NEGATIVO_S):
+    """
+    Regresa el resultado de consultar() para 'clave', compartiendo una sola
+    consulta entre llamadas concurrentes (de cualquier proceso).
+
+    consultar() debe regresar el resultado, None si la orden no existe,
+    o lanzar una excepción si falló (la excepción se propaga y no se guarda).
+    """
+    inicio = time.perf_counter()
+    ruta = ruta_entrada(tipo, *clave)
+
+    entrada = leer_entrada(ruta)
+    if entrada is not None:
+        _registrar_carga(tipo, 'cache', inicio)
+        return entrada['resultado']
+
+    try:
+        os.makedirs(ORDENES_CACHE_DIR, exist_ok=True)
+        lock = open(ruta + '.lock', 'w')
+    except OSError as e:
+        # Sin directorio de cache se degrada a una consulta directa
+        print(f"Advertencia: cache de órdenes no disponible ({e}); consultando directo.", file=sys.stderr)
+        resultado = _consultar_medido(tipo, consultar)
+        _registrar_carga(tipo, 'warehouse', inicio)
+        return resultado
+
+    with lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+
+        # Quien tuvo el lock antes pudo haber dejado el resultado
+        entrada = leer_entrada(ruta)
+        if entrada is not None:
+            _registrar_carga(tipo, 'coalescida', inicio)
+            return entrada['resultado']
+
+        resultado = _consultar_medido(tipo, consultar)
+        try:
+            escribir_entrada(ruta, resultado, ttl_s if resultado is not None else ttl_negativo_s)
+        except OSError as e:
+            print(f"Advertencia: no se pudo guardar la orden en cache: {e}", file=sys.stderr)
+        _registrar_carga(tipo, 'warehouse', inicio)
+        return resultado
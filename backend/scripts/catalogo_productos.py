@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Nombres del catálogo (PRODUCTS) con su huella, para el enum de la visión.
+
+crear_orden.py y get_inventory.py mandaban el catálogo completo en cada
+orden. Ahora el cliente lo pide aparte (GET /api/catalog) y lo guarda con su
+huella: si manda la que ya tiene, la respuesta no trae los nombres
+({"huella", "sin_cambios": true}; el servidor contesta 304). La consulta a
+PRODUCTS se comparte entre procesos con cargar_coalescido y vive
+CATALOGO_TTL_S segundos; precarga_vuelos.py deja la entrada lista.
+
+Uso:
+    python3 catalogo_productos.py [huella_conocida]
+"""
+
+import json
+import os
+import sys
+
+from cargador_ordenes import cargar_coalescido, escribir_entrada, ruta_entrada
+from resolutor_skus import huella_catalogo
+
+# Vigencia del catálogo en la cache local de órdenes
+CATALOGO_TTL_S = float(os.getenv('CATALOGO_TTL_S', '300'))
+
+SQL_CATALOGO = "SELECT sku, product_name FROM PRODUCTS ORDER BY product_name;"
+
+
+def catalogo_de_filas(filas):
+    """{"huella", "catalogo_nombres"} a partir de [(sku, product_name), ...]"""
+    return {"huella": huella_catalogo(filas), "catalogo_nombres": [nombre for _, nombre in filas]}
+
+
+def guardar_catalogo(filas, ttl_s=CATALOGO_TTL_S):
+    """Deja el catálogo en la cache (precarga_vuelos.py ya trae las filas)"""
+    escribir_entrada(ruta_entrada('catalogo', None), catalogo_de_filas(filas), ttl_s)
+
+
+def consultar_catalogo():
+    """Lee PRODUCTS; los errores se propagan"""
+    from conexion import conectar_snowflake
+
+    conn = conectar_snowflake()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(SQL_CATALOGO)
+            filas = [(row[0], row[1]) for row in cursor.fetchall()]
+    finally:
+        conn.close()
+    return catalogo_de_filas(filas)
+
+
+def catalogo_para(huella_conocida=None):
+    """El catálogo, o solo su huella si el cliente ya tiene esa versión"""
+    catalogo = cargar_coalescido('catalogo', (None,), consultar_catalogo, ttl_s=CATALOGO_TTL_S)
+    if huella_conocida and huella_conocida == catalogo["huella"]:
+        return {"huella": catalogo["huella"], "sin_cambios": True}
+    return catalogo
+
+
+# --- MAIN EXECUTION ---
+if __name__ == "__main__":
+    try:
+        resultado = catalogo_para(sys.argv[1] if len(sys.argv) > 1 else None)
+    except Exception as e:
+        print(json.dumps({"error": f"Error al consultar el catálogo: {str(e)}"}))
+        sys.exit(1)
+    print(json.dumps(resultado, ensure_ascii=False))
@@ -0,0 +1,119 @@
+"""
+Conexión a Snowflake con carga diferida.
+
+snowflake.connector y python-dotenv tardan en importarse, y la mayoría de los
+caminos de los scripts (análisis de archivos locales, errores de uso,
+validaciones de argumentos) nunca tocan la base de datos. Por eso los scripts
+no los importan al inicio: llaman a cargar_entorno() o conectar_snowflake()
+justo antes de necesitarlos.
+
+Las variables propias de los scripts (TARA_MODELO_PATH, ORDENES_CACHE_DIR,
+TOLERANCIA_CONFIANZA, ...) se leen al importar cada módulo, antes de cargar el
+.env: deben venir del entorno del proceso (server.js, cron o systemd).
+
+La conexión que regresa conectar_snowflake() cuenta y cronometra cada viaje
+al warehouse (execute/executemany) en metricas.py; por lo demás se comporta
+igual que la del conector.
+"""
+
+import os
+import time
+
+from metricas import incrementar, observar
+
+_entorno_cargado = False
+
+
+def cargar_entorno():
+    """Carga el .env una sola vez por proceso"""
+    global _entorno_cargado
+    if not _entorno_cargado:
+        from dotenv import load_dotenv
+        load_dotenv()
+        _entorno_cargado = True
+
+
+def conectar_snowflake(**opciones):
+    """
+    Crea una conexión a Snowflake con las variables de entorno.
+    'opciones' se pasa tal cual al conector (p. ej. connect_timeout=30).
+    """
+    cargar_entorno()
+    import snowflake.connector
+
+    inicio = time.perf_counter()
+    try:
+        conn = snowflake.connector.connect(
+            user=os.getenv('SNOWFLAKE_USER'),
+            password=os.getenv('SNOWFLAKE_PASSWORD'),
+            account=os.getenv('SNOWFLAKE_ACCOUNT'),
+            warehouse=os.getenv('SNOWFLAKE_WAREHOUSE'),
+            database=os.getenv('SNOWFLAKE_DATABASE'),
+            schema=os.getenv('SNOWFLAKE_SCHEMA'),
+            **opciones
+        )
+    except Exception:
+        incrementar('warehouse_conexiones_total', resultado='error')
+        raise
+    finally:
+        observar('warehouse_conexion_segundos', time.perf_counter() - inicio)
+    incrementar('warehouse_conexiones_total', resultado='ok')
+    return ConexionMedida(conn)
+
+
+class CursorMedido:
+    """Cursor del conector que registra cada viaje al warehouse"""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def _medir(self, operacion, metodo, *args, **kwargs):
+        inicio = time.perf_counter()
+        try:
+            resultado = metodo(*args, **kwargs)
+        except Exception:
+            incrementar('warehouse_viajes_total', operacion=operacion, resultado='error')
+            raise
+        finally:
+            observar('warehouse_viaje_segundos', time.perf_counter() - inicio, operacion=operacion)
+        incrementar('warehouse_viajes_total', operacion=operacion, resultado='ok')
+        # El conector regresa el mismo cursor; se conserva el envoltorio
+        return self if resultado is self._cursor else resultado
+
+    def execute(self, *args, **kwargs):
+        return self._medir('execute', self._cursor.execute, *args, **kwargs)
+
+    def executemany(self, *args, **kwargs):
+        return self._medir('executemany', self._cursor.executemany, *args, **kwargs)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *excepcion):
+        self._cursor.close()
+        return False
+
+    def __getattr__(self, nombre):
+        return getattr(self._cursor, nombre)
+
+
+class ConexionMedida:
+    """Conexión del conector cuyos cursores son CursorMedido"""
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def cursor(self, *args, **kwargs):
+        return CursorMedido(self._conn.cursor(*args, **kwargs))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *excepcion):
+        return self._conn.__exit__(*excepcion)
+
+    def __getattr__(self, nombre):
+        return getattr(self._conn, nombre)
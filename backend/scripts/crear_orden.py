@@ -1,28 +1,48 @@
 #!/usr/bin/env python3
-import snowflake.connector
 import json
 import sys
-import os
-from dotenv import load_dotenv
 
-# Load environment variables
-load_dotenv()
+from cargador_ordenes import cargar_coalescido
+from conexion import conectar_snowflake
+from perfilado import extraer_bandera, perfilar
+from plan_orden import leer_plan_orden
+from planes_cajones import adjuntar_cajones, leer_cajones
 
-# --- SNOWFLAKE CONFIGURATION ---
-SNOWFLAKE_USER = os.getenv('SNOWFLAKE_USER')
-SNOWFLAKE_PASSWORD = os.getenv('SNOWFLAKE_PASSWORD')
-SNOWFLAKE_ACCOUNT = os.getenv('SNOWFLAKE_ACCOUNT')
-SNOWFLAKE_WAREHOUSE = os.getenv('SNOWFLAKE_WAREHOUSE')
-SNOWFLAKE_DATABASE = os.getenv('SNOWFLAKE_DATABASE')
-SNOWFLAKE_SCHEMA = os.getenv('SNOWFLAKE_SCHEMA')
 
-
-def generar_json_orden_por_carritos(flight_number: str):
+def generar_json_orden_por_carritos(flight_number: str, departure_date: str = None):
     """
-    Se conecta a Snowflake y genera un JSON que contiene:
+    Genera un JSON que contiene:
     1. La orden maestra del vuelo (agrupada por carrito).
     2. El número total de carritos en el vuelo.
-    3. La lista completa de nombres de productos del catálogo.
+
+    Los nombres del catálogo se piden aparte (catalogo_productos.py).
+
+    Las peticiones simultáneas del mismo (vuelo, fecha) comparten una sola
+    consulta a Snowflake (ver cargador_ordenes.py).
+    """
+    try:
+        json_final = cargar_coalescido(
+            'crear_orden', (flight_number, departure_date),
+            lambda: consultar_orden_por_carritos(flight_number, departure_date)
+        )
+    except Exception as e:
+        print(json.dumps({"error": f"Error al conectar o consultar Snowflake: {str(e)}"}), file=sys.stderr)
+        return None
+
+    # Si no hay orden, significa que el vuelo no se encontró (o está en la cache negativa)
+    if not json_final:
+        print(json.dumps({"error": f"Vuelo '{flight_number}' no encontrado o sin carritos asignados."}), file=sys.stderr)
+        return None
+
+    # Return the JSON directly instead of writing to file
+    # The Node.js server will handle the response
+    return json_final
+
+
+def consultar_orden_por_carritos(flight_number, departure_date=None):
+    """
+    Consulta la orden en Snowflake.
+    Regresa None si el vuelo no tiene carritos; los errores se propagan.
     """
 
     # Consulta 1: Obtiene la orden (incluye el total de carritos)
@@ -45,97 +65,97 @@ def generar_json_orden_por_carritos(flight_number: str):
         PRODUCTS p ON ci.PRODUCT_SKU = p.SKU
     WHERE
         f.FLIGHT_NUMBER = %s
+        {filtro_fecha}
     ORDER BY
         c.CART_ID;
     """
-
-    # Consulta 2: Obtiene todos los nombres del catálogo
-    sql_query_catalogo = "SELECT product_name FROM PRODUCTS ORDER BY product_name;"
+    parametros_orden = [flight_number]
+    if departure_date:
+        sql_query_orden = sql_query_orden.format(filtro_fecha="AND f.DEPARTURE_DATE = %s")
+        parametros_orden.append(departure_date)
+    else:
+        sql_query_orden = sql_query_orden.format(filtro_fecha="")
 
     # Estructura base del JSON de salida
     json_final = {
         "flight_number": flight_number,
         "total_carritos_en_vuelo": 0,
-        "carritos": [],
-        "catalogo_nombres": []
+        "carritos": []
     }
 
-    carritos_dict = {}
     conn = None
 
     try:
         # Conexión a Snowflake
-        conn = snowflake.connector.connect(
-            user=SNOWFLAKE_USER,
-            password=SNOWFLAKE_PASSWORD,
-            account=SNOWFLAKE_ACCOUNT,
-            warehouse=SNOWFLAKE_WAREHOUSE,
-            database=SNOWFLAKE_DATABASE,
-            schema=SNOWFLAKE_SCHEMA
-        )
+        conn = conectar_snowflake()
         with conn.cursor() as cursor:
 
-            # --- Ejecutar Consulta 1 (La Orden por Carritos) ---
-            cursor.execute(sql_query_orden, (flight_number,))
+            # --- Consulta 1 (La Orden por Carritos): ORDER_PLAN, o el join si el vuelo no está ahí ---
+            filtro_plan = "flight_number = %s" + (" AND departure_date = %s" if departure_date else "")
+            orden = leer_plan_orden(cursor, filtro_plan, tuple(parametros_orden)).get(flight_number)
+            if orden is None:
+                orden = consultar_orden_join(cursor, sql_query_orden, parametros_orden, departure_date)
+            json_final["total_carritos_en_vuelo"] = orden["total_carritos_en_vuelo"]
+            json_final["carritos"] = orden["carritos"]
 
-            primera_fila = True
-            for row in cursor:
-                # Desempaca todas las columnas
-                num_carritos_total, cart_id, cart_identifier, sku, cantidad, peso, tolerance = row
+    finally:
+        if conn:
+            conn.close()
 
-                if primera_fila:
-                    json_final["total_carritos_en_vuelo"] = num_carritos_total
-                    primera_fila = False
+    if not json_final["carritos"]:
+        return None
 
-                item_data = {
-                    "sku": sku,
-                    "cantidad_requerida": cantidad,
-                    "peso_unitario_g": float(peso),
-                    "peso_tolerancia": float(tolerance)
-                }
+    return json_final
 
-                if cart_id not in carritos_dict:
-                    carritos_dict[cart_id] = {
-                        "cart_id": cart_id,
-                        "cart_identifier": cart_identifier,
-                        "items_requeridos": []
-                    }
 
-                carritos_dict[cart_id]["items_requeridos"].append(item_data)
+def consultar_orden_join(cursor, sql_query_orden, parametros_orden, departure_date=None):
+    """Orden del vuelo con el join completo (órdenes que todavía no están en ORDER_PLAN)"""
+    orden = {"total_carritos_en_vuelo": 0, "carritos": []}
+    carritos_dict = {}
 
-            json_final["carritos"] = list(carritos_dict.values())
+    cursor.execute(sql_query_orden, tuple(parametros_orden))
 
-            # --- Ejecutar Consulta 2 (El Catálogo) ---
-            cursor.execute(sql_query_catalogo)
+    primera_fila = True
+    for row in cursor:
+        # Desempaca todas las columnas
+        num_carritos_total, cart_id, cart_identifier, sku, cantidad, peso, tolerance = row
 
-            for row in cursor:
-                json_final["catalogo_nombres"].append(row[0])
+        if primera_fila:
+            orden["total_carritos_en_vuelo"] = num_carritos_total
+            primera_fila = False
 
-    except Exception as e:
-        print(json.dumps({"error": f"Error al conectar o consultar Snowflake: {str(e)}"}), file=sys.stderr)
-        return None
-    finally:
-        if conn:
-            conn.close()
+        item_data = {
+            "sku": sku,
+            "cantidad_requerida": cantidad,
+            "peso_unitario_g": float(peso),
+            "peso_tolerancia": float(tolerance)
+        }
 
-    # Si la lista de carritos está vacía, significa que el vuelo no se encontró
-    if not json_final["carritos"]:
-        print(json.dumps({"error": f"Vuelo '{flight_number}' no encontrado o sin carritos asignados."}), file=sys.stderr)
-        return None
+        if cart_id not in carritos_dict:
+            carritos_dict[cart_id] = {
+                "cart_id": cart_id,
+                "cart_identifier": cart_identifier,
+                "items_requeridos": []
+            }
 
-    # Return the JSON directly instead of writing to file
-    # The Node.js server will handle the response
-    return json_final
+        carritos_dict[cart_id]["items_requeridos"].append(item_data)
+
+    filtro_cajones = "f.FLIGHT_NUMBER = %s" + (" AND f.DEPARTURE_DATE = %s" if departure_date else "")
+    cajones_por_carrito = leer_cajones(cursor, filtro_cajones, tuple(parametros_orden)) if carritos_dict else {}
+    orden["carritos"] = adjuntar_cajones(list(carritos_dict.values()), cajones_por_carrito)
+    return orden
 
 
 # --- MAIN EXECUTION ---
 if __name__ == "__main__":
+    modo_perfil = extraer_bandera(sys.argv)
     if len(sys.argv) < 2:
         print(json.dumps({"error": "Número de vuelo no proporcionado"}))
         sys.exit(1)
 
     flight_number = sys.argv[1]
-    result = generar_json_orden_por_carritos(flight_number)
+    departure_date = sys.argv[2] if len(sys.argv) > 2 else None
+    result = perfilar('crear_orden', generar_json_orden_por_carritos, flight_number, departure_date, modo=modo_perfil)
 
     if result:
         print(json.dumps(result, ensure_ascii=False))
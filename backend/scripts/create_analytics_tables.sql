@@ -43,6 +43,36 @@ CREATE TABLE IF NOT EXISTS EMPLOYEE_PERFORMANCE_METRICS (
     UNIQUE (EMPLOYEE_ID, METRIC_DATE)
 );
 
+-- Table: ROLLUP_WATERMARKS
+-- High-water marks for incremental jobs (rollup_metricas_empleados.py)
+CREATE TABLE IF NOT EXISTS ROLLUP_WATERMARKS (
+    JOB_NAME VARCHAR(100) PRIMARY KEY,
+    LAST_SESSION_UPDATED_AT TIMESTAMP_NTZ,
+    LAST_ERROR_ID INTEGER,
+    UPDATED_AT TIMESTAMP_NTZ DEFAULT CURRENT_TIMESTAMP()
+);
+
+-- Table: ROLLUP_SESSION_KEYS
+-- (EMPLOYEE_ID, METRIC_DATE) each session was last rolled up under, so a session
+-- that moves to another employee/day or disappears also recomputes its old key
+CREATE TABLE IF NOT EXISTS ROLLUP_SESSION_KEYS (
+    SESSION_ID VARCHAR(50) PRIMARY KEY,
+    EMPLOYEE_ID VARCHAR(50) NOT NULL,
+    METRIC_DATE DATE NOT NULL,
+    UPDATED_AT TIMESTAMP_NTZ DEFAULT CURRENT_TIMESTAMP()
+);
+
+-- Table: ERROR_TYPE_DAILY_METRICS
+-- Aggregated daily error counts per error type (rollup_metricas_empleados.py)
+CREATE TABLE IF NOT EXISTS ERROR_TYPE_DAILY_METRICS (
+    METRIC_DATE DATE NOT NULL,
+    ERROR_TYPE VARCHAR(50) NOT NULL,
+    ERROR_COUNT INTEGER DEFAULT 0,
+    CRITICAL_COUNT INTEGER DEFAULT 0,
+    UPDATED_AT TIMESTAMP_NTZ DEFAULT CURRENT_TIMESTAMP(),
+    UNIQUE (METRIC_DATE, ERROR_TYPE)
+);
+
 -- Table: ERROR_LOG
 -- Detailed log of all errors detected during inventory validation
 CREATE TABLE IF NOT EXISTS ERROR_LOG (
@@ -147,10 +177,13 @@ CREATE INDEX IF NOT EXISTS idx_sessions_employee ON INVENTORY_SESSIONS(EMPLOYEE_
 CREATE INDEX IF NOT EXISTS idx_sessions_flight ON INVENTORY_SESSIONS(FLIGHT_NUMBER);
 CREATE INDEX IF NOT EXISTS idx_sessions_date ON INVENTORY_SESSIONS(START_TIME);
 CREATE INDEX IF NOT EXISTS idx_sessions_status ON INVENTORY_SESSIONS(STATUS);
+CREATE INDEX IF NOT EXISTS idx_sessions_updated ON INVENTORY_SESSIONS(UPDATED_AT);
 
 CREATE INDEX IF NOT EXISTS idx_metrics_employee ON EMPLOYEE_PERFORMANCE_METRICS(EMPLOYEE_ID);
 CREATE INDEX IF NOT EXISTS idx_metrics_date ON EMPLOYEE_PERFORMANCE_METRICS(METRIC_DATE);
 
+CREATE INDEX IF NOT EXISTS idx_error_types_date ON ERROR_TYPE_DAILY_METRICS(METRIC_DATE);
+
 CREATE INDEX IF NOT EXISTS idx_errors_employee ON ERROR_LOG(EMPLOYEE_ID);
 CREATE INDEX IF NOT EXISTS idx_errors_type ON ERROR_LOG(ERROR_TYPE);
 CREATE INDEX IF NOT EXISTS idx_errors_date ON ERROR_LOG(CREATED_AT);
@@ -179,50 +212,51 @@ INSERT INTO PERFORMANCE_BENCHMARKS (METRIC_NAME, TARGET_VALUE, EXCELLENT_THRESHO
 -- VIEWS FOR DASHBOARD
 -- =====================================================
 
+-- The views read the daily rollups (rollup_metricas_empleados.py), not the raw
+-- INVENTORY_SESSIONS / ERROR_LOG rows; they are as fresh as the last rollup run.
+
 -- View: Employee Performance Summary (Last 7 Days)
 CREATE OR REPLACE VIEW VW_EMPLOYEE_PERFORMANCE_7D AS
 SELECT
-    e.EMPLOYEE_ID,
+    m.EMPLOYEE_ID,
     u.USERNAME,
     u.FULL_NAME,
-    COUNT(DISTINCT s.SESSION_ID) AS TOTAL_SESSIONS,
-    SUM(s.ITEMS_SCANNED) AS TOTAL_ITEMS,
-    SUM(s.ERRORS_DETECTED) AS TOTAL_ERRORS,
-    AVG(s.DURATION_SECONDS) AS AVG_SESSION_DURATION,
-    ROUND(SUM(s.ERRORS_DETECTED) * 100.0 / NULLIF(SUM(s.ITEMS_SCANNED), 0), 2) AS ERROR_RATE,
-    ROUND(SUM(s.ITEMS_SCANNED) / NULLIF(SUM(s.DURATION_SECONDS) / 3600.0, 0), 2) AS ITEMS_PER_HOUR,
-    ROUND(100 - (SUM(s.ERRORS_DETECTED) * 100.0 / NULLIF(SUM(s.ITEMS_SCANNED), 0)), 2) AS ACCURACY_SCORE
-FROM USERS u
-LEFT JOIN INVENTORY_SESSIONS s ON u.USER_ID = e.EMPLOYEE_ID
-WHERE s.START_TIME >= DATEADD(DAY, -7, CURRENT_DATE())
-    AND s.STATUS = 'COMPLETED'
-GROUP BY e.EMPLOYEE_ID, u.USERNAME, u.FULL_NAME;
+    SUM(m.TOTAL_SESSIONS) AS TOTAL_SESSIONS,
+    SUM(m.TOTAL_ITEMS_PROCESSED) AS TOTAL_ITEMS,
+    SUM(m.TOTAL_ERRORS) AS TOTAL_ERRORS,
+    ROUND(SUM(m.TOTAL_DURATION_SECONDS) / NULLIF(SUM(m.TOTAL_SESSIONS), 0), 2) AS AVG_SESSION_DURATION,
+    ROUND(SUM(m.TOTAL_ERRORS) * 100.0 / NULLIF(SUM(m.TOTAL_ITEMS_PROCESSED), 0), 2) AS ERROR_RATE,
+    ROUND(SUM(m.TOTAL_ITEMS_PROCESSED) / NULLIF(SUM(m.TOTAL_DURATION_SECONDS) / 3600.0, 0), 2) AS ITEMS_PER_HOUR,
+    ROUND(100 - (SUM(m.TOTAL_ERRORS) * 100.0 / NULLIF(SUM(m.TOTAL_ITEMS_PROCESSED), 0)), 2) AS ACCURACY_SCORE
+FROM EMPLOYEE_PERFORMANCE_METRICS m
+LEFT JOIN USERS u ON u.USER_ID = m.EMPLOYEE_ID
+WHERE m.METRIC_DATE >= DATEADD(DAY, -7, CURRENT_DATE())
+GROUP BY m.EMPLOYEE_ID, u.USERNAME, u.FULL_NAME;
 
 -- View: Daily Performance Trends
 CREATE OR REPLACE VIEW VW_DAILY_PERFORMANCE_TRENDS AS
 SELECT
-    DATE(START_TIME) AS METRIC_DATE,
-    COUNT(DISTINCT SESSION_ID) AS TOTAL_SESSIONS,
+    METRIC_DATE,
+    SUM(TOTAL_SESSIONS) AS TOTAL_SESSIONS,
     COUNT(DISTINCT EMPLOYEE_ID) AS ACTIVE_EMPLOYEES,
-    SUM(ITEMS_SCANNED) AS TOTAL_ITEMS,
-    SUM(ERRORS_DETECTED) AS TOTAL_ERRORS,
-    ROUND(SUM(ERRORS_DETECTED) * 100.0 / NULLIF(SUM(ITEMS_SCANNED), 0), 2) AS ERROR_RATE,
-    ROUND(AVG(DURATION_SECONDS / 60.0), 2) AS AVG_SESSION_MINUTES
-FROM INVENTORY_SESSIONS
-WHERE STATUS = 'COMPLETED'
-    AND START_TIME >= DATEADD(DAY, -30, CURRENT_DATE())
-GROUP BY DATE(START_TIME)
+    SUM(TOTAL_ITEMS_PROCESSED) AS TOTAL_ITEMS,
+    SUM(TOTAL_ERRORS) AS TOTAL_ERRORS,
+    ROUND(SUM(TOTAL_ERRORS) * 100.0 / NULLIF(SUM(TOTAL_ITEMS_PROCESSED), 0), 2) AS ERROR_RATE,
+    ROUND(SUM(TOTAL_DURATION_SECONDS) / 60.0 / NULLIF(SUM(TOTAL_SESSIONS), 0), 2) AS AVG_SESSION_MINUTES
+FROM EMPLOYEE_PERFORMANCE_METRICS
+WHERE METRIC_DATE >= DATEADD(DAY, -30, CURRENT_DATE())
+GROUP BY METRIC_DATE
 ORDER BY METRIC_DATE DESC;
 
 -- View: Error Type Distribution
 CREATE OR REPLACE VIEW VW_ERROR_TYPE_DISTRIBUTION AS
 SELECT
     ERROR_TYPE,
-    COUNT(*) AS ERROR_COUNT,
-    ROUND(COUNT(*) * 100.0 / SUM(COUNT(*)) OVER (), 2) AS PERCENTAGE,
-    AVG(CASE WHEN SEVERITY = 'CRITICAL' THEN 1 ELSE 0 END) * 100 AS CRITICAL_PERCENT
-FROM ERROR_LOG
-WHERE CREATED_AT >= DATEADD(DAY, -30, CURRENT_DATE())
+    SUM(ERROR_COUNT) AS ERROR_COUNT,
+    ROUND(SUM(ERROR_COUNT) * 100.0 / SUM(SUM(ERROR_COUNT)) OVER (), 2) AS PERCENTAGE,
+    SUM(CRITICAL_COUNT) * 100.0 / NULLIF(SUM(ERROR_COUNT), 0) AS CRITICAL_PERCENT
+FROM ERROR_TYPE_DAILY_METRICS
+WHERE METRIC_DATE >= DATEADD(DAY, -30, CURRENT_DATE())
 GROUP BY ERROR_TYPE
 ORDER BY ERROR_COUNT DESC;
 
@@ -271,6 +305,9 @@ $$;
 
 COMMENT ON TABLE INVENTORY_SESSIONS IS 'Tracks individual inventory validation sessions with performance metrics';
 COMMENT ON TABLE EMPLOYEE_PERFORMANCE_METRICS IS 'Daily aggregated performance metrics per employee';
+COMMENT ON TABLE ROLLUP_WATERMARKS IS 'Watermarks for incremental rollup jobs';
+COMMENT ON TABLE ROLLUP_SESSION_KEYS IS 'Employee/day key each session was last rolled up under';
+COMMENT ON TABLE ERROR_TYPE_DAILY_METRICS IS 'Daily aggregated error counts per error type';
 COMMENT ON TABLE ERROR_LOG IS 'Detailed log of all errors for analysis and training';
 COMMENT ON TABLE TRAINING_NEEDS IS 'Identified training requirements based on performance';
 COMMENT ON TABLE AI_CHAT_HISTORY IS 'AI assistant conversation history for context';
@@ -0,0 +1,218 @@
+"""
+Codificación binaria de longitud fija de la orden de un vuelo.
+
+Una orden (los carritos con sus items y cajones, en el formato de las
+entradas de cache) se escribe como un bloque de bytes que se puede leer en
+su lugar, sin parsear ni copiar el resto, desde un mmap o cualquier buffer:
+
+    cabecera   CABECERA
+    skus       n_skus      x SKU       (offset, largo) en textos; el id es la posición
+    carritos   n_carritos  x CARRITO   en el orden de la orden
+    índice     capacidad   x RANURA    tabla hash cart_id -> carrito (sondeo lineal)
+    items      n_items     x ITEM      contiguos por carrito
+    cajones    n_cajones   x CAJON     contiguos por carrito, agrupados por cajón
+    textos     utf-8: número de vuelo, SKUs e identificadores de carrito
+
+Todo es little-endian. Buscar un carrito es O(1) y decodificarlo solo toca
+sus propios renglones. Los pesos y tolerancias van como float64 para que el
+plan compilado (motor_tolerancia.py) salga idéntico al del JSON; los totales
+del carrito de ORDER_PLAN (plan_orden.py) viajan en su renglón.
+"""
+
+import struct
+
+# Totales del carrito que escribe ORDER_PLAN (plan_orden.py)
+CLAVES_TOTALES = ("peso_esperado_carrito_mg", "varianza_carrito_g2", "tolerancia_carrito_mg")
+
+MAGIA = b'GGPL'
+FORMATO = 2
+
+# magia, formato, largo del número de vuelo, expira (epoch, 0 = sin vencimiento),
+# n_skus, n_carritos, n_items, n_cajones, capacidad del índice, largo de textos
+CABECERA = struct.Struct('<4sHHdIIIIII')
+SKU = struct.Struct('<IH')
+# cart_id, identificador (offset, largo), primer item, n items, primer cajón, n cajones,
+# peso esperado (mg, SIN_TOTALES si no trae), varianza del contenido (g²), tolerancia (mg)
+CARRITO = struct.Struct('<qIHIHIHqdq')
+RANURA = struct.Struct('<i')
+# sku_id, cantidad, peso_unitario_g, peso_tolerancia
+ITEM = struct.Struct('<IIdd')
+# numero_cajon, sku_id, cantidad
+CAJON = struct.Struct('<iII')
+
+# Largo de identificador que marca cart_identifier = None
+SIN_TEXTO = 0xFFFF
+
+# Peso esperado que marca un carrito sin totales de ORDER_PLAN
+SIN_TOTALES = -1
+
+# Ranura libre de un índice
+RANURA_VACIA = -1
+
+
+def _ranura(cart_id, mascara):
+    return ((cart_id * 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF) >> 32 & mascara
+
+
+def capacidad_indice(n_entradas):
+    """Potencia de 2 con al menos el doble de ranuras que entradas"""
+    capacidad = 1
+    while capacidad < 2 * n_entradas:
+        capacidad *= 2
+    return capacidad
+
+
+def codificar_orden(flight_number, carritos, expira=0.0):
+    """Bytes de la orden; 'carritos' con cart_id entero, items_requeridos y, opcional, cajones"""
+    textos = bytearray(str(flight_number).encode('utf-8'))
+
+    def texto(valor):
+        if valor is None:
+            return 0, SIN_TEXTO
+        datos = str(valor).encode('utf-8')
+        if len(datos) >= SIN_TEXTO:
+            raise ValueError(f"Texto demasiado largo para la orden binaria: {str(valor)[:40]}...")
+        offset = len(textos)
+        textos.extend(datos)
+        return offset, len(datos)
+
+    ids_sku = {}
+
+    def id_sku(sku):
+        if sku not in ids_sku:
+            ids_sku[sku] = len(ids_sku)
+        return ids_sku[sku]
+
+    filas_carritos, filas_items, filas_cajones = [], [], []
+    for carrito in carritos:
+        cart_id = carrito["cart_id"]
+        if not isinstance(cart_id, int):
+            raise ValueError(f"cart_id no entero: {cart_id!r}")
+        primer_item, primer_cajon = len(filas_items), len(filas_cajones)
+        for item in carrito["items_requeridos"]:
+            filas_items.append((id_sku(item["sku"]), item["cantidad_requerida"],
+                                float(item["peso_unitario_g"]), float(item["peso_tolerancia"])))
+        for cajon in carrito.get("cajones", []):
+            for item in cajon["items_requeridos"]:
+                filas_cajones.append((cajon["numero_cajon"], id_sku(item["sku"]), item["cantidad_requerida"]))
+        if all(carrito.get(clave) is not None for clave in CLAVES_TOTALES):
+            totales = (int(carrito["peso_esperado_carrito_mg"]), float(carrito["varianza_carrito_g2"]),
+                       int(carrito["tolerancia_carrito_mg"]))
+        else:
+            totales = (SIN_TOTALES, 0.0, 0)
+        filas_carritos.append((cart_id, *texto(carrito.get("cart_identifier")),
+                               primer_item, len(filas_items) - primer_item,
+                               primer_cajon, len(filas_cajones) - primer_cajon, *totales))
+
+    filas_skus = [texto(sku) for sku in ids_sku]
+
+    capacidad = capacidad_indice(len(filas_carritos))
+    indice = [RANURA_VACIA] * capacidad
+    for i, (cart_id, *_) in enumerate(filas_carritos):
+        ranura = _ranura(cart_id, capacidad - 1)
+        while indice[ranura] != RANURA_VACIA:
+            if filas_carritos[indice[ranura]][0] == cart_id:
+                raise ValueError(f"cart_id repetido en la orden: {cart_id}")
+            ranura = (ranura + 1) & (capacidad - 1)
+        indice[ranura] = i
+
+    partes = [CABECERA.pack(MAGIA, FORMATO, len(str(flight_number).encode('utf-8')), expira,
+                            len(filas_skus), len(filas_carritos), len(filas_items), len(filas_cajones),
+                            capacidad, len(textos))]
+    partes += [SKU.pack(*fila) for fila in filas_skus]
+    partes += [CARRITO.pack(*fila) for fila in filas_carritos]
+    partes += [RANURA.pack(ranura) for ranura in indice]
+    partes += [ITEM.pack(*fila) for fila in filas_items]
+    partes += [CAJON.pack(*fila) for fila in filas_cajones]
+    partes.append(bytes(textos))
+    return b''.join(partes)
+
+
+class PlanesBinarios:
+    """Lectura en su lugar de una orden codificada (bytes, mmap o memoryview)"""
+
+    def __init__(self, buffer, inicio=0):
+        self._buf = memoryview(buffer)
+        (magia, formato, largo_vuelo, self.expira, n_skus, self.n_carritos, n_items, n_cajones,
+         self._capacidad, largo_textos) = CABECERA.unpack_from(self._buf, inicio)
+        if magia != MAGIA or formato != FORMATO:
+            raise ValueError(f"No es una orden binaria compatible (magia {magia!r}, formato {formato})")
+
+        self._o_skus = inicio + CABECERA.size
+        self._o_carritos = self._o_skus + n_skus * SKU.size
+        self._o_indice = self._o_carritos + self.n_carritos * CARRITO.size
+        self._o_items = self._o_indice + self._capacidad * RANURA.size
+        self._o_cajones = self._o_items + n_items * ITEM.size
+        self._o_textos = self._o_cajones + n_cajones * CAJON.size
+        self.tamano = self._o_textos + largo_textos - inicio
+        self.flight_number = self._texto(0, largo_vuelo)
+        self._skus = {}
+
+    def _texto(self, offset, largo):
+        if largo == SIN_TEXTO:
+            return None
+        inicio = self._o_textos + offset
+        return str(self._buf[inicio:inicio + largo], 'utf-8')
+
+    def _sku(self, id_sku):
+        sku = self._skus.get(id_sku)
+        if sku is None:
+            sku = self._skus[id_sku] = self._texto(*SKU.unpack_from(self._buf, self._o_skus + id_sku * SKU.size))
+        return sku
+
+    def _fila_carrito(self, i):
+        return CARRITO.unpack_from(self._buf, self._o_carritos + i * CARRITO.size)
+
+    def _posicion(self, cart_id):
+        if not isinstance(cart_id, int):
+            return None
+        mascara = self._capacidad - 1
+        ranura = _ranura(cart_id, mascara)
+        while True:
+            (i,) = RANURA.unpack_from(self._buf, self._o_indice + ranura * RANURA.size)
+            if i == RANURA_VACIA:
+                return None
+            if self._fila_carrito(i)[0] == cart_id:
+                return i
+            ranura = (ranura + 1) & mascara
+
+    def _decodificar(self, i):
+        (cart_id, ident_offset, ident_largo, primer_item, n_items, primer_cajon, n_cajones,
+         peso_mg, varianza, tolerancia_mg) = self._fila_carrito(i)
+        items = []
+        for j in range(primer_item, primer_item + n_items):
+            id_sku, cantidad, peso, tolerancia = ITEM.unpack_from(self._buf, self._o_items + j * ITEM.size)
+            items.append({"sku": self._sku(id_sku), "cantidad_requerida": cantidad,
+                          "peso_unitario_g": peso, "peso_tolerancia": tolerancia})
+        carrito = {"cart_id": cart_id, "cart_identifier": self._texto(ident_offset, ident_largo),
+                   "items_requeridos": items}
+        if peso_mg != SIN_TOTALES:
+            carrito.update(peso_esperado_carrito_mg=peso_mg, varianza_carrito_g2=varianza,
+                           tolerancia_carrito_mg=tolerancia_mg)
+
+        cajones = []
+        for j in range(primer_cajon, primer_cajon + n_cajones):
+            numero, id_sku, cantidad = CAJON.unpack_from(self._buf, self._o_cajones + j * CAJON.size)
+            if not cajones or cajones[-1]["numero_cajon"] != numero:
+                cajones.append({"numero_cajon": numero, "items_requeridos": []})
+            cajones[-1]["items_requeridos"].append({"sku": self._sku(id_sku), "cantidad_requerida": cantidad})
+        if cajones:
+            carrito["cajones"] = cajones
+        return carrito
+
+    def cart_ids(self):
+        return [self._fila_carrito(i)[0] for i in range(self.n_carritos)]
+
+    def carrito(self, cart_id):
+        """El carrito en el formato de las entradas de cache, o None"""
+        i = self._posicion(cart_id)
+        return None if i is None else self._decodificar(i)
+
+    def orden(self, cart_ids=None):
+        """{"flight_number", "carritos"}: todos, o solo los de 'cart_ids' que estén en la orden"""
+        if cart_ids is None:
+            carritos = [self._decodificar(i) for i in range(self.n_carritos)]
+        else:
+            posiciones = sorted(i for i in map(self._posicion, set(cart_ids)) if i is not None)
+            carritos = [self._decodificar(i) for i in posiciones]
+        return {"flight_number": self.flight_number, "carritos": carritos}
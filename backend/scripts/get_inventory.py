@@ -1,12 +1,9 @@
 #!/usr/bin/env python3
-import os
 import json
 import sys
-import snowflake.connector
-from dotenv import load_dotenv
 
-# Load environment variables from a .env file
-load_dotenv()
+from conexion import conectar_snowflake
+from plan_orden import leer_plan_orden
 
 def get_snowflake_connection():
     """
@@ -14,15 +11,7 @@ def get_snowflake_connection():
     Retorna la conexión o None si falla.
     """
     try:
-        conn = snowflake.connector.connect(
-            user=os.getenv('SNOWFLAKE_USER'),
-            password=os.getenv('SNOWFLAKE_PASSWORD'),
-            account=os.getenv('SNOWFLAKE_ACCOUNT'),
-            warehouse=os.getenv('SNOWFLAKE_WAREHOUSE'),
-            database=os.getenv('SNOWFLAKE_DATABASE'),
-            schema=os.getenv('SNOWFLAKE_SCHEMA'),
-            connect_timeout=30 # Timeout for connection
-        )
+        conn = conectar_snowflake(connect_timeout=30) # Timeout for connection
         print("✅ Conexión a Snowflake exitosa.")
         return conn
     except Exception as e:
@@ -33,6 +22,7 @@ def get_inventory_for_flight(flight_number):
     """
     Consulta el inventario real para un vuelo específico desde Snowflake.
     Retorna el inventario en el formato JSON requerido ("orden combinada").
+    Los nombres del catálogo se piden aparte (catalogo_productos.py).
     """
     print(f"➡️ Solicitando orden para vuelo: {flight_number}")
 
@@ -60,15 +50,11 @@ def get_inventory_for_flight(flight_number):
         c.CART_ID;
     """
 
-    # Consulta 2: Obtiene todos los nombres del catálogo
-    sql_query_catalogo = "SELECT product_name FROM PRODUCTS ORDER BY product_name;"
-
     # Estructura base del JSON de salida
     json_final = {
         "flight_number": flight_number,
         "total_carritos_en_vuelo": 0,
-        "carritos": [],
-        "catalogo_nombres": []
+        "carritos": []
     }
 
     carritos_dict = {}
@@ -83,49 +69,49 @@ def get_inventory_for_flight(flight_number):
         with conn.cursor() as cursor:
 
             # --- Ejecutar Consulta 1 (La Orden por Carritos) ---
-            print(f"   Ejecutando consulta de orden para {flight_number}...")
-            cursor.execute(sql_query_orden, (flight_number,))
-
-            primera_fila = True
-            rows_orden = cursor.fetchall() # Obtener todas las filas
-            print(f"   Consulta de orden devolvió {len(rows_orden)} filas.")
-
-            # Si no hay filas, el vuelo no existe o no tiene carritos asignados
-            if not rows_orden:
-                 print(f"   ⚠️ Error: No se encontraron carritos para el vuelo '{flight_number}'.")
-                 # Return specific error JSON
-                 return {"error": f"Vuelo '{flight_number}' no encontrado o sin carritos asignados. Verifica que la orden exista."}
-
-            # Procesar las filas de la orden
-            for row in rows_orden:
-                num_carritos_total, cart_id, cart_identifier, sku, cantidad, peso, tolerance = row
-
-                if primera_fila:
-                    json_final["total_carritos_en_vuelo"] = num_carritos_total
-                    primera_fila = False
-
-                item_data = {
-                    "sku": sku,
-                    "cantidad_requerida": cantidad,
-                    "peso_unitario_g": float(peso) if peso is not None else 0.0,
-                    "peso_tolerancia": float(tolerance) if tolerance is not None else 0.0
-                }
-                if cart_id not in carritos_dict:
-                    carritos_dict[cart_id] = {
-                        "cart_id": cart_id,
-                        "cart_identifier": cart_identifier,
-                        "items_requeridos": []
+            # Primero el plan desnormalizado (plan_orden.py); el join es para órdenes anteriores a la tabla
+            orden = leer_plan_orden(cursor, "flight_number = %s", (flight_number,)).get(flight_number)
+            if orden is not None:
+                print(f"   Orden leída de ORDER_PLAN ({len(orden['carritos'])} carritos).")
+                json_final["total_carritos_en_vuelo"] = orden["total_carritos_en_vuelo"]
+                json_final["carritos"] = orden["carritos"]
+            else:
+                print(f"   Ejecutando consulta de orden para {flight_number}...")
+                cursor.execute(sql_query_orden, (flight_number,))
+
+                primera_fila = True
+                rows_orden = cursor.fetchall() # Obtener todas las filas
+                print(f"   Consulta de orden devolvió {len(rows_orden)} filas.")
+
+                # Si no hay filas, el vuelo no existe o no tiene carritos asignados
+                if not rows_orden:
+                     print(f"   ⚠️ Error: No se encontraron carritos para el vuelo '{flight_number}'.")
+                     # Return specific error JSON
+                     return {"error": f"Vuelo '{flight_number}' no encontrado o sin carritos asignados. Verifica que la orden exista."}
+
+                # Procesar las filas de la orden
+                for row in rows_orden:
+                    num_carritos_total, cart_id, cart_identifier, sku, cantidad, peso, tolerance = row
+
+                    if primera_fila:
+                        json_final["total_carritos_en_vuelo"] = num_carritos_total
+                        primera_fila = False
+
+                    item_data = {
+                        "sku": sku,
+                        "cantidad_requerida": cantidad,
+                        "peso_unitario_g": float(peso) if peso is not None else 0.0,
+                        "peso_tolerancia": float(tolerance) if tolerance is not None else 0.0
                     }
-                carritos_dict[cart_id]["items_requeridos"].append(item_data)
-
-            json_final["carritos"] = list(carritos_dict.values())
-
-            # --- Ejecutar Consulta 2 (El Catálogo) ---
-            print("   Ejecutando consulta de catálogo...")
-            cursor.execute(sql_query_catalogo)
-            rows_catalogo = cursor.fetchall()
-            print(f"   Consulta de catálogo devolvió {len(rows_catalogo)} nombres.")
-            json_final["catalogo_nombres"] = [row[0] for row in rows_catalogo]
+                    if cart_id not in carritos_dict:
+                        carritos_dict[cart_id] = {
+                            "cart_id": cart_id,
+                            "cart_identifier": cart_identifier,
+                            "items_requeridos": []
+                        }
+                    carritos_dict[cart_id]["items_requeridos"].append(item_data)
+
+                json_final["carritos"] = list(carritos_dict.values())
 
         print(f"✅ Orden para '{flight_number}' generada con éxito.")
         return json_final
@@ -2,30 +2,38 @@
 """
 Initialize Snowflake Database with Authentication Tables
 This script creates the necessary tables for the authentication system and inserts demo users.
+
+Bulk provisioning (station onboarding):
+    python3 init_database.py --bulk users.csv [--workers N] [--batch-size N] [--rehash]
+
+The input is CSV (header row) or NDJSON (.ndjson/.jsonl, one object per line) with
+username, password, role and optional full_name, email. Passwords are hashed in a
+process pool and users are upserted with batched MERGE statements keyed on USERNAME,
+so re-running the same file is safe. Existing users keep their password hash unless
+--rehash is given.
 """
 
-import sys
+import csv
+import json
 import os
-from dotenv import load_dotenv
-import snowflake.connector
-import bcrypt
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+from conexion import conectar_snowflake
 
-# Load environment variables
-load_dotenv()
+# Roles understood by the backend (models/User.js, models/Metrics.js)
+VALID_ROLES = ('supervisor', 'employee')
+
+# Rows per MERGE statement
+BULK_BATCH_SIZE = 500
 
 def get_connection():
     """Create and return a Snowflake connection"""
-    return snowflake.connector.connect(
-        user=os.getenv('SNOWFLAKE_USER'),
-        password=os.getenv('SNOWFLAKE_PASSWORD'),
-        account=os.getenv('SNOWFLAKE_ACCOUNT'),
-        warehouse=os.getenv('SNOWFLAKE_WAREHOUSE'),
-        database=os.getenv('SNOWFLAKE_DATABASE'),
-        schema=os.getenv('SNOWFLAKE_SCHEMA')
-    )
+    return conectar_snowflake()
 
 def hash_password(password):
     """Hash a password using bcrypt"""
+    import bcrypt
     salt = bcrypt.gensalt()
     hashed = bcrypt.hashpw(password.encode('utf-8'), salt)
     return hashed.decode('utf-8')
@@ -150,6 +158,128 @@ def insert_demo_users(cursor):
             else:
                 print(f"  ✗ Error creating user {user['username']}: {e}")
 
+def read_users_file(path):
+    """
+    Read users from a CSV or NDJSON file.
+    Returns a list of dicts; a username repeated in the file keeps its last row.
+    Raises ValueError with the offending line on invalid rows.
+    """
+    if path.lower().endswith(('.ndjson', '.jsonl')):
+        with open(path, 'r', encoding='utf-8') as f:
+            rows = [(i, json.loads(line)) for i, line in enumerate(f, start=1) if line.strip()]
+    else:
+        with open(path, 'r', encoding='utf-8', newline='') as f:
+            rows = list(enumerate(csv.DictReader(f), start=2))
+
+    users = {}
+    for line_number, row in rows:
+        username = (row.get('username') or '').strip()
+        password = row.get('password') or ''
+        role = (row.get('role') or '').strip().lower()
+        if not username or not password:
+            raise ValueError(f"Line {line_number}: username and password are required")
+        if role not in VALID_ROLES:
+            raise ValueError(f"Line {line_number}: invalid role '{role}' (expected one of {', '.join(VALID_ROLES)})")
+
+        users[username] = {
+            'username': username,
+            'password': password,
+            'role': role,
+            'full_name': (row.get('full_name') or '').strip() or None,
+            'email': (row.get('email') or '').strip() or None
+        }
+    return list(users.values())
+
+def hash_passwords(passwords, workers=None):
+    """Hash passwords across a process pool, preserving order"""
+    if not passwords:
+        return []
+    workers = workers or os.cpu_count() or 1
+    chunksize = max(1, len(passwords) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(hash_password, passwords, chunksize=chunksize))
+
+def existing_usernames(cursor, usernames, batch_size=BULK_BATCH_SIZE):
+    """Subset of 'usernames' already present in USERS"""
+    existing = set()
+    for i in range(0, len(usernames), batch_size):
+        batch = usernames[i:i + batch_size]
+        placeholders = ", ".join(["%s"] * len(batch))
+        cursor.execute(f"SELECT USERNAME FROM USERS WHERE USERNAME IN ({placeholders})", tuple(batch))
+        existing.update(row[0] for row in cursor.fetchall())
+    return existing
+
+def merge_users_batch(cursor, rows):
+    """
+    Upsert a batch of (username, password_hash, role, full_name, email) rows.
+    A NULL password_hash leaves the stored hash untouched.
+    """
+    values = ", ".join(["(%s, %s, %s, %s, %s)"] * len(rows))
+    params = tuple(value for row in rows for value in row)
+    cursor.execute(f"""
+        MERGE INTO USERS t
+        USING (
+            SELECT
+                column1::VARCHAR AS USERNAME,
+                column2::VARCHAR AS PASSWORD_HASH,
+                column3::VARCHAR AS ROLE,
+                column4::VARCHAR AS FULL_NAME,
+                column5::VARCHAR AS EMAIL
+            FROM VALUES {values}
+        ) s
+        ON t.USERNAME = s.USERNAME
+        WHEN MATCHED THEN UPDATE SET
+            PASSWORD_HASH = COALESCE(s.PASSWORD_HASH, t.PASSWORD_HASH),
+            ROLE = s.ROLE,
+            FULL_NAME = s.FULL_NAME,
+            EMAIL = s.EMAIL,
+            UPDATED_AT = CURRENT_TIMESTAMP()
+        WHEN NOT MATCHED AND s.PASSWORD_HASH IS NOT NULL THEN INSERT
+            (USERNAME, PASSWORD_HASH, ROLE, FULL_NAME, EMAIL)
+            VALUES (s.USERNAME, s.PASSWORD_HASH, s.ROLE, s.FULL_NAME, s.EMAIL)
+    """, params)
+
+def provision_users(conn, users, workers=None, batch_size=BULK_BATCH_SIZE, rehash=False):
+    """
+    Hash and upsert 'users' in a single transaction.
+    Only new users are hashed unless 'rehash' is True.
+    Returns a summary dict.
+    """
+    cursor = conn.cursor()
+    try:
+        usernames = [user['username'] for user in users]
+        existing = existing_usernames(cursor, usernames, batch_size)
+
+        to_hash = [user for user in users if rehash or user['username'] not in existing]
+        print(f"  Hashing {len(to_hash)} passwords ({len(users) - len(to_hash)} existing users keep theirs)...")
+        hashes = dict(zip(
+            (user['username'] for user in to_hash),
+            hash_passwords([user['password'] for user in to_hash], workers)
+        ))
+
+        rows = [
+            (user['username'], hashes.get(user['username']), user['role'], user['full_name'], user['email'])
+            for user in users
+        ]
+
+        cursor.execute("BEGIN")
+        for i in range(0, len(rows), batch_size):
+            merge_users_batch(cursor, rows[i:i + batch_size])
+            print(f"  ✓ Merged users {i + 1}-{min(i + batch_size, len(rows))} of {len(rows)}")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+    return {
+        'users': len(users),
+        'created': len(users) - len(existing),
+        'updated': len(existing),
+        'hashed': len(to_hash)
+    }
+
 def insert_demo_metrics_data(cursor):
     """Insert demo metrics data for testing"""
     print("\nInserting demo metrics data...")
@@ -234,5 +364,50 @@ def main():
             conn.close()
             print("🔌 Disconnected from Snowflake")
 
+def main_bulk(path, workers=None, batch_size=BULK_BATCH_SIZE, rehash=False):
+    """Bulk-provision users from a CSV/NDJSON file"""
+    try:
+        users = read_users_file(path)
+    except (OSError, ValueError) as e:
+        print(f"❌ Error reading {path}: {e}")
+        sys.exit(1)
+
+    print(f"📥 {len(users)} users read from {path}")
+    conn = None
+    try:
+        conn = get_connection()
+        create_users_table(conn.cursor())
+        summary = provision_users(conn, users, workers, batch_size, rehash)
+        print(f"✅ Bulk provisioning completed: {json.dumps(summary)}")
+    except Exception as e:
+        print(f"\n❌ Error provisioning users: {e}")
+        sys.exit(1)
+    finally:
+        if conn:
+            conn.close()
+
+def _int_argument(args, name, default):
+    if name not in args:
+        return default
+    i = args.index(name)
+    try:
+        return int(args[i + 1])
+    except (IndexError, ValueError):
+        print(f"❌ {name} requires an integer")
+        sys.exit(1)
+
 if __name__ == "__main__":
-    main()
+    args = sys.argv[1:]
+    if "--bulk" in args:
+        i = args.index("--bulk")
+        if i + 1 >= len(args):
+            print("Usage: python3 init_database.py --bulk users.csv [--workers N] [--batch-size N] [--rehash]")
+            sys.exit(1)
+        main_bulk(
+            args[i + 1],
+            workers=_int_argument(args, "--workers", None),
+            batch_size=_int_argument(args, "--batch-size", BULK_BATCH_SIZE),
+            rehash="--rehash" in args
+        )
+    else:
+        main()
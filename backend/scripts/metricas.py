@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+"""
+Métricas de los scripts de Python: contadores e histogramas de latencia.
+
+server.js lanza un proceso por petición, así que cada proceso acumula sus
+métricas en memoria y las suma (bajo flock, como cargador_ordenes.py) a un
+archivo compartido METRICAS_ARCHIVO al terminar, o cada METRICAS_INTERVALO_S
+en procesos largos. Los workers del pool de servicio_validacion.py vuelcan al
+terminar cada tarea y al salir (iniciar_worker). Los totales se
+exponen en formato de texto de Prometheus:
+
+    python3 metricas.py                          imprime los totales
+    python3 metricas.py --servir [--puerto N]    GET /metrics en 127.0.0.1
+    python3 metricas.py --volcar ruta [--cada S] reescribe un .prom cada S s
+                                                 (textfile collector)
+
+servicio_validacion.py además responde GET /metricas con lo mismo.
+METRICAS=0 desactiva el registro.
+"""
+
+import atexit
+import fcntl
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+METRICAS_ACTIVAS = os.getenv('METRICAS', '1') != '0'
+
+METRICAS_ARCHIVO = os.getenv(
+    'METRICAS_ARCHIVO',
+    os.path.join(tempfile.gettempdir(), 'gategroup_metricas.json')
+)
+
+# Cada cuánto un proceso largo suma lo acumulado al archivo
+METRICAS_INTERVALO_S = float(os.getenv('METRICAS_INTERVALO_S', '10'))
+
+METRICAS_PUERTO = int(os.getenv('METRICAS_PUERTO', '9464'))
+
+# Límites (segundos) de los histogramas de latencia
+BUCKETS_S = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+PREFIJO = 'gategroup_'
+
+# nombre: (tipo, ayuda)
+DESCRIPCIONES = {
+    'ordenes_cargas_total': ('counter', "Órdenes pedidas a la capa de cache, por origen (cache, coalescida, warehouse, snapshot)"),
+    'ordenes_carga_segundos': ('histogram', "Latencia de obtener una orden, por origen"),
+    'ordenes_consultas_total': ('counter', "Consultas de orden al warehouse, por resultado (encontrada, no_encontrada, error)"),
+    'validaciones_total': ('counter', "Ejecuciones de validación de un vuelo"),
+    'validacion_segundos': ('histogram', "Latencia de validar un vuelo ya cargado"),
+    'validaciones_carritos_total': ('counter', "Carritos validados, por status del reporte"),
+    'cajas_sin_peso_total': ('counter', "Cajas escaneadas sin 'peso_medido_g'"),
+    'solver_invocaciones_total': ('counter', "Llamadas a un solver, por resultado"),
+    'solver_nodos_total': ('counter', "Nodos (combinaciones) evaluados por un solver"),
+    'solver_timeouts_total': ('counter', "Búsquedas cortadas por el límite de nodos"),
+    'solver_segundos': ('histogram', "Latencia de una llamada a un solver"),
+    'warehouse_conexiones_total': ('counter', "Conexiones abiertas a Snowflake, por resultado"),
+    'warehouse_conexion_segundos': ('histogram', "Latencia de abrir una conexión a Snowflake"),
+    'warehouse_viajes_total': ('counter', "Viajes al warehouse (execute/executemany), por operación y resultado"),
+    'warehouse_viaje_segundos': ('histogram', "Latencia de un viaje al warehouse, por operación"),
+    'warehouse_reintentos_total': ('counter', "Reintentos de una llamada al warehouse tras un fallo"),
+    'warehouse_circuito_total': ('counter', "Eventos del circuit breaker del warehouse (abierto, cerrado, rechazada)"),
+    'ordenes_respaldo_total': ('counter', "Cargas fallidas atendidas con el respaldo de la orden, por resultado"),
+}
+
+_candado = threading.Lock()
+_pendientes = {"contadores": {}, "histogramas": {}}
+_ultimo_volcado = time.monotonic()
+
+
+def _reiniciar_en_hijo():
+    """Un proceso hijo (fork) no debe volver a sumar lo pendiente del padre"""
+    global _candado, _pendientes, _ultimo_volcado
+    _candado = threading.Lock()
+    _pendientes = {"contadores": {}, "histogramas": {}}
+    _ultimo_volcado = time.monotonic()
+
+
+os.register_at_fork(after_in_child=_reiniciar_en_hijo)
+
+
+def _escapar(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _etiquetas(etiquetas):
+    return ",".join(f'{k}="{_escapar(v)}"' for k, v in sorted(etiquetas.items()))
+
+
+def _histograma_vacio():
+    return {"buckets": [0] * len(BUCKETS_S), "suma": 0.0, "cuenta": 0}
+
+
+def _sumar_histograma(destino, origen):
+    destino["buckets"] = [a + b for a, b in zip(destino["buckets"], origen["buckets"])]
+    destino["suma"] += origen["suma"]
+    destino["cuenta"] += origen["cuenta"]
+
+
+def _quizas_volcar():
+    if time.monotonic() - _ultimo_volcado >= METRICAS_INTERVALO_S:
+        volcar()
+
+
+def incrementar(nombre, valor=1, **etiquetas):
+    """Suma 'valor' al contador 'nombre' con esas etiquetas"""
+    if not METRICAS_ACTIVAS:
+        return
+    with _candado:
+        serie = _pendientes["contadores"].setdefault(nombre, {})
+        clave = _etiquetas(etiquetas)
+        serie[clave] = serie.get(clave, 0) + valor
+    _quizas_volcar()
+
+
+def observar(nombre, segundos, **etiquetas):
+    """Registra una latencia en el histograma 'nombre'"""
+    if not METRICAS_ACTIVAS:
+        return
+    with _candado:
+        serie = _pendientes["histogramas"].setdefault(nombre, {})
+        histograma = serie.setdefault(_etiquetas(etiquetas), _histograma_vacio())
+        for i, limite in enumerate(BUCKETS_S):
+            if segundos <= limite:
+                histograma["buckets"][i] += 1
+                break
+        histograma["suma"] += segundos
+        histograma["cuenta"] += 1
+    _quizas_volcar()
+
+
+class cronometrar:
+    """
+    with cronometrar('solver_segundos', solver='discrepancias'): ...
+    Las etiquetas se pueden completar dentro del bloque (medicion.etiquetas[...] = ...).
+    """
+
+    def __init__(self, nombre, **etiquetas):
+        self.nombre = nombre
+        self.etiquetas = etiquetas
+
+    def __enter__(self):
+        self._inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, *excepcion):
+        observar(self.nombre, time.perf_counter() - self._inicio, **self.etiquetas)
+        return False
+
+
+def _leer_archivo():
+    try:
+        with open(METRICAS_ARCHIVO, 'r', encoding='utf-8') as f:
+            datos = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {"contadores": {}, "histogramas": {}}
+    datos.setdefault("contadores", {})
+    datos.setdefault("histogramas", {})
+    return datos
+
+
+def _combinar(total, pendientes):
+    for nombre, serie in pendientes["contadores"].items():
+        destino = total["contadores"].setdefault(nombre, {})
+        for clave, valor in serie.items():
+            destino[clave] = destino.get(clave, 0) + valor
+    for nombre, serie in pendientes["histogramas"].items():
+        destino = total["histogramas"].setdefault(nombre, {})
+        for clave, histograma in serie.items():
+            _sumar_histograma(destino.setdefault(clave, _histograma_vacio()), histograma)
+    return total
+
+
+def volcar():
+    """Suma lo pendiente de este proceso al archivo compartido y lo reinicia"""
+    global _pendientes, _ultimo_volcado
+    with _candado:
+        pendientes = _pendientes
+        _pendientes = {"contadores": {}, "histogramas": {}}
+        _ultimo_volcado = time.monotonic()
+    if not pendientes["contadores"] and not pendientes["histogramas"]:
+        return
+
+    try:
+        os.makedirs(os.path.dirname(METRICAS_ARCHIVO) or '.', exist_ok=True)
+        with open(METRICAS_ARCHIVO + '.lock', 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            total = _combinar(_leer_archivo(), pendientes)
+            fd, ruta_tmp = tempfile.mkstemp(dir=os.path.dirname(METRICAS_ARCHIVO) or '.', suffix='.tmp')
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(total, f, ensure_ascii=False)
+            os.replace(ruta_tmp, METRICAS_ARCHIVO)
+    except OSError as e:
+        print(f"Advertencia: no se pudieron guardar las métricas: {e}", file=sys.stderr)
+
+
+if METRICAS_ACTIVAS:
+    atexit.register(volcar)
+
+
+def iniciar_worker():
+    """
+    Inicializador de los pools de procesos (ProcessPoolExecutor). Sus workers
+    terminan con os._exit, sin pasar por atexit: un finalizador de
+    multiprocessing vuelca lo pendiente al salir.
+    """
+    if METRICAS_ACTIVAS:
+        from multiprocessing.util import Finalize
+        Finalize(None, volcar, exitpriority=10)
+
+
+def texto_prometheus():
+    """Totales del archivo más lo pendiente de este proceso, en formato de texto de Prometheus"""
+    with _candado:
+        pendientes = json.loads(json.dumps(_pendientes))
+    total = _combinar(_leer_archivo(), pendientes)
+
+    lineas = []
+    for nombre in sorted(set(total["contadores"]) | set(total["histogramas"])):
+        tipo, ayuda = DESCRIPCIONES.get(nombre, ('counter' if nombre in total["contadores"] else 'histogram', nombre))
+        completo = PREFIJO + nombre
+        lineas.append(f"# HELP {completo} {ayuda}")
+        lineas.append(f"# TYPE {completo} {tipo}")
+
+        for clave, valor in sorted(total["contadores"].get(nombre, {}).items()):
+            lineas.append(f"{completo}{{{clave}}} {valor}" if clave else f"{completo} {valor}")
+
+        for clave, histograma in sorted(total["histogramas"].get(nombre, {}).items()):
+            prefijo_etiquetas = clave + "," if clave else ""
+            acumulado = 0
+            for limite, cuenta in zip(BUCKETS_S, histograma["buckets"]):
+                acumulado += cuenta
+                lineas.append(f'{completo}_bucket{{{prefijo_etiquetas}le="{limite}"}} {acumulado}')
+            lineas.append(f'{completo}_bucket{{{prefijo_etiquetas}le="+Inf"}} {histograma["cuenta"]}')
+            sufijo = f"{{{clave}}}" if clave else ""
+            lineas.append(f"{completo}_sum{sufijo} {round(histograma['suma'], 6)}")
+            lineas.append(f"{completo}_count{sufijo} {histograma['cuenta']}")
+
+    return "\n".join(lineas) + "\n"
+
+
+def servir(puerto=METRICAS_PUERTO):
+    """Expone GET /metrics en 127.0.0.1:puerto hasta Ctrl+C"""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Manejador(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] not in ('/metrics', '/metricas'):
+                self.send_error(404)
+                return
+            cuerpo = texto_prometheus().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(cuerpo)))
+            self.end_headers()
+            self.wfile.write(cuerpo)
+
+        def log_message(self, formato, *args):
+            pass
+
+    servidor = ThreadingHTTPServer(('127.0.0.1', puerto), Manejador)
+    print(f"Métricas en http://127.0.0.1:{puerto}/metrics", file=sys.stderr)
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.server_close()
+
+
+def volcar_texto(ruta, cada_s):
+    """Reescribe 'ruta' con el texto de Prometheus cada 'cada_s' segundos (0 = una vez)"""
+    while True:
+        directorio = os.path.dirname(os.path.abspath(ruta))
+        fd, ruta_tmp = tempfile.mkstemp(dir=directorio, suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(texto_prometheus())
+        os.replace(ruta_tmp, ruta)
+        if cada_s <= 0:
+            return
+        time.sleep(cada_s)
+
+
+def _valor_argumento(argumentos, nombre, default, tipo=int):
+    if nombre not in argumentos:
+        return default
+    i = argumentos.index(nombre)
+    try:
+        return tipo(argumentos[i + 1])
+    except (IndexError, ValueError):
+        print(f"Error: {nombre} requiere un valor numérico", file=sys.stderr)
+        sys.exit(1)
+
+
+# --- MAIN EXECUTION ---
+if __name__ == "__main__":
+    argumentos = sys.argv[1:]
+
+    if "--servir" in argumentos:
+        servir(_valor_argumento(argumentos, "--puerto", METRICAS_PUERTO))
+    elif "--volcar" in argumentos:
+        i = argumentos.index("--volcar")
+        if i + 1 >= len(argumentos):
+            print("Uso: python3 metricas.py --volcar <archivo.prom> [--cada S]", file=sys.stderr)
+            sys.exit(1)
+        try:
+            volcar_texto(argumentos[i + 1], _valor_argumento(argumentos, "--cada", 15.0, float))
+        except KeyboardInterrupt:
+            pass
+    else:
+        sys.stdout.write(texto_prometheus())
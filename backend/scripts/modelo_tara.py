@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+Modelo de calibración de tara por tipo de caja y por estación.
+
+Sustituye al valor fijo PESO_TARA_POR_CAJA_G: mantiene una media y varianza
+móviles (algoritmo de Welford) de la tara observada por clave y aprende en
+línea de los carritos que validaron limpios. Mientras una clave no tenga
+suficientes muestras se usa la siguiente más general, y al final el valor fijo.
+
+Claves, de la más específica a la más general:
+    "estacion:<id>|caja:<tipo>"  ->  "caja:<tipo>"  ->  "estacion:<id>"
+
+Una caja nueva nunca valida limpia con la tara de otra, así que cada tipo de
+caja se siembra pesando algunas vacías; a partir de ahí el modelo sigue la
+deriva solo.
+
+Uso:
+    python3 modelo_tara.py                                          # inspeccionar el modelo
+    python3 modelo_tara.py calibrar <tipo_caja> <peso_vacia_g> [estacion]  # registrar una caja vacía
+"""
+
+import copy
+import fcntl
+import json
+import math
+import os
+import sys
+import tempfile
+
+# Peso de tara por caja (en gramos) cuando no hay calibración
+PESO_TARA_POR_CAJA_G = 721.0
+
+# Muestras mínimas antes de confiar en la media de una clave
+MIN_MUESTRAS_TARA = 5
+
+# Archivo donde se persiste el modelo entre ejecuciones de los scripts
+RUTA_MODELO_TARA = os.getenv(
+    'TARA_MODELO_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'modelo_tara.json')
+)
+
+
+def clave_caja(tipo_caja):
+    return f"caja:{tipo_caja}"
+
+
+def clave_estacion(estacion):
+    return f"estacion:{estacion}"
+
+
+def clave_estacion_caja(estacion, tipo_caja):
+    return f"estacion:{estacion}|caja:{tipo_caja}"
+
+
+def _stats_vacias():
+    return {"n": 0, "media": 0.0, "m2": 0.0}
+
+
+def _actualizar_stats(stats, valor):
+    """Paso de Welford: incorpora una observación a {'n', 'media', 'm2'}"""
+    stats["n"] += 1
+    delta = valor - stats["media"]
+    stats["media"] += delta / stats["n"]
+    stats["m2"] += delta * (valor - stats["media"])
+
+
+class ModeloTara:
+    """
+    Tara por caja aprendida en línea.
+
+    Las observaciones nuevas se acumulan en memoria y guardar() las aplica sobre
+    la versión más reciente del archivo bajo un lock, porque cada validación
+    corre en su propio proceso y varias pueden terminar a la vez.
+    """
+
+    def __init__(self, ruta=RUTA_MODELO_TARA, tara_default=PESO_TARA_POR_CAJA_G):
+        self.ruta = ruta
+        self.tara_default = tara_default
+        self.stats = {}
+        self._pendientes = []
+
+    @classmethod
+    def cargar(cls, ruta=RUTA_MODELO_TARA):
+        """Carga el modelo desde disco; si no existe o está corrupto regresa uno vacío"""
+        modelo = cls(ruta)
+        try:
+            with open(ruta, 'r', encoding='utf-8') as f:
+                modelo.stats = json.load(f).get("stats", {})
+        except FileNotFoundError:
+            pass
+        except (json.JSONDecodeError, AttributeError) as e:
+            print(f"Advertencia: modelo de tara ilegible en {ruta}, se usa la tara fija. {e}", file=sys.stderr)
+        return modelo
+
+    def _claves(self, tipo_caja, estacion):
+        claves = []
+        if tipo_caja is not None and estacion is not None:
+            claves.append(clave_estacion_caja(estacion, tipo_caja))
+        if tipo_caja is not None:
+            claves.append(clave_caja(tipo_caja))
+        if estacion is not None:
+            claves.append(clave_estacion(estacion))
+        return claves
+
+    def estimar(self, tipo_caja=None, estacion=None):
+        """
+        Regresa (tara_g, varianza_g2, fuente) para una caja.
+        'fuente' es la clave usada o 'default' si no hay calibración suficiente.
+        """
+        for clave in self._claves(tipo_caja, estacion):
+            stats = self.stats.get(clave)
+            if stats and stats["n"] >= MIN_MUESTRAS_TARA:
+                varianza = stats["m2"] / (stats["n"] - 1)
+                return stats["media"], varianza, clave
+        return self.tara_default, 0.0, "default"
+
+    def observar(self, tara_observada_g, tipo_caja=None, estacion=None):
+        """Registra la tara observada de una caja en todas sus claves"""
+        for clave in self._claves(tipo_caja, estacion):
+            _actualizar_stats(self.stats.setdefault(clave, _stats_vacias()), tara_observada_g)
+            self._pendientes.append((clave, tara_observada_g))
+
+    def aprender_de_carrito(self, cajas, peso_esperado_contenido_g, estacion=None):
+        """
+        Aprende de un carrito que validó limpio. El residuo entre el peso bruto
+        y (contenido esperado + taras estimadas) se reparte por igual entre las
+        cajas, ya que el plan solo conoce el contenido a nivel carrito.
+        """
+        pesadas = [caja for caja in cajas if caja.get("peso_medido_g") is not None]
+        if not pesadas or len(pesadas) != len(cajas):
+            return
+
+        estimadas = [self.estimar(caja.get("tipo_caja"), estacion)[0] for caja in pesadas]
+        peso_bruto = sum(float(caja["peso_medido_g"]) for caja in pesadas)
+        residuo_por_caja = (peso_bruto - peso_esperado_contenido_g - sum(estimadas)) / len(pesadas)
+
+        for caja, tara_estimada in zip(pesadas, estimadas):
+            self.observar(tara_estimada + residuo_por_caja, caja.get("tipo_caja"), estacion)
+
+    def guardar(self):
+        """
+        Persiste las observaciones pendientes. Relee el archivo bajo lock y
+        aplica encima solo lo nuevo, para no pisar lo que guardaron otros procesos.
+        """
+        if not self._pendientes:
+            return
+
+        carpeta = os.path.dirname(self.ruta) or '.'
+        with open(self.ruta + '.lock', 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                with open(self.ruta, 'r', encoding='utf-8') as f:
+                    stats = json.load(f).get("stats", {})
+            except (FileNotFoundError, json.JSONDecodeError, AttributeError):
+                stats = {}
+
+            for clave, valor in self._pendientes:
+                _actualizar_stats(stats.setdefault(clave, _stats_vacias()), valor)
+
+            fd, ruta_tmp = tempfile.mkstemp(dir=carpeta, suffix='.tmp')
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump({"tara_default_g": self.tara_default, "stats": stats}, f, indent=2)
+            os.replace(ruta_tmp, self.ruta)
+
+        self.stats = stats
+        self._pendientes = []
+
+    def resumen(self):
+        """Media y desviación estándar por clave, para inspección"""
+        return {
+            clave: {
+                "n": stats["n"],
+                "media_g": round(stats["media"], 2),
+                "desviacion_g": round(math.sqrt(stats["m2"] / (stats["n"] - 1)), 2) if stats["n"] > 1 else None
+            }
+            for clave, stats in sorted(self.stats.items())
+        }
+
+
+class ModeloTaraCongelado(ModeloTara):
+    """
+    Copia de solo lectura de un modelo, para re-analizar historiales
+    (replay_registros.py). Estima siempre con las stats con que se creó; en
+    vez de aprender, cada tara observada se anota en 'observaciones' con su
+    deriva respecto a la tara estimada. guardar() no escribe nada.
+    """
+
+    def __init__(self, modelo):
+        super().__init__(modelo.ruta, modelo.tara_default)
+        self.stats = copy.deepcopy(modelo.stats)
+        self.observaciones = []
+
+    def observar(self, tara_observada_g, tipo_caja=None, estacion=None):
+        tara_estimada = self.estimar(tipo_caja, estacion)[0]
+        self.observaciones.append({"tipo_caja": tipo_caja, "estacion": estacion,
+                                   "deriva_g": tara_observada_g - tara_estimada})
+
+    def guardar(self):
+        pass
+
+
+if __name__ == "__main__":
+    modelo = ModeloTara.cargar()
+
+    if len(sys.argv) > 1 and sys.argv[1] == "calibrar":
+        if len(sys.argv) < 4:
+            print(json.dumps({"error": "Uso: python3 modelo_tara.py calibrar <tipo_caja> <peso_vacia_g> [estacion]"}))
+            sys.exit(1)
+        try:
+            peso_vacia = float(sys.argv[3])
+        except ValueError:
+            print(json.dumps({"error": f"Peso inválido: {sys.argv[3]}"}))
+            sys.exit(1)
+        modelo.observar(peso_vacia, sys.argv[2], sys.argv[4] if len(sys.argv) > 4 else None)
+        modelo.guardar()
+
+    print(json.dumps({
+        "ruta": modelo.ruta,
+        "tara_default_g": modelo.tara_default,
+        "min_muestras": MIN_MUESTRAS_TARA,
+        "claves": modelo.resumen()
+    }, indent=2, ensure_ascii=False))
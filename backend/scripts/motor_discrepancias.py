@@ -0,0 +1,189 @@
+"""
+Motor de discrepancias de peso compartido por los validadores.
+
+Busca la combinación más simple de items faltantes/sobrantes que explique la
+diferencia entre el peso neto esperado y el medido. Si se pasa la evidencia de
+visión del carrito, la búsqueda prueba primero, en todas las cotas, los SKUs
+que la visión señala (vistos en las cajas o marcados como faltantes) y solo
+recurre al plan completo si con ellos no se encuentra explicación.
+
+Ninguna búsqueda pasa de MAX_NODOS_BUSQUEDA combinaciones: un espacio que
+en una cota excede el tope no se recorre (y las cotas mayores tampoco).
+
+Cada llamada queda en metricas.py (solver="discrepancias"): resultado,
+combinaciones evaluadas, latencia y los cortes por MAX_NODOS_BUSQUEDA. Una
+discrepancia sin explicación cuenta como 'no_identificada', o 'timeout' si
+alguna búsqueda se cortó.
+
+La búsqueda trabaja en miligramos enteros (pesos_fijos.py): una combinación
+explica la diferencia si queda a menos de TOLERANCIA_SOLVER_MG.
+"""
+
+import itertools
+
+from metricas import cronometrar, incrementar
+from pesos_fijos import a_mg
+
+# Cotas de búsqueda por SKU, de la más barata a la más cara
+COTAS_BUSQUEDA = [5, 10, 25]
+
+# Coste extra por usar un SKU en contra de lo que vio la cámara
+# (p. ej. "Sobran X" cuando X no aparece en ninguna caja)
+PENALIZACION_CONTRA_VISION = 2
+
+# Combinaciones máximas de una búsqueda ((2 * cota + 1) ^ SKUs)
+MAX_NODOS_BUSQUEDA = 200000
+
+# Distancia máxima (exclusiva) entre la combinación y la diferencia medida
+TOLERANCIA_SOLVER_MG = 1000
+
+
+def formatear_solucion(coeficientes, items):
+    """
+    Convierte una solución como (2, -1, 0) en un string legible.
+    'items' es una lista de tuplas: [('sku', peso), ...]
+    """
+    reporte_partes = []
+    for i, k in enumerate(coeficientes):
+        if k == 0:
+            continue
+
+        sku = items[i][0]
+        if k > 0:
+            reporte_partes.append(f"Faltan {k} {sku}")
+        else:
+            reporte_partes.append(f"Sobran {abs(k)} {sku}")
+
+    if not reporte_partes:
+        return "Sugerencia: No se encontró una causa simple para la discrepancia."
+
+    return "Sugerencia: " + ", ".join(reporte_partes) + "."
+
+
+def _coste(coeficientes, items, tipos_detectados, tipos_faltantes):
+    """
+    Coste de una explicación: número de unidades movidas, más una penalización
+    por cada SKU que contradice la evidencia de visión.
+    """
+    coste = 0
+    for i, k in enumerate(coeficientes):
+        if k == 0:
+            continue
+        coste += abs(k)
+        sku = items[i][0]
+        if k < 0 and tipos_detectados is not None and sku not in tipos_detectados:
+            coste += PENALIZACION_CONTRA_VISION
+        elif k > 0 and tipos_faltantes and sku not in tipos_faltantes:
+            coste += PENALIZACION_CONTRA_VISION
+    return coste
+
+
+def _buscar(diferencia_mg, items, search_bound, tipos_detectados, tipos_faltantes):
+    """
+    Búsqueda exhaustiva de la explicación de menor coste sobre 'items'
+    ([('sku', peso_mg), ...]); toda la aritmética es entera.
+    """
+    search_range = range(-search_bound, search_bound + 1)
+
+    mejor_solucion = None
+    min_coste = float('inf')
+
+    for coeficientes in itertools.product(search_range, repeat=len(items)):
+
+        if all(c == 0 for c in coeficientes):
+            continue
+
+        suma_actual = sum(k * items[i][1] for i, k in enumerate(coeficientes))
+
+        if abs(suma_actual - diferencia_mg) < TOLERANCIA_SOLVER_MG:
+            coste_actual = _coste(coeficientes, items, tipos_detectados, tipos_faltantes)
+
+            if coste_actual < min_coste:
+                min_coste = coste_actual
+                mejor_solucion = coeficientes
+
+    return mejor_solucion
+
+
+def _peso_mg(item):
+    return item['peso_mg'] if 'peso_mg' in item else a_mg(item['peso'])
+
+
+def espacios_de_busqueda(items_plan, tipos_detectados=None, tipos_faltantes=None):
+    """
+    Subconjuntos de SKUs con evidencia de visión, en orden de plausibilidad:
+    1. Los que la visión marcó como faltantes.
+    2. Los faltantes más los vistos en las cajas.
+    Se omiten los subconjuntos vacíos o repetidos. El plan completo no va
+    aquí: resolver_discrepancia_mg lo prueba al final.
+    """
+    todos = list(items_plan)
+    if tipos_detectados is None and tipos_faltantes is None:
+        return []
+
+    faltantes = [sku for sku in todos if tipos_faltantes and sku in tipos_faltantes]
+    con_evidencia = [sku for sku in todos
+                     if (tipos_faltantes and sku in tipos_faltantes) or (tipos_detectados and sku in tipos_detectados)]
+
+    espacios = []
+    for espacio in (faltantes, con_evidencia):
+        if espacio and espacio not in espacios:
+            espacios.append(espacio)
+    return espacios
+
+
+def resolver_discrepancia(diferencia_peso, items_plan, tipos_detectados=None, tipos_faltantes=None):
+    """Igual que resolver_discrepancia_mg, con la diferencia en gramos"""
+    return resolver_discrepancia_mg(a_mg(diferencia_peso), items_plan, tipos_detectados, tipos_faltantes)
+
+
+def resolver_discrepancia_mg(diferencia_mg, items_plan, tipos_detectados=None, tipos_faltantes=None):
+    """
+    Resuelve una discrepancia de peso compleja encontrando la combinación
+    de items faltantes/sobrantes más simple que explique la diferencia.
+
+    'diferencia_mg' es esperado - medido en miligramos enteros.
+    'items_plan' es un dict: {'sku': {'peso': 30}} o, ya compilado,
+    {'sku': {'peso': 30, 'peso_mg': 30000}}.
+    'tipos_detectados' / 'tipos_faltantes' (opcionales) son los SKUs del plan
+    que la visión vio en las cajas y los que no vio; se usan como prior para
+    acotar la búsqueda y desempatar explicaciones.
+    """
+
+    if not items_plan:
+        incrementar('solver_invocaciones_total', solver='discrepancias', resultado='sin_plan')
+        return "Discrepancia de peso no identificada (no hay items en el plan)."
+
+    def con_pesos(espacio):
+        return [(sku, _peso_mg(items_plan[sku])) for sku in espacio]
+
+    espacios_evidencia = espacios_de_busqueda(items_plan, tipos_detectados, tipos_faltantes)
+    # Cada espacio en sus cotas: primero los de la visión en todas, al final el plan completo
+    recorridos = [(con_pesos(espacio), cota) for cota in COTAS_BUSQUEDA for espacio in espacios_evidencia]
+    if list(items_plan) not in espacios_evidencia:
+        recorridos += [(con_pesos(items_plan), cota) for cota in COTAS_BUSQUEDA]
+
+    nodos = 0
+    cortados = set()
+    with cronometrar('solver_segundos', solver='discrepancias'):
+        for items, search_bound in recorridos:
+            espacio = tuple(sku for sku, _ in items)
+            if espacio in cortados:
+                continue
+            nodos_espacio = (2 * search_bound + 1) ** len(items)
+            if nodos_espacio > MAX_NODOS_BUSQUEDA:
+                cortados.add(espacio)
+                continue
+            nodos += nodos_espacio
+            mejor_solucion = _buscar(diferencia_mg, items, search_bound, tipos_detectados, tipos_faltantes)
+            if mejor_solucion:
+                incrementar('solver_nodos_total', nodos, solver='discrepancias')
+                incrementar('solver_invocaciones_total', solver='discrepancias', resultado='explicada')
+                return formatear_solucion(mejor_solucion, items)
+
+    incrementar('solver_nodos_total', nodos, solver='discrepancias')
+    if cortados:
+        incrementar('solver_timeouts_total', solver='discrepancias')
+    incrementar('solver_invocaciones_total', solver='discrepancias',
+                resultado='timeout' if cortados else 'no_identificada')
+    return "Discrepancia de peso compleja no identificada."
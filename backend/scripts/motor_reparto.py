@@ -0,0 +1,280 @@
+"""
+Motor de reparto de una orden maestra en carritos con varias restricciones.
+
+Cada carrito tiene tres capacidades:
+- ítems: unidades totales (MAX_ITEMS_POR_CARRITO en repartir_y_mandar_orden.py),
+- peso: gramos de contenido según PRODUCTS.PESO_UNITARIO_G,
+- cajones: ranuras físicas; un SKU ocupa ceil(cantidad / unidades_por_cajon)
+  cajones en cada carrito donde aparece (no hay volumen en PRODUCTS, así que
+  las unidades por cajón hacen de proxy del volumen).
+
+Dos modos:
+- heurístico: parte de la cota inferior de carritos y coloca las líneas de
+  mayor carga primero en el carrito menos cargado; parte una línea entre
+  carritos solo si no cabe entera, y abre otro carrito solo si no hay espacio.
+- exacto: para órdenes chicas, ramificación y poda sobre las mismas líneas
+  que minimiza el número de carritos y después la carga del más lleno.
+
+Antes de repartir, un SKU que no cabe en un carrito se parte en trozos parejos.
+Cada cajón lleva un solo SKU; asignar_cajones() numera los cajones de un
+carrito a partir de su contenido, así que el mismo contenido siempre produce
+los mismos cajones.
+
+La búsqueda exacta registra en metricas.py (solver="reparto_exacto") sus
+nodos, latencia y los cortes por MAX_NODOS_EXACTO.
+"""
+
+import math
+import os
+
+from metricas import cronometrar, incrementar
+
+MAX_PESO_POR_CARRITO_G = float(os.getenv('REPARTO_MAX_PESO_G', '80000'))
+CAJONES_POR_CARRITO = int(os.getenv('REPARTO_CAJONES_POR_CARRITO', '10'))
+UNIDADES_POR_CAJON_DEFAULT = int(os.getenv('REPARTO_UNIDADES_POR_CAJON', '40'))
+
+# El modo 'auto' usa el exacto hasta este número de SKUs
+MAX_SKUS_EXACTO = 10
+
+# Nodos máximos de la búsqueda exacta antes de quedarse con el heurístico
+MAX_NODOS_EXACTO = 200000
+
+
+def _capacidades(max_items, max_peso_g, cajones):
+    return {"items": max_items, "peso": max_peso_g, "cajones": cajones}
+
+
+def _carga_dominante(carga, capacidades):
+    """Fracción del recurso más ocupado del carrito (0..1)"""
+    return max(carga[recurso] / capacidades[recurso] if capacidades[recurso] else 0.0
+               for recurso in capacidades)
+
+
+def _carrito_vacio():
+    return {"items": 0, "peso": 0.0, "cajones": 0, "contenido": {}}
+
+
+def _unidades_que_caben(carrito, sku, peso_unitario, por_cajon, capacidades):
+    """Máximo de unidades de 'sku' que todavía entran en el carrito"""
+    por_items = capacidades["items"] - carrito["items"]
+    por_peso = math.floor((capacidades["peso"] - carrito["peso"]) / peso_unitario) if peso_unitario > 0 else por_items
+
+    # Un SKU ya presente puede terminar de llenar su último cajón sin ocupar otro
+    ya_hay = carrito["contenido"].get(sku, 0)
+    hueco_cajon = (-ya_hay) % por_cajon
+    por_cajones = (capacidades["cajones"] - carrito["cajones"]) * por_cajon + hueco_cajon
+
+    return max(0, min(por_items, por_peso, por_cajones))
+
+
+def _agregar(carrito, sku, unidades, peso_unitario, por_cajon):
+    ya_hay = carrito["contenido"].get(sku, 0)
+    carrito["cajones"] += math.ceil((ya_hay + unidades) / por_cajon) - math.ceil(ya_hay / por_cajon)
+    carrito["contenido"][sku] = ya_hay + unidades
+    carrito["items"] += unidades
+    carrito["peso"] += unidades * peso_unitario
+
+
+def _carga_linea(cantidad, peso, por_cajon, capacidades):
+    carga = {"items": cantidad, "peso": cantidad * peso, "cajones": math.ceil(cantidad / por_cajon)}
+    return _carga_dominante(carga, capacidades)
+
+
+def _lineas(orden, pesos_g, unidades_por_cajon, capacidades):
+    """
+    [(sku, cantidad, peso_unitario, por_cajon, carga)] de mayor a menor carga.
+    Un SKU que no cabe en un solo carrito se parte en el mínimo de trozos
+    parejos que sí caben, para que los carritos queden balanceados.
+    """
+    lineas = []
+    for sku, cantidad in orden.items():
+        peso = float(pesos_g.get(sku, 0.0))
+        por_cajon = max(1, int(unidades_por_cajon.get(sku, UNIDADES_POR_CAJON_DEFAULT)))
+
+        trozos = max(1, math.ceil(_carga_linea(cantidad, peso, por_cajon, capacidades)))
+        while trozos < cantidad and _carga_linea(math.ceil(cantidad / trozos), peso, por_cajon, capacidades) > 1.0:
+            trozos += 1
+
+        base, sobrante = divmod(cantidad, trozos)
+        for i in range(trozos):
+            unidades = base + (1 if i < sobrante else 0)
+            if unidades > 0:
+                lineas.append((sku, unidades, peso, por_cajon, _carga_linea(unidades, peso, por_cajon, capacidades)))
+
+    lineas.sort(key=lambda linea: (-linea[4], linea[0]))
+    return lineas
+
+
+def cota_inferior_carritos(lineas, capacidades):
+    """Carritos mínimos que exige cada recurso por separado"""
+    total_items = sum(linea[1] for linea in lineas)
+    total_peso = sum(linea[1] * linea[2] for linea in lineas)
+    cajones_por_sku = {}
+    for sku, cantidad, _, por_cajon, _ in lineas:
+        cajones_por_sku[sku] = cajones_por_sku.get(sku, 0) + cantidad / por_cajon
+    total_cajones = sum(math.ceil(c) for c in cajones_por_sku.values())
+    return max(
+        1,
+        math.ceil(total_items / capacidades["items"]),
+        math.ceil(total_peso / capacidades["peso"]) if capacidades["peso"] else 1,
+        math.ceil(total_cajones / capacidades["cajones"]),
+    )
+
+
+def repartir_heuristico(lineas, capacidades):
+    """
+    Empieza con la cota inferior de carritos. Cada línea va entera al carrito
+    menos cargado donde quepa; si no cabe entera en ninguno, se reparte entre
+    los que tienen espacio, y solo si aun así sobra se abre un carrito más.
+    """
+    carritos = [_carrito_vacio() for _ in range(cota_inferior_carritos(lineas, capacidades))]
+
+    for sku, cantidad, peso, por_cajon, _ in lineas:
+        candidatos = sorted(carritos, key=lambda c: _carga_dominante(c, capacidades))
+        destino = next((c for c in candidatos
+                        if _unidades_que_caben(c, sku, peso, por_cajon, capacidades) >= cantidad), None)
+        if destino is not None:
+            _agregar(destino, sku, cantidad, peso, por_cajon)
+            continue
+
+        espacio = [(c, _unidades_que_caben(c, sku, peso, por_cajon, capacidades)) for c in carritos]
+        if sum(unidades for _, unidades in espacio) < cantidad:
+            # Las líneas ya vienen partidas para caber en un carrito vacío
+            nuevo = _carrito_vacio()
+            _agregar(nuevo, sku, cantidad, peso, por_cajon)
+            carritos.append(nuevo)
+            continue
+
+        restante = cantidad
+        for carrito, unidades in sorted(espacio, key=lambda par: -par[1]):
+            unidades = min(restante, unidades)
+            if unidades > 0:
+                _agregar(carrito, sku, unidades, peso, por_cajon)
+                restante -= unidades
+            if restante == 0:
+                break
+
+    return [c for c in carritos if c["items"] > 0]
+
+
+def repartir_exacto(lineas, capacidades, max_carritos, max_nodos=MAX_NODOS_EXACTO):
+    """
+    Asigna cada línea entera a un carrito minimizando (número de carritos,
+    carga del carrito más lleno). Regresa None si alguna línea no cabe en un
+    carrito, si no mejora a 'max_carritos' o si se agotan los nodos.
+    """
+    for linea in lineas:
+        if linea[4] > 1.0:
+            return None
+
+    mejor = {"carritos": None, "clave": (max_carritos + 1, float('inf'))}
+    nodos = [0]
+
+    def buscar(i, carritos):
+        nodos[0] += 1
+        if nodos[0] > max_nodos:
+            raise TimeoutError()
+
+        carga_max = max((_carga_dominante(c, capacidades) for c in carritos), default=0.0)
+        if (len(carritos), carga_max) >= mejor["clave"]:
+            return
+        if i == len(lineas):
+            mejor["carritos"] = [dict(c, contenido=dict(c["contenido"])) for c in carritos]
+            mejor["clave"] = (len(carritos), carga_max)
+            return
+
+        sku, cantidad, peso, por_cajon, _ = lineas[i]
+        for carrito in carritos:
+            if _unidades_que_caben(carrito, sku, peso, por_cajon, capacidades) >= cantidad:
+                respaldo = dict(carrito, contenido=dict(carrito["contenido"]))
+                _agregar(carrito, sku, cantidad, peso, por_cajon)
+                buscar(i + 1, carritos)
+                carrito.clear()
+                carrito.update(respaldo)
+
+        # Abrir un carrito nuevo (solo uno: los carritos vacíos son intercambiables)
+        if len(carritos) + 1 <= mejor["clave"][0]:
+            nuevo = _carrito_vacio()
+            _agregar(nuevo, sku, cantidad, peso, por_cajon)
+            carritos.append(nuevo)
+            buscar(i + 1, carritos)
+            carritos.pop()
+
+    with cronometrar('solver_segundos', solver='reparto_exacto'):
+        try:
+            buscar(0, [])
+        except TimeoutError:
+            incrementar('solver_timeouts_total', solver='reparto_exacto')
+            incrementar('solver_invocaciones_total', solver='reparto_exacto', resultado='timeout')
+            return None
+        finally:
+            incrementar('solver_nodos_total', nodos[0], solver='reparto_exacto')
+
+    incrementar('solver_invocaciones_total', solver='reparto_exacto',
+                resultado='mejorada' if mejor["carritos"] is not None else 'sin_mejora')
+    return mejor["carritos"]
+
+
+def asignar_cajones(contenido, unidades_por_cajon=None):
+    """
+    Sub-plan por cajón de un carrito {sku: cantidad}:
+    [{"numero_cajon": 1, "sku": ..., "cantidad": ...}, ...] en orden de SKU.
+    """
+    unidades_por_cajon = unidades_por_cajon or {}
+    cajones = []
+    for sku in sorted(contenido):
+        restante = contenido[sku]
+        por_cajon = max(1, int(unidades_por_cajon.get(sku, UNIDADES_POR_CAJON_DEFAULT)))
+        while restante > 0:
+            unidades = min(restante, por_cajon)
+            cajones.append({"numero_cajon": len(cajones) + 1, "sku": sku, "cantidad": unidades})
+            restante -= unidades
+    return cajones
+
+
+def reporte_utilizacion(carritos, capacidades):
+    """Carga y porcentaje de uso de cada recurso por carrito"""
+    reporte = []
+    for i, carrito in enumerate(carritos):
+        reporte.append({
+            "carrito": i + 1,
+            "items": carrito["items"],
+            "peso_g": round(carrito["peso"], 1),
+            "cajones": carrito["cajones"],
+            "utilizacion_pct": {
+                recurso: round(100.0 * carrito[recurso] / capacidades[recurso], 1) if capacidades[recurso] else 0.0
+                for recurso in capacidades
+            }
+        })
+    return reporte
+
+
+def repartir(orden, pesos_g=None, max_items=300, max_peso_g=MAX_PESO_POR_CARRITO_G,
+             cajones=CAJONES_POR_CARRITO, unidades_por_cajon=None, modo='auto'):
+    """
+    Reparte {sku: cantidad} en carritos.
+    'pesos_g' es {sku: PESO_UNITARIO_G}; sin pesos no se aplica la restricción de peso.
+    'modo' es 'heuristico', 'exacto' o 'auto' (exacto si hay pocos SKUs).
+
+    Regresa {"carritos": [{sku: cantidad}, ...], "utilizacion": [...], "modo": ...}.
+    """
+    capacidades = _capacidades(max_items, max_peso_g, cajones)
+    lineas = _lineas(orden, pesos_g or {}, unidades_por_cajon or {}, capacidades)
+    if not lineas:
+        return {"carritos": [], "utilizacion": [], "modo": modo}
+
+    carritos = repartir_heuristico(lineas, capacidades)
+    modo_usado = 'heuristico'
+
+    if modo == 'exacto' or (modo == 'auto' and len(lineas) <= MAX_SKUS_EXACTO):
+        exactos = repartir_exacto(lineas, capacidades, len(carritos))
+        clave_heuristica = (len(carritos), max(_carga_dominante(c, capacidades) for c in carritos))
+        if exactos is not None and (len(exactos), max(_carga_dominante(c, capacidades) for c in exactos)) < clave_heuristica:
+            carritos = exactos
+            modo_usado = 'exacto'
+
+    return {
+        "carritos": [dict(c["contenido"]) for c in carritos],
+        "utilizacion": reporte_utilizacion(carritos, capacidades),
+        "modo": modo_usado
+    }
@@ -0,0 +1,134 @@
+"""
+Motor de tolerancia estadística para el peso neto de un carrito.
+
+En vez de sumar el 'peso_tolerancia' de cada SKU una sola vez (sin importar la
+cantidad), trata el peso de cada unidad como una variable aleatoria:
+
+    σ_unidad   = peso_tolerancia / K_SIGMAS_TOLERANCIA
+    σ²_carrito = Σ cantidad_i · σ²_unidad_i  (+ varianza de la tara de las cajas)
+    banda      = z(confianza) · σ_carrito
+
+Así la banda crece con √n y no con n, y sí toma en cuenta la cantidad.
+Los planes se compilan una vez por orden (compilar_planes) y el validador
+solo agrega la varianza de la tara al momento de validar. Si el carrito trae
+sub-planes por cajón, cada cajón se compila igual que un carrito chico.
+
+Los pesos esperados y la banda se guardan en miligramos enteros (pesos_fijos.py)
+para que la comparación contra el peso medido sea exacta. Los SKUs esperados
+se guardan además como máscara de bits sobre una TablaSkus compartida por
+todos los carritos de la orden (tabla_skus.py): la extensión de la tabla del
+catálogo si el validador la tiene, o una con los SKUs de la orden.
+"""
+
+import math
+import os
+
+from pesos_fijos import MG_POR_G, a_gramos, a_mg
+from tabla_skus import TablaSkus
+
+# 'peso_tolerancia' de PRODUCTS se interpreta como ±3σ del peso de una unidad
+K_SIGMAS_TOLERANCIA = 3.0
+
+# Nivel de confianza de la banda (probabilidad de que un carrito correcto caiga dentro)
+CONFIANZA_DEFAULT = float(os.getenv('TOLERANCIA_CONFIANZA', '0.997'))
+
+# Banda mínima: por debajo de esto manda la resolución de la báscula
+BANDA_MINIMA_G = 2.0
+BANDA_MINIMA_MG = a_mg(BANDA_MINIMA_G)
+
+
+def z_para_confianza(confianza):
+    """Cuantil normal bilateral: confianza 0.997 -> z ≈ 2.97"""
+    if not 0 < confianza < 1:
+        raise ValueError(f"La confianza debe estar entre 0 y 1, se recibió {confianza}")
+    # statistics arrastra decimal y fractions; solo se importa al compilar planes
+    from statistics import NormalDist
+    return NormalDist().inv_cdf((1 + confianza) / 2)
+
+
+def compilar_plan_carrito(plan, confianza=CONFIANZA_DEFAULT, tabla=None):
+    """
+    Precalcula todo lo que la validación necesita de un plan de carrito:
+    peso esperado, varianza del contenido, z de la banda, SKUs esperados
+    (set y máscara sobre 'tabla') y el dict de pesos que consume
+    resolver_discrepancia. Sin 'tabla' se crea una con los SKUs del carrito.
+    Si el plan trae los totales de ORDER_PLAN (plan_orden.py) el peso y la
+    varianza se toman de ahí en vez de sumar los items.
+    """
+    if tabla is None:
+        tabla = TablaSkus(item["sku"] for item in plan["items_requeridos"])
+
+    peso_esperado_mg = plan.get("peso_esperado_carrito_mg")
+    varianza_contenido = plan.get("varianza_carrito_g2")
+    sumar = peso_esperado_mg is None or varianza_contenido is None
+    if sumar:
+        peso_esperado_mg, varianza_contenido = 0, 0.0
+    items_plan = {}
+
+    for item in plan["items_requeridos"]:
+        peso_unitario_mg = a_mg(item.get("peso_unitario_g", 0))
+        items_plan[item["sku"]] = {"peso": a_gramos(peso_unitario_mg, 3), "peso_mg": peso_unitario_mg}
+        if sumar:
+            cantidad = item.get("cantidad_requerida", 0)
+            sigma_unidad = item.get("peso_tolerancia", 0) / K_SIGMAS_TOLERANCIA
+            peso_esperado_mg += peso_unitario_mg * cantidad
+            varianza_contenido += cantidad * sigma_unidad ** 2
+
+    return {
+        "cart_id": plan.get("cart_id"),
+        "peso_esperado_mg": peso_esperado_mg,
+        "peso_esperado_g": a_gramos(peso_esperado_mg),
+        "varianza_contenido_g2": varianza_contenido,
+        "z": z_para_confianza(confianza),
+        "tipos_esperados": frozenset(items_plan),
+        "mascara_esperada": tabla.mascara(items_plan),
+        "tabla_skus": tabla,
+        "items_plan": items_plan,
+        "cajones": _compilar_cajones(plan, confianza, tabla),
+    }
+
+
+def _compilar_cajones(plan, confianza, tabla):
+    """
+    Sub-planes compilados por cajón {numero_cajon: plan_compilado}, con los
+    pesos y tolerancias de los items del carrito. {} si el carrito no tiene cajones.
+    """
+    if not plan.get("cajones"):
+        return {}
+
+    items_carrito = {item["sku"]: item for item in plan["items_requeridos"]}
+    cajones = {}
+    for cajon in plan["cajones"]:
+        items_cajon = [
+            dict(items_carrito.get(item["sku"], {}), sku=item["sku"], cantidad_requerida=item["cantidad_requerida"])
+            for item in cajon["items_requeridos"]
+        ]
+        cajones[cajon["numero_cajon"]] = compilar_plan_carrito(
+            {"cart_id": plan.get("cart_id"), "items_requeridos": items_cajon}, confianza, tabla
+        )
+    return cajones
+
+
+def compilar_planes(carritos, confianza=CONFIANZA_DEFAULT, tabla=None):
+    """
+    Compila todos los carritos de una orden: {cart_id: plan_compilado}.
+    Todos comparten 'tabla' (p. ej. TablaSkus.extension() de la del
+    catálogo); sin ella se arma una con los SKUs de la orden.
+    """
+    if tabla is None:
+        tabla = TablaSkus(item["sku"] for carrito in carritos for item in carrito["items_requeridos"])
+    return {carrito['cart_id']: compilar_plan_carrito(carrito, confianza, tabla) for carrito in carritos}
+
+
+def banda_tolerancia_mg(plan_compilado, varianza_tara_g2=0.0):
+    """
+    Semi-ancho de la banda aceptable (en miligramos) para el peso neto del
+    carrito, sumando la incertidumbre de la tara estimada de sus cajas.
+    """
+    sigma = math.sqrt(plan_compilado["varianza_contenido_g2"] + varianza_tara_g2)
+    return max(BANDA_MINIMA_MG, round(plan_compilado["z"] * sigma * MG_POR_G))
+
+
+def banda_tolerancia(plan_compilado, varianza_tara_g2=0.0):
+    """La misma banda en gramos, para los reportes"""
+    return a_gramos(banda_tolerancia_mg(plan_compilado, varianza_tara_g2))
@@ -0,0 +1,173 @@
+"""
+Perfilado opcional de los scripts de validación, sin editar el código.
+
+Se activa por entorno (o con la bandera --perfil[=modo] en la línea de
+comandos de validate_inventory.py, crear_orden.py y analizar_registro.py):
+
+    PERFILADO=muestreo      muestreador de pila propio (bajo costo); escribe
+                            stacks colapsados (flamegraph.pl / speedscope)
+                            o JSON de speedscope según PERFILADO_FORMATO
+    PERFILADO=cprofile      cProfile determinista; escribe un .prof (pstats)
+    PERFILADO_TASA=0.05     fracción de ejecuciones que se perfilan (default 1)
+    PERFILADO_INTERVALO_MS  periodo del muestreador (default 5)
+    PERFILADO_FORMATO       'collapsed' (default) o 'speedscope'
+    PERFILADO_DIR           carpeta de salida (default <tmp>/gategroup_perfiles)
+
+Cada ejecución perfilada deja un archivo <script>_<fecha>_<pid>.<ext> y avisa
+la ruta por stderr; stdout (el JSON que lee server.js) no cambia.
+"""
+
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+MODOS = ('muestreo', 'cprofile')
+
+PERFILADO_DIR = os.getenv('PERFILADO_DIR', os.path.join(tempfile.gettempdir(), 'gategroup_perfiles'))
+
+
+def extraer_bandera(argv):
+    """
+    Quita --perfil / --perfil=<modo> de argv (en su lugar) para que los
+    argumentos posicionales del script no cambien. Regresa el modo o None.
+    """
+    for i, argumento in enumerate(argv):
+        if argumento == '--perfil' or argumento.startswith('--perfil='):
+            del argv[i]
+            return argumento.partition('=')[2] or 'muestreo'
+    return None
+
+
+def _modo_activo(modo):
+    modo = modo or os.getenv('PERFILADO', '').strip().lower()
+    if not modo:
+        return None
+    if modo not in MODOS:
+        print(f"Advertencia: PERFILADO='{modo}' no reconocido (usar {', '.join(MODOS)}); sin perfilar.",
+              file=sys.stderr)
+        return None
+    try:
+        tasa = float(os.getenv('PERFILADO_TASA', '1'))
+    except ValueError:
+        tasa = 1.0
+    return modo if random.random() < tasa else None
+
+
+def _ruta_salida(nombre, extension):
+    os.makedirs(PERFILADO_DIR, exist_ok=True)
+    sello = time.strftime('%Y%m%d-%H%M%S')
+    return os.path.join(PERFILADO_DIR, f"{nombre}_{sello}_{os.getpid()}.{extension}")
+
+
+class MuestreadorPila:
+    """
+    Muestrea la pila del hilo que lo crea cada 'intervalo_s' desde un hilo
+    aparte y cuenta stacks colapsados ("modulo:funcion;...": muestras).
+    """
+
+    def __init__(self, intervalo_s):
+        self.intervalo_s = intervalo_s
+        self.muestras = {}
+        self._id_hilo = threading.get_ident()
+        self._detener = threading.Event()
+        self._hilo = threading.Thread(target=self._muestrear, name='perfilado', daemon=True)
+
+    def _muestrear(self):
+        while not self._detener.wait(self.intervalo_s):
+            frame = sys._current_frames().get(self._id_hilo)
+            pila = []
+            while frame is not None:
+                codigo = frame.f_code
+                pila.append(f"{os.path.basename(codigo.co_filename)}:{codigo.co_name}")
+                frame = frame.f_back
+            if pila:
+                clave = ";".join(reversed(pila))
+                self.muestras[clave] = self.muestras.get(clave, 0) + 1
+
+    def iniciar(self):
+        self._hilo.start()
+
+    def detener(self):
+        self._detener.set()
+        self._hilo.join()
+
+    def escribir_colapsado(self, ruta):
+        with open(ruta, 'w', encoding='utf-8') as f:
+            for pila, cuenta in sorted(self.muestras.items()):
+                f.write(f"{pila} {cuenta}\n")
+
+    def escribir_speedscope(self, ruta, nombre):
+        import json
+
+        marcos = {}
+        muestras = []
+        pesos = []
+        for pila, cuenta in self.muestras.items():
+            muestras.append([marcos.setdefault(marco, len(marcos)) for marco in pila.split(";")])
+            pesos.append(cuenta * self.intervalo_s * 1000)
+
+        documento = {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "shared": {"frames": [{"name": marco} for marco in marcos]},
+            "profiles": [{
+                "type": "sampled",
+                "name": nombre,
+                "unit": "milliseconds",
+                "startValue": 0,
+                "endValue": sum(pesos),
+                "samples": muestras,
+                "weights": pesos
+            }],
+            "name": nombre,
+            "exporter": "gategroup perfilado.py"
+        }
+        with open(ruta, 'w', encoding='utf-8') as f:
+            json.dump(documento, f)
+
+
+def perfilar(nombre, funcion, *args, modo=None, **kwargs):
+    """
+    Ejecuta funcion(*args, **kwargs) y regresa su resultado; si el perfilado
+    está activo (y la ejecución cae dentro de PERFILADO_TASA), guarda el perfil.
+    Un error al escribir el perfil nunca afecta el resultado.
+    """
+    modo = _modo_activo(modo)
+    if modo is None:
+        return funcion(*args, **kwargs)
+
+    if modo == 'cprofile':
+        import cProfile
+        perfil = cProfile.Profile()
+        try:
+            return perfil.runcall(funcion, *args, **kwargs)
+        finally:
+            try:
+                ruta = _ruta_salida(nombre, 'prof')
+                perfil.dump_stats(ruta)
+                print(f"Perfil cProfile guardado en {ruta}", file=sys.stderr)
+            except OSError as e:
+                print(f"Advertencia: no se pudo guardar el perfil: {e}", file=sys.stderr)
+
+    try:
+        intervalo_s = float(os.getenv('PERFILADO_INTERVALO_MS', '5')) / 1000
+    except ValueError:
+        intervalo_s = 0.005
+    muestreador = MuestreadorPila(max(intervalo_s, 0.0005))
+    muestreador.iniciar()
+    try:
+        return funcion(*args, **kwargs)
+    finally:
+        muestreador.detener()
+        try:
+            if os.getenv('PERFILADO_FORMATO', 'collapsed').strip().lower() == 'speedscope':
+                ruta = _ruta_salida(nombre, 'speedscope.json')
+                muestreador.escribir_speedscope(ruta, nombre)
+            else:
+                ruta = _ruta_salida(nombre, 'collapsed')
+                muestreador.escribir_colapsado(ruta)
+            print(f"Perfil ({sum(muestreador.muestras.values())} muestras) guardado en {ruta}", file=sys.stderr)
+        except OSError as e:
+            print(f"Advertencia: no se pudo guardar el perfil: {e}", file=sys.stderr)
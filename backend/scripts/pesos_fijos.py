@@ -0,0 +1,24 @@
+"""
+Pesos en punto fijo: miligramos enteros.
+
+Los validadores convierten cada peso a miligramos al leerlo (báscula, PRODUCTS,
+modelo de tara) y a gramos solo al escribir el reporte. Entre esos dos puntos
+las sumas, la comparación contra la banda y la búsqueda del solver son
+operaciones enteras exactas: el mismo escaneo da el mismo resultado en
+cualquier orden de suma y en cualquier máquina.
+
+Las varianzas (g²) no pasan a punto fijo: solo entran a la raíz de la banda,
+cuyo resultado sí se redondea a miligramos.
+"""
+
+MG_POR_G = 1000
+
+
+def a_mg(gramos):
+    """Gramos (número, Decimal o texto) a miligramos enteros"""
+    return int(round(float(gramos) * MG_POR_G))
+
+
+def a_gramos(mg, decimales=2):
+    """Miligramos enteros a gramos redondeados para el reporte"""
+    return round(mg / MG_POR_G, decimales)
@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+"""
+Plan de la orden desnormalizado (tabla ORDER_PLAN).
+
+Cada lectura de una orden unía FLIGHTS, CARTS, CART_ITEMS, PRODUCTS y
+CART_DRAWERS. publicar_reparto() (repartir_y_mandar_orden.py) reescribe
+ahora, dentro de la misma transacción, las filas del vuelo/fecha en una sola
+tabla ya unida y agrupada por vuelo (CLUSTER BY), con un renglón por
+(carrito, SKU, cajón) y los totales del carrito ya calculados:
+
+- peso_esperado_carrito_mg: peso neto esperado del contenido,
+- varianza_carrito_g2: varianza del contenido (motor_tolerancia.py),
+- tolerancia_carrito_mg: banda a la confianza por defecto, sin la tara.
+
+Los lectores (validate_inventory, crear_orden, precarga_vuelos) hacen un solo
+scan podado por FLIGHT_NUMBER, sin tocar PRODUCTS, y arman los carritos con el
+mismo formato que antes más los totales; compilar_planes los toma en vez de
+volver a sumar los items. Si el vuelo no tiene filas (órdenes publicadas
+antes de esta tabla) regresan al join; `--reconstruir` llena la tabla para
+esas órdenes.
+
+Los pesos se copian de PRODUCTS al publicar. Después de corregir pesos en
+PRODUCTS, `--refrescar-pesos` reescribe solo los vuelos cuyas filas ya no
+coinciden con el catálogo: sube su ORDER_VERSION (las caches y los reportes
+guardados de la versión anterior dejan de valer) y recalcula sus totales.
+
+Uso:
+    python3 plan_orden.py --reconstruir
+    python3 plan_orden.py --refrescar-pesos
+"""
+
+import json
+import sys
+
+from formato_planes import CLAVES_TOTALES
+from motor_tolerancia import banda_tolerancia_mg, compilar_plan_carrito
+
+SQL_CREAR_TABLA_PLAN_ORDEN = """
+    CREATE TABLE IF NOT EXISTS Order_Plan (
+        flight_number VARCHAR(20) NOT NULL,
+        departure_date DATE NOT NULL,
+        flight_id INTEGER NOT NULL,
+        order_version INTEGER NOT NULL,
+        numero_de_carritos INTEGER NOT NULL,
+        cart_id INTEGER NOT NULL,
+        cart_identifier VARCHAR(100),
+        peso_esperado_carrito_mg INTEGER NOT NULL,
+        varianza_carrito_g2 FLOAT NOT NULL,
+        tolerancia_carrito_mg INTEGER NOT NULL,
+        product_sku VARCHAR(50) NOT NULL,
+        cantidad_requerida INTEGER NOT NULL,
+        peso_unitario_g FLOAT,
+        peso_tolerancia FLOAT,
+        numero_cajon INTEGER,
+        cantidad_cajon INTEGER
+    )
+    CLUSTER BY (flight_number, departure_date)
+"""
+
+COLUMNAS_PLAN_ORDEN = (
+    "flight_number", "departure_date", "flight_id", "order_version", "numero_de_carritos",
+    "cart_id", "cart_identifier", "peso_esperado_carrito_mg", "varianza_carrito_g2", "tolerancia_carrito_mg",
+    "product_sku", "cantidad_requerida", "peso_unitario_g", "peso_tolerancia", "numero_cajon", "cantidad_cajon",
+)
+
+
+def adjuntar_totales(carritos):
+    """
+    Copia de los carritos con los totales que guarda ORDER_PLAN, calculados
+    de sus items (se ignoran los totales que ya trajeran).
+    """
+    resultado = []
+    for carrito in carritos:
+        base = {clave: valor for clave, valor in carrito.items() if clave not in CLAVES_TOTALES}
+        plan = compilar_plan_carrito(base)
+        resultado.append(dict(base, peso_esperado_carrito_mg=plan["peso_esperado_mg"],
+                              varianza_carrito_g2=plan["varianza_contenido_g2"],
+                              tolerancia_carrito_mg=banda_tolerancia_mg(plan)))
+    return resultado
+
+
+def filas_plan_orden(flight_number, departure_date, flight_id, version, carritos):
+    """
+    Renglones de ORDER_PLAN para los carritos publicados de un vuelo/fecha
+    (formato de las entradas de cache: items_requeridos y, opcional, cajones).
+    Los carritos sin totales (ver adjuntar_totales) se calculan aquí.
+    """
+    carritos = [carrito if all(clave in carrito for clave in CLAVES_TOTALES) else adjuntar_totales([carrito])[0]
+                for carrito in carritos]
+    filas = []
+    for carrito in carritos:
+        totales = tuple(carrito[clave] for clave in CLAVES_TOTALES)
+
+        cajones_por_sku = {}
+        for cajon in carrito.get("cajones", []):
+            for item in cajon["items_requeridos"]:
+                cajones_por_sku.setdefault(item["sku"], []).append((cajon["numero_cajon"], item["cantidad_requerida"]))
+
+        for item in carrito["items_requeridos"]:
+            for numero_cajon, cantidad_cajon in cajones_por_sku.get(item["sku"], [(None, None)]):
+                filas.append((
+                    flight_number, str(departure_date), flight_id, version, len(carritos),
+                    carrito["cart_id"], carrito["cart_identifier"], *totales,
+                    item["sku"], item["cantidad_requerida"], item["peso_unitario_g"], item["peso_tolerancia"],
+                    numero_cajon, cantidad_cajon,
+                ))
+    return filas
+
+
+def escribir_plan_orden(cursor, flight_number, departure_date, flight_id, version, carritos):
+    """Reemplaza las filas del vuelo; va dentro de la transacción de la publicación"""
+    cursor.execute("DELETE FROM Order_Plan WHERE flight_id = %s", (flight_id,))
+    filas = filas_plan_orden(flight_number, departure_date, flight_id, version, carritos)
+    if filas:
+        marcadores = ", ".join(["%s"] * len(COLUMNAS_PLAN_ORDEN))
+        cursor.executemany(
+            f"INSERT INTO Order_Plan ({', '.join(COLUMNAS_PLAN_ORDEN)}) VALUES ({marcadores})", filas
+        )
+
+
+def leer_plan_orden(cursor, filtro, parametros):
+    """
+    Órdenes que cumplen 'filtro' (condición SQL sobre las columnas de
+    ORDER_PLAN, con sus parámetros), en un solo scan:
+    {flight_number: {"total_carritos_en_vuelo": n, "carritos": [...]}}.
+    Cada carrito trae sus totales (peso_esperado_carrito_mg,
+    varianza_carrito_g2, tolerancia_carrito_mg) salvo en filas escritas sin
+    ellos. Si la tabla todavía no existe regresa {}.
+    """
+    try:
+        cursor.execute(f"""
+            SELECT flight_number, numero_de_carritos, cart_id, cart_identifier,
+                   peso_esperado_carrito_mg, varianza_carrito_g2, tolerancia_carrito_mg,
+                   product_sku, cantidad_requerida, peso_unitario_g, peso_tolerancia,
+                   numero_cajon, cantidad_cajon
+            FROM Order_Plan
+            WHERE {filtro}
+            ORDER BY flight_number, cart_id, product_sku, numero_cajon
+        """, parametros)
+    except Exception as e:
+        if 'does not exist' in str(e) or 'no such table' in str(e):
+            return {}
+        raise
+
+    ordenes = {}
+    cajones = {}
+    for (flight_number, num_carritos, cart_id, cart_identifier, peso_carrito_mg, varianza_carrito, tolerancia_carrito_mg,
+         sku, cantidad, peso, tolerancia, numero_cajon, cantidad_cajon) in cursor.fetchall():
+        orden = ordenes.setdefault(flight_number, {"total_carritos_en_vuelo": num_carritos, "carritos": {}})
+        carrito = orden["carritos"].get(cart_id)
+        if carrito is None:
+            carrito = orden["carritos"][cart_id] = {
+                "cart_id": cart_id,
+                "cart_identifier": cart_identifier,
+                "items_requeridos": []
+            }
+            # Las filas de tablas que perdieron los totales (columnas re-agregadas) los traen en NULL
+            if None not in (peso_carrito_mg, varianza_carrito, tolerancia_carrito_mg):
+                carrito["peso_esperado_carrito_mg"] = int(peso_carrito_mg)
+                carrito["varianza_carrito_g2"] = float(varianza_carrito)
+                carrito["tolerancia_carrito_mg"] = int(tolerancia_carrito_mg)
+        # Un SKU repartido en varios cajones trae un renglón por cajón
+        if not carrito["items_requeridos"] or carrito["items_requeridos"][-1]["sku"] != sku:
+            carrito["items_requeridos"].append({
+                "sku": sku,
+                "cantidad_requerida": cantidad,
+                "peso_unitario_g": float(peso) if peso is not None else 0.0,
+                "peso_tolerancia": float(tolerancia) if tolerancia is not None else 0.0
+            })
+        if numero_cajon is not None:
+            cajon = cajones.setdefault(cart_id, {}).setdefault(
+                numero_cajon, {"numero_cajon": numero_cajon, "items_requeridos": []})
+            cajon["items_requeridos"].append({"sku": sku, "cantidad_requerida": cantidad_cajon})
+
+    for orden in ordenes.values():
+        for cart_id, carrito in orden["carritos"].items():
+            if cart_id in cajones:
+                carrito["cajones"] = [cajones[cart_id][numero] for numero in sorted(cajones[cart_id])]
+        orden["carritos"] = list(orden["carritos"].values())
+    return ordenes
+
+
+def reconstruir_plan_orden(conn):
+    """
+    Llena ORDER_PLAN para todas las órdenes publicadas a partir del join
+    (órdenes anteriores a la tabla). Regresa el número de vuelos escritos.
+    """
+    from repartir_y_mandar_orden import asegurar_esquema_ordenes, leer_carritos_publicados
+
+    cursor = conn.cursor()
+    asegurar_esquema_ordenes(cursor)
+    cursor.execute("SELECT flight_id, flight_number, departure_date, COALESCE(order_version, 1) FROM Flights")
+    vuelos = cursor.fetchall()
+    try:
+        cursor.execute("BEGIN")
+        for flight_id, flight_number, departure_date, version in vuelos:
+            escribir_plan_orden(cursor, flight_number, departure_date, flight_id, version,
+                                adjuntar_totales(leer_carritos_publicados(cursor, flight_id)))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+    return len(vuelos)
+
+
+SQL_VUELOS_PESOS_VIEJOS = """
+    SELECT DISTINCT op.flight_id, op.flight_number, op.departure_date, op.order_version
+    FROM Order_Plan op
+    JOIN PRODUCTS p ON p.sku = op.product_sku
+    WHERE COALESCE(op.peso_unitario_g, -1) <> COALESCE(p.peso_unitario_g, -1)
+       OR COALESCE(op.peso_tolerancia, -1) <> COALESCE(p.peso_tolerancia, -1)
+       OR op.peso_esperado_carrito_mg IS NULL
+    ORDER BY op.flight_id
+"""
+
+
+def refrescar_pesos_plan_orden(conn):
+    """
+    Reescribe en ORDER_PLAN los vuelos con pesos o tolerancias que ya no
+    coinciden con PRODUCTS (o sin totales), cada uno en su transacción:
+    sube ORDER_VERSION, recalcula los totales con los pesos vigentes y
+    después parcha las caches como una publicación. Un vuelo que se
+    re-publicó en medio ya quedó con los pesos nuevos y se salta.
+    Regresa la lista de vuelos reescritos.
+    """
+    from repartir_y_mandar_orden import asegurar_esquema_ordenes, leer_carritos_publicados, parchar_caches
+
+    cursor = conn.cursor()
+    asegurar_esquema_ordenes(cursor)
+    cursor.execute(SQL_VUELOS_PESOS_VIEJOS)
+    vuelos = cursor.fetchall()
+
+    reescritos = []
+    try:
+        for flight_id, flight_number, departure_date, version in vuelos:
+            try:
+                cursor.execute("BEGIN")
+                cursor.execute("""
+                    UPDATE Flights SET order_version = COALESCE(order_version, 1) + 1
+                    WHERE flight_id = %s AND COALESCE(order_version, 1) = %s
+                """, (flight_id, version))
+                if cursor.rowcount != 1:
+                    conn.rollback()
+                    continue
+                carritos = adjuntar_totales(leer_carritos_publicados(cursor, flight_id))
+                escribir_plan_orden(cursor, flight_number, departure_date, flight_id, version + 1, carritos)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            parchar_caches(flight_number, str(departure_date), carritos, version + 1,
+                           [carrito["cart_id"] for carrito in carritos])
+            reescritos.append({"flight_number": flight_number, "departure_date": str(departure_date),
+                               "version": version + 1})
+    finally:
+        cursor.close()
+    return reescritos
+
+
+# --- MAIN EXECUTION ---
+if __name__ == "__main__":
+    if sys.argv[1:] not in (["--reconstruir"], ["--refrescar-pesos"]):
+        print(json.dumps({"error": "Uso: python3 plan_orden.py --reconstruir | --refrescar-pesos"}))
+        sys.exit(1)
+
+    from conexion import conectar_snowflake
+
+    conn = conectar_snowflake(connect_timeout=30)
+    try:
+        if sys.argv[1] == "--reconstruir":
+            print(json.dumps({"success": True, "vuelos": reconstruir_plan_orden(conn)}))
+        else:
+            print(json.dumps({"success": True, "reescritos": refrescar_pesos_plan_orden(conn)}))
+    except Exception as e:
+        print(json.dumps({"success": False, "error": str(e)}))
+        sys.exit(1)
+    finally:
+        conn.close()
@@ -0,0 +1,58 @@
+"""
+Sub-planes por cajón de los carritos (tabla CART_DRAWERS).
+
+repartir_y_mandar_orden.py escribe un renglón por cajón (cart_id,
+numero_cajon, SKU, cantidad) con motor_reparto.asignar_cajones(). Los
+lectores de órdenes (validate_inventory, crear_orden, precarga_vuelos) agregan
+a cada carrito la lista "cajones" para que el validador compare cada caja
+escaneada contra su propio cajón en lugar de contra el carrito completo.
+"""
+
+SQL_CREAR_TABLA_CAJONES = """
+    CREATE TABLE IF NOT EXISTS Cart_Drawers (
+        cart_id INTEGER NOT NULL,
+        numero_cajon INTEGER NOT NULL,
+        product_sku VARCHAR(50) NOT NULL,
+        cantidad_requerida INTEGER NOT NULL,
+        PRIMARY KEY (cart_id, numero_cajon)
+    )
+"""
+
+
+def leer_cajones(cursor, filtro_carritos, parametros):
+    """
+    Cajones de los carritos que cumplen 'filtro_carritos' (condición SQL sobre
+    los alias f = FLIGHTS y c = CARTS, con sus parámetros).
+    Regresa {cart_id: [{"numero_cajon", "items_requeridos": [{"sku", "cantidad_requerida"}]}]}.
+    Si la tabla todavía no existe (ninguna orden publicada con cajones) regresa {}.
+    """
+    try:
+        cursor.execute(f"""
+            SELECT cd.cart_id, cd.numero_cajon, cd.product_sku, cd.cantidad_requerida
+            FROM Cart_Drawers cd
+            JOIN Carts c ON cd.cart_id = c.cart_id
+            JOIN Flights f ON c.flight_id = f.flight_id
+            WHERE {filtro_carritos}
+            ORDER BY cd.cart_id, cd.numero_cajon, cd.product_sku
+        """, parametros)
+    except Exception as e:
+        if 'does not exist' in str(e) or 'no such table' in str(e):
+            return {}
+        raise
+
+    cajones_por_carrito = {}
+    for cart_id, numero_cajon, sku, cantidad in cursor.fetchall():
+        cajones = cajones_por_carrito.setdefault(cart_id, {})
+        cajon = cajones.setdefault(numero_cajon, {"numero_cajon": numero_cajon, "items_requeridos": []})
+        cajon["items_requeridos"].append({"sku": sku, "cantidad_requerida": cantidad})
+
+    return {cart_id: list(cajones.values()) for cart_id, cajones in cajones_por_carrito.items()}
+
+
+def adjuntar_cajones(carritos, cajones_por_carrito):
+    """Agrega 'cajones' a cada carrito que tenga sub-plan (los demás quedan igual)"""
+    for carrito in carritos:
+        cajones = cajones_por_carrito.get(carrito["cart_id"])
+        if cajones:
+            carrito["cajones"] = cajones
+    return carritos
@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""
+Precarga de órdenes de las próximas salidas en la cache local de órdenes.
+
+Los vuelos se conocen con horas de anticipación (FLIGHTS.DEPARTURE_DATE), así
+que en lugar de esperar a que una estación pida la orden, este script busca las
+salidas dentro del horizonte, trae sus carritos en lotes
+(WHERE FLIGHT_NUMBER IN (...)) junto con el catálogo, y deja las entradas que
+leen crear_orden.py, validate_inventory.py y catalogo_productos.py (ver
+cargador_ordenes.py). El
+primer escaneo de cada vuelo es entonces un acierto de cache.
+
+Uso:
+    python3 precarga_vuelos.py                  # una pasada (para cron)
+    python3 precarga_vuelos.py --cada 15        # repetir cada 15 minutos
+    python3 precarga_vuelos.py --horizonte 24   # salidas de las próximas 24 horas
+"""
+
+import json
+import os
+import sys
+import time
+
+from almacen_planes import limpiar_vencidos, publicar_orden
+from cargador_ordenes import escribir_entrada, ruta_entrada
+from catalogo_productos import guardar_catalogo
+from conexion import conectar_snowflake
+from plan_orden import leer_plan_orden
+from planes_cajones import adjuntar_cajones, leer_cajones
+from resiliencia_ordenes import guardar_respaldo_orden
+from resolutor_skus import guardar_indice
+
+# Horas hacia adelante que se consideran "próximas salidas"
+HORIZONTE_HORAS = int(os.getenv('PRECARGA_HORIZONTE_HORAS', '12'))
+
+# Vuelos por consulta IN (...)
+TAMANO_LOTE = 50
+
+# Vigencia de una orden precargada; re-publicar una orden invalida su entrada antes
+TTL_PRECARGA_S = float(os.getenv('PRECARGA_TTL_S', str(6 * 3600)))
+
+
+def get_connection():
+    """Crea y regresa una conexión a Snowflake"""
+    return conectar_snowflake(connect_timeout=30)
+
+
+def vuelos_proximos(cursor, horizonte_horas):
+    """Números de vuelo con salida entre hoy y el horizonte"""
+    cursor.execute("""
+        SELECT DISTINCT FLIGHT_NUMBER
+        FROM FLIGHTS
+        WHERE DEPARTURE_DATE >= CURRENT_DATE()
+          AND DEPARTURE_DATE <= TO_DATE(DATEADD(hour, %s, CURRENT_TIMESTAMP()))
+        ORDER BY FLIGHT_NUMBER
+    """, (horizonte_horas,))
+    return [row[0] for row in cursor.fetchall()]
+
+
+def consultar_lote(cursor, vuelos):
+    """
+    Trae las órdenes de varios vuelos en un solo scan de ORDER_PLAN
+    (plan_orden.py); los vuelos que no están ahí salen del join.
+    Regresa {flight_number: {"total_carritos_en_vuelo": n, "carritos": [...]}}.
+    """
+    marcadores = ", ".join(["%s"] * len(vuelos))
+    ordenes = leer_plan_orden(cursor, f"flight_number IN ({marcadores})", tuple(vuelos))
+    faltantes = [flight_number for flight_number in vuelos if flight_number not in ordenes]
+    if faltantes:
+        ordenes.update(consultar_lote_join(cursor, faltantes))
+    return ordenes
+
+
+def consultar_lote_join(cursor, vuelos):
+    """Las órdenes de varios vuelos con el join completo, en una sola consulta"""
+    marcadores = ", ".join(["%s"] * len(vuelos))
+    cursor.execute(f"""
+        SELECT
+            f.FLIGHT_NUMBER,
+            f.NUMERO_DE_CARRITOS,
+            c.CART_ID,
+            c.CART_IDENTIFIER,
+            p.SKU,
+            ci.CANTIDAD_REQUERIDA,
+            p.PESO_UNITARIO_G,
+            p.PESO_TOLERANCIA
+        FROM FLIGHTS f
+        JOIN CARTS c ON f.FLIGHT_ID = c.FLIGHT_ID
+        JOIN CART_ITEMS ci ON c.CART_ID = ci.CART_ID
+        JOIN PRODUCTS p ON ci.PRODUCT_SKU = p.SKU
+        WHERE f.FLIGHT_NUMBER IN ({marcadores})
+        ORDER BY f.FLIGHT_NUMBER, c.CART_ID, p.SKU
+    """, tuple(vuelos))
+
+    ordenes = {}
+    for flight_number, num_carritos, cart_id, cart_identifier, sku, cantidad, peso, tolerancia in cursor:
+        orden = ordenes.setdefault(flight_number, {"total_carritos_en_vuelo": num_carritos, "carritos": {}})
+        carrito = orden["carritos"].setdefault(cart_id, {
+            "cart_id": cart_id,
+            "cart_identifier": cart_identifier,
+            "items_requeridos": []
+        })
+        carrito["items_requeridos"].append({
+            "sku": sku,
+            "cantidad_requerida": cantidad,
+            "peso_unitario_g": float(peso) if peso is not None else 0.0,
+            "peso_tolerancia": float(tolerancia) if tolerancia is not None else 0.0
+        })
+
+    cajones_por_carrito = leer_cajones(cursor, f"f.FLIGHT_NUMBER IN ({marcadores})", tuple(vuelos)) if ordenes else {}
+    for orden in ordenes.values():
+        orden["carritos"] = adjuntar_cajones(list(orden["carritos"].values()), cajones_por_carrito)
+    return ordenes
+
+
+def guardar_en_cache(flight_number, orden):
+    """
+    Escribe las entradas que consumen crear_orden.py y validate_inventory.py,
+    el respaldo de la orden y su copia en el almacén de planes
+    """
+    escribir_entrada(ruta_entrada('crear_orden', flight_number, None), {
+        "flight_number": flight_number,
+        "total_carritos_en_vuelo": orden["total_carritos_en_vuelo"],
+        "carritos": orden["carritos"]
+    }, TTL_PRECARGA_S)
+
+    orden_vuelo = {
+        "flight_number": flight_number,
+        "carritos": orden["carritos"]
+    }
+    escribir_entrada(ruta_entrada('orden_vuelo', flight_number, None), orden_vuelo, TTL_PRECARGA_S)
+
+    # Respaldo para cuando el warehouse no responda al momento de validar
+    guardar_respaldo_orden(flight_number, orden_vuelo)
+
+    # Y la orden codificada en el almacén compartido que leen los validadores
+    try:
+        publicar_orden(flight_number, orden_vuelo, TTL_PRECARGA_S)
+    except (OSError, ValueError) as e:
+        print(f"Advertencia: no se pudo publicar {flight_number} en el almacén de planes: {e}", file=sys.stderr)
+
+
+def precargar(horizonte_horas=HORIZONTE_HORAS):
+    """Una pasada de precarga. Regresa un resumen en JSON."""
+    inicio = time.time()
+    conn = None
+    try:
+        conn = get_connection()
+        cursor = conn.cursor()
+
+        vuelos = vuelos_proximos(cursor, horizonte_horas)
+        if not vuelos:
+            return {"success": True, "vuelos_precargados": 0, "vuelos_sin_carritos": []}
+
+        cursor.execute("SELECT sku, product_name FROM PRODUCTS ORDER BY product_name;")
+        filas_catalogo = [(row[0], row[1]) for row in cursor.fetchall()]
+
+        # Deja listos el índice de etiquetas -> SKU (solo se reconstruye si cambió
+        # el catálogo) y los nombres que piden las estaciones
+        try:
+            guardar_indice(filas_catalogo)
+            guardar_catalogo(filas_catalogo)
+        except OSError as e:
+            print(f"Advertencia: no se pudo guardar el índice de SKUs o el catálogo: {e}", file=sys.stderr)
+
+        precargados = []
+        for i in range(0, len(vuelos), TAMANO_LOTE):
+            lote = vuelos[i:i + TAMANO_LOTE]
+            ordenes = consultar_lote(cursor, lote)
+            for flight_number, orden in ordenes.items():
+                guardar_en_cache(flight_number, orden)
+                precargados.append(flight_number)
+            print(f"  Lote {i // TAMANO_LOTE + 1}: {len(ordenes)}/{len(lote)} vuelos con carritos", file=sys.stderr)
+
+        try:
+            limpiar_vencidos()
+        except OSError as e:
+            print(f"Advertencia: no se pudo limpiar el almacén de planes: {e}", file=sys.stderr)
+
+        return {
+            "success": True,
+            "vuelos_precargados": len(precargados),
+            "vuelos_sin_carritos": sorted(set(vuelos) - set(precargados)),
+            "duracion_s": round(time.time() - inicio, 2)
+        }
+
+    except Exception as e:
+        print(f"Error en precarga de vuelos: {e}", file=sys.stderr)
+        return {"success": False, "error": str(e)}
+    finally:
+        if conn:
+            conn.close()
+
+
+def _valor_argumento(argumentos, nombre, default):
+    if nombre not in argumentos:
+        return default
+    i = argumentos.index(nombre)
+    try:
+        return int(argumentos[i + 1])
+    except (IndexError, ValueError):
+        print(json.dumps({"error": f"{nombre} requiere un número entero"}))
+        sys.exit(1)
+
+
+# --- MAIN EXECUTION ---
+if __name__ == "__main__":
+    argumentos = sys.argv[1:]
+    cada_minutos = _valor_argumento(argumentos, "--cada", None)
+    horizonte = _valor_argumento(argumentos, "--horizonte", HORIZONTE_HORAS)
+
+    while True:
+        resultado = precargar(horizonte)
+        print(json.dumps(resultado, ensure_ascii=False), flush=True)
+        if cada_minutos is None:
+            break
+        time.sleep(cada_minutos * 60)
+
+    if not resultado.get("success"):
+        sys.exit(1)
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+Publicación masiva de órdenes maestras para muchos vuelos y fechas.
+
+Lee un archivo de órdenes, reparte los carritos de todos los vuelos en
+paralelo (pool de procesos, con los pesos de PRODUCTS) y publica cada uno
+sobre una sola conexión a Snowflake con publicar_reparto(): un diff por vuelo
+en su propia transacción, con inserciones/actualizaciones en lote. Un vuelo
+que falla no detiene a los demás.
+
+Formatos de entrada:
+    JSON: [{"flight_number": "AM241", "departure_date": "2025-10-25",
+            "orden": {"agua_600ml": 200, ...}}, ...]
+    CSV:  flight_number,departure_date,sku,cantidad   (una fila por SKU)
+
+Uso:
+    python3 publicar_ordenes.py ordenes.json [--limite 300] [--workers N]
+"""
+
+import csv
+import json
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from conexion import conectar_snowflake
+from repartir_y_mandar_orden import (
+    MAX_ITEMS_POR_CARRITO,
+    asegurar_esquema_ordenes,
+    leer_pesos_productos,
+    publicar_reparto,
+    repartir_carritos,
+    skus_desconocidos,
+)
+
+
+def _validar_cantidad(valor, contexto):
+    try:
+        cantidad = int(valor)
+    except (TypeError, ValueError):
+        raise ValueError(f"{contexto}: cantidad inválida '{valor}'")
+    if cantidad <= 0:
+        raise ValueError(f"{contexto}: la cantidad debe ser positiva")
+    return cantidad
+
+
+def leer_ordenes(ruta):
+    """
+    Regresa [(flight_number, departure_date, {sku: cantidad}), ...] en el orden
+    del archivo. Un mismo (vuelo, fecha) repetido es un error.
+    """
+    ordenes = {}
+
+    if ruta.lower().endswith('.csv'):
+        with open(ruta, 'r', encoding='utf-8', newline='') as f:
+            for linea, fila in enumerate(csv.DictReader(f), start=2):
+                clave = ((fila.get('flight_number') or '').strip(), (fila.get('departure_date') or '').strip())
+                sku = (fila.get('sku') or '').strip()
+                if not all(clave) or not sku:
+                    raise ValueError(f"Línea {linea}: flight_number, departure_date y sku son requeridos")
+                orden = ordenes.setdefault(clave, {})
+                if sku in orden:
+                    raise ValueError(f"Línea {linea}: SKU {sku} repetido para {clave[0]} {clave[1]}")
+                orden[sku] = _validar_cantidad(fila.get('cantidad'), f"Línea {linea}")
+    else:
+        with open(ruta, 'r', encoding='utf-8') as f:
+            entradas = json.load(f)
+        if not isinstance(entradas, list):
+            raise ValueError("El JSON debe ser una lista de órdenes")
+        for i, entrada in enumerate(entradas):
+            clave = (entrada.get('flight_number'), entrada.get('departure_date'))
+            orden = entrada.get('orden')
+            if not all(clave) or not isinstance(orden, dict) or not orden:
+                raise ValueError(f"Orden #{i}: flight_number, departure_date y orden son requeridos")
+            if clave in ordenes:
+                raise ValueError(f"Orden #{i}: {clave[0]} {clave[1]} repetido")
+            ordenes[clave] = {sku: _validar_cantidad(c, f"Orden #{i} ({sku})") for sku, c in orden.items()}
+
+    return [(flight_number, fecha, orden) for (flight_number, fecha), orden in ordenes.items()]
+
+
+def _repartir_cronometrado(argumentos):
+    orden, limite_items, pesos_g = argumentos
+    inicio = time.perf_counter()
+    reparto = repartir_carritos(orden, limite_items, detallado=False, pesos_g=pesos_g)
+    return reparto, (time.perf_counter() - inicio) * 1000
+
+
+def publicar_ordenes(ordenes, limite_items=MAX_ITEMS_POR_CARRITO, workers=None):
+    """Reparte en paralelo y publica todas las órdenes. Regresa el resumen en JSON."""
+    inicio = time.time()
+    por_vuelo = []
+    conn = None
+    try:
+        conn = conectar_snowflake(connect_timeout=30)
+        asegurar_esquema_ordenes(conn.cursor())
+
+        # Un solo viaje por los pesos de todos los SKUs del archivo
+        pesos_g = leer_pesos_productos(conn.cursor(), {sku for _, _, orden in ordenes for sku in orden})
+
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            repartos = list(pool.map(
+                _repartir_cronometrado,
+                [(orden, limite_items, {sku: pesos_g.get(sku, 0.0) for sku in orden}) for _, _, orden in ordenes],
+                chunksize=max(1, len(ordenes) // 32)
+            ))
+
+        for (flight_number, fecha, orden), (reparto, reparto_ms) in zip(ordenes, repartos):
+            inicio_vuelo = time.perf_counter()
+            desconocidos = skus_desconocidos(orden, pesos_g)
+            try:
+                if desconocidos:
+                    raise ValueError(f"SKUs que no existen en PRODUCTS: {', '.join(desconocidos)}")
+                resultado = publicar_reparto(conn, flight_number, fecha, reparto["carritos"], detallado=False)
+                resultado["utilizacion"] = reparto["utilizacion"]
+            except Exception as e:
+                resultado = {"success": False, "error": str(e)}
+            resultado.update({
+                "flight_number": flight_number,
+                "departure_date": fecha,
+                "reparto_ms": round(reparto_ms, 1),
+                "publicacion_ms": round((time.perf_counter() - inicio_vuelo) * 1000, 1)
+            })
+            resultado.pop("message", None)
+            por_vuelo.append(resultado)
+
+            estado = "OK" if resultado["success"] else f"ERROR: {resultado['error']}"
+            print(f"  {flight_number} {fecha}: {estado} ({resultado['publicacion_ms']} ms)", file=sys.stderr)
+
+    except Exception as e:
+        print(f"Error en la publicación masiva: {e}", file=sys.stderr)
+        return {"success": False, "error": str(e), "por_vuelo": por_vuelo}
+    finally:
+        if conn:
+            conn.close()
+
+    fallidos = [r for r in por_vuelo if not r["success"]]
+    sin_cambios = [r for r in por_vuelo if r["success"] and not any(r["cambios"].values())]
+    return {
+        "success": not fallidos,
+        "vuelos": len(ordenes),
+        "publicados": len(por_vuelo) - len(fallidos) - len(sin_cambios),
+        "sin_cambios": len(sin_cambios),
+        "con_error": len(fallidos),
+        "duracion_s": round(time.time() - inicio, 2),
+        "por_vuelo": por_vuelo
+    }
+
+
+def _valor_argumento(argumentos, nombre, default):
+    if nombre not in argumentos:
+        return default
+    i = argumentos.index(nombre)
+    try:
+        return int(argumentos[i + 1])
+    except (IndexError, ValueError):
+        print(json.dumps({"error": f"{nombre} requiere un número entero"}))
+        sys.exit(1)
+
+
+# --- MAIN EXECUTION ---
+if __name__ == "__main__":
+    argumentos = sys.argv[1:]
+    if not argumentos or argumentos[0].startswith("--"):
+        print(json.dumps({"error": "Uso: python3 publicar_ordenes.py <ordenes.json|ordenes.csv> [--limite N] [--workers N]"}))
+        sys.exit(1)
+
+    try:
+        ordenes = leer_ordenes(argumentos[0])
+    except (OSError, ValueError) as e:
+        print(json.dumps({"error": f"No se pudo leer {argumentos[0]}: {e}"}, ensure_ascii=False))
+        sys.exit(1)
+
+    resultado = publicar_ordenes(
+        ordenes,
+        limite_items=_valor_argumento(argumentos, "--limite", MAX_ITEMS_POR_CARRITO),
+        workers=_valor_argumento(argumentos, "--workers", None)
+    )
+    print(json.dumps(resultado, ensure_ascii=False))
+
+    if not resultado.get("success"):
+        sys.exit(1)
@@ -1,21 +1,17 @@
 #!/usr/bin/env python3
-import snowflake.connector
 import json
 import sys
-import os
+import time
 from datetime import date
-from dotenv import load_dotenv
 
-# Load environment variables
-load_dotenv()
-
-# --- SNOWFLAKE CONFIGURATION ---
-SNOWFLAKE_USER = os.getenv('SNOWFLAKE_USER')
-SNOWFLAKE_PASSWORD = os.getenv('SNOWFLAKE_PASSWORD')
-SNOWFLAKE_ACCOUNT = os.getenv('SNOWFLAKE_ACCOUNT')
-SNOWFLAKE_WAREHOUSE = os.getenv('SNOWFLAKE_WAREHOUSE')
-SNOWFLAKE_DATABASE = os.getenv('SNOWFLAKE_DATABASE')
-SNOWFLAKE_SCHEMA = os.getenv('SNOWFLAKE_SCHEMA')
+from almacen_planes import invalidar_planes
+from cache_validaciones import marcar_republicacion
+from cargador_ordenes import invalidar, invalidar_prefijo, parchar_entrada
+from conexion import conectar_snowflake
+from motor_reparto import CAJONES_POR_CARRITO, MAX_PESO_POR_CARRITO_G, asignar_cajones, repartir
+from plan_orden import SQL_CREAR_TABLA_PLAN_ORDEN, adjuntar_totales, escribir_plan_orden
+from planes_cajones import SQL_CREAR_TABLA_CAJONES, adjuntar_cajones, leer_cajones
+from resiliencia_ordenes import guardar_respaldo_orden
 
 # --- DEFAULT VALUES (MASTER ORDER) ---
 ORDEN_MAESTRA_AM241 = {
@@ -27,110 +23,386 @@ MAX_ITEMS_POR_CARRITO = 300
 
 
 # --- CART DISTRIBUTION LOGIC ---
-def repartir_carritos(orden_maestra, limite_items):
+def repartir_carritos(orden_maestra, limite_items, detallado=True, pesos_g=None, modo='auto'):
     """
-    Toma la orden total y la divide en una lista de carritos.
+    Toma la orden total y la divide en carritos respetando ítems, peso y
+    cajones por carrito (ver motor_reparto.py).
+    Regresa {"carritos": [{sku: cantidad}, ...], "utilizacion": [...], "modo": ...}.
     """
-    print(f"Iniciando reparto. Límite de {limite_items} ítems por carrito.")
-    lista_de_carritos = []
-    current_cart_items = {}
-    current_cart_count = 0
-    items_ordenados = sorted(orden_maestra.items(), key=lambda item: item[1], reverse=True)
-
-    for sku, cantidad in items_ordenados:
-        if (current_cart_count + cantidad) <= limite_items:
-            current_cart_items[sku] = cantidad
-            current_cart_count += cantidad
-        else:
-            if current_cart_items:
-                lista_de_carritos.append(current_cart_items)
-            current_cart_items = {sku: cantidad}
-            current_cart_count = cantidad
+    if detallado:
+        print(f"Iniciando reparto. Límite de {limite_items} ítems, {MAX_PESO_POR_CARRITO_G / 1000:g} kg "
+              f"y {CAJONES_POR_CARRITO} cajones por carrito.")
+    reparto = repartir(orden_maestra, pesos_g, max_items=limite_items, modo=modo)
+
+    if detallado:
+        print(f"Reparto finalizado ({reparto['modo']}). Se generaron {len(reparto['carritos'])} carritos.")
+    return reparto
+
+
+def leer_pesos_productos(cursor, skus):
+    """{sku: PESO_UNITARIO_G} de los SKUs que existen en PRODUCTS"""
+    skus = sorted(set(skus))
+    if not skus:
+        return {}
+    marcadores = ", ".join(["%s"] * len(skus))
+    cursor.execute(f"SELECT sku, peso_unitario_g FROM Products WHERE sku IN ({marcadores})", tuple(skus))
+    return {sku: float(peso) if peso is not None else 0.0 for sku, peso in cursor.fetchall()}
 
-    if current_cart_items:
-        lista_de_carritos.append(current_cart_items)
 
-    print(f"Reparto finalizado. Se generaron {len(lista_de_carritos)} carritos.")
-    return lista_de_carritos
+def skus_desconocidos(orden_maestra, pesos_g):
+    return sorted(sku for sku in orden_maestra if sku not in pesos_g)
 
 
 # --- DATABASE LOGIC ---
-def mandar_orden_a_db(flight_number, departure_date_str, orden_maestra, limite_items):
+def identificador_carrito(numero):
+    """Identificador estable del carrito N de un vuelo; el diff empareja carritos por él"""
+    return f"Carrito {numero} - Mixto"
+
+
+def asegurar_esquema_ordenes(cursor):
     """
-    Toma la orden maestra, la reparte, borra la orden vieja (si existe)
-    e inserta la nueva orden, incluyendo el NÚMERO DE CARRITOS en el vuelo.
+    Agrega FLIGHTS.ORDER_VERSION y las tablas Cart_Drawers y Order_Plan si no
+    existen (DDL: va fuera de la transacción). Vuelve a agregar a Order_Plan
+    los totales por carrito en tablas que los habían perdido; esas filas
+    quedan en NULL hasta `plan_orden.py --refrescar-pesos`.
     """
+    cursor.execute("ALTER TABLE Flights ADD COLUMN IF NOT EXISTS order_version INTEGER DEFAULT 1")
+    cursor.execute(SQL_CREAR_TABLA_CAJONES)
+    cursor.execute(SQL_CREAR_TABLA_PLAN_ORDEN)
+    cursor.execute("""
+        ALTER TABLE Order_Plan ADD COLUMN IF NOT EXISTS peso_esperado_carrito_mg INTEGER,
+            varianza_carrito_g2 FLOAT, tolerancia_carrito_mg INTEGER
+    """)
 
-    lista_de_carritos = repartir_carritos(orden_maestra, limite_items)
-    numero_total_carritos = len(lista_de_carritos)
 
-    print("\n--- PLAN DE REPARTO GENERADO ---")
-    for i, carrito in enumerate(lista_de_carritos):
-        print(f"  Carrito {i + 1}: Total ítems: {sum(carrito.values())} -> {carrito}")
+def leer_orden_actual(cursor, flight_number, departure_date_str):
+    """
+    Orden publicada del vuelo en esa fecha, o None si no existe:
+    {"flight_id", "version",
+     "carritos": {cart_identifier: {"cart_id", "items": {sku: cantidad}, "cajones": [(n, sku, cantidad)]}}}
+    """
+    cursor.execute("""
+        SELECT f.flight_id, COALESCE(f.order_version, 1), c.cart_id, c.cart_identifier,
+               ci.product_sku, ci.cantidad_requerida
+        FROM Flights f
+        LEFT JOIN Carts c ON f.flight_id = c.flight_id
+        LEFT JOIN Cart_Items ci ON c.cart_id = ci.cart_id
+        WHERE f.flight_number = %s AND f.departure_date = %s
+        ORDER BY c.cart_id
+    """, (flight_number, departure_date_str))
+
+    orden = None
+    for flight_id, version, cart_id, cart_identifier, sku, cantidad in cursor.fetchall():
+        if orden is None:
+            orden = {"flight_id": flight_id, "version": version, "carritos": {}}
+        if cart_id is None:
+            continue
+        carrito = orden["carritos"].setdefault(cart_identifier, {"cart_id": cart_id, "items": {}, "cajones": []})
+        if sku is not None:
+            carrito["items"][sku] = cantidad
 
-    conn = None
-    try:
-        conn = snowflake.connector.connect(
-            user=SNOWFLAKE_USER, password=SNOWFLAKE_PASSWORD,
-            account=SNOWFLAKE_ACCOUNT, warehouse=SNOWFLAKE_WAREHOUSE,
-            database=SNOWFLAKE_DATABASE, schema=SNOWFLAKE_SCHEMA
+    if orden is not None and orden["carritos"]:
+        cajones_por_carrito = leer_cajones(cursor, "f.flight_number = %s AND f.departure_date = %s",
+                                           (flight_number, departure_date_str))
+        for carrito in orden["carritos"].values():
+            carrito["cajones"] = [
+                (cajon["numero_cajon"], item["sku"], item["cantidad_requerida"])
+                for cajon in cajones_por_carrito.get(carrito["cart_id"], [])
+                for item in cajon["items_requeridos"]
+            ]
+    return orden
+
+
+def _cajones_de(contenido):
+    return [(cajon["numero_cajon"], cajon["sku"], cajon["cantidad"]) for cajon in asignar_cajones(contenido)]
+
+
+def calcular_delta(carritos_actuales, lista_de_carritos):
+    """
+    Diferencia entre la orden publicada y el nuevo reparto.
+    Los carritos se emparejan por identificador ("Carrito N - Mixto"). Los
+    cajones de un carrito se reescriben solo si su sub-plan cambió (o si el
+    carrito se publicó antes de que existieran los cajones).
+    """
+    delta = {
+        "carritos_nuevos": [],       # [(cart_identifier, {sku: cantidad})]
+        "carritos_eliminados": [],   # [cart_id]
+        "items_insertar": [],        # [(cart_id, sku, cantidad)]
+        "items_actualizar": [],      # [(cantidad, cart_id, sku)]
+        "items_eliminar": [],        # [(cart_id, sku)]
+        "cajones_reescribir": [],    # [(cart_id, [(numero_cajon, sku, cantidad)])]
+    }
+    nuevos_identificadores = set()
+
+    for i, items_nuevos in enumerate(lista_de_carritos):
+        cart_identifier = identificador_carrito(i + 1)
+        nuevos_identificadores.add(cart_identifier)
+        actual = carritos_actuales.get(cart_identifier)
+        if actual is None:
+            delta["carritos_nuevos"].append((cart_identifier, items_nuevos))
+            continue
+
+        cart_id, items_actuales = actual["cart_id"], actual["items"]
+        for sku, cantidad in items_nuevos.items():
+            if sku not in items_actuales:
+                delta["items_insertar"].append((cart_id, sku, cantidad))
+            elif items_actuales[sku] != cantidad:
+                delta["items_actualizar"].append((cantidad, cart_id, sku))
+        for sku in items_actuales:
+            if sku not in items_nuevos:
+                delta["items_eliminar"].append((cart_id, sku))
+
+        cajones_nuevos = _cajones_de(items_nuevos)
+        if sorted(actual["cajones"]) != sorted(cajones_nuevos):
+            delta["cajones_reescribir"].append((cart_id, cajones_nuevos))
+
+    for cart_identifier, actual in carritos_actuales.items():
+        if cart_identifier not in nuevos_identificadores:
+            delta["carritos_eliminados"].append(actual["cart_id"])
+
+    return delta
+
+
+def resumen_delta(delta):
+    return {
+        "carritos_nuevos": len(delta["carritos_nuevos"]),
+        "carritos_eliminados": len(delta["carritos_eliminados"]),
+        "items_insertados": len(delta["items_insertar"]) + sum(len(items) for _, items in delta["carritos_nuevos"]),
+        "items_actualizados": len(delta["items_actualizar"]),
+        "items_eliminados": len(delta["items_eliminar"]),
+        "carritos_con_cajones_reescritos": len(delta["cajones_reescribir"]),
+    }
+
+
+def aplicar_delta(cursor, flight_id, delta):
+    """Aplica solo las filas que cambiaron. Los carritos sin cambios (y sus escaneos) no se tocan."""
+    if delta["carritos_eliminados"]:
+        marcadores = ", ".join(["%s"] * len(delta["carritos_eliminados"]))
+        ids = tuple(delta["carritos_eliminados"])
+        # Un carrito que desaparece del reparto se lleva sus escaneos
+        cursor.execute(f"DELETE FROM Scan_Records WHERE cart_id IN ({marcadores})", ids)
+        cursor.execute(f"DELETE FROM Cart_Drawers WHERE cart_id IN ({marcadores})", ids)
+        cursor.execute(f"DELETE FROM Cart_Items WHERE cart_id IN ({marcadores})", ids)
+        cursor.execute(f"DELETE FROM Carts WHERE cart_id IN ({marcadores})", ids)
+
+    if delta["items_eliminar"]:
+        cursor.executemany("DELETE FROM Cart_Items WHERE cart_id = %s AND product_sku = %s",
+                           delta["items_eliminar"])
+    if delta["items_actualizar"]:
+        cursor.executemany("UPDATE Cart_Items SET cantidad_requerida = %s WHERE cart_id = %s AND product_sku = %s",
+                           delta["items_actualizar"])
+
+    items_insertar = list(delta["items_insertar"])
+    cajones_reescribir = list(delta["cajones_reescribir"])
+    if delta["carritos_nuevos"]:
+        cursor.executemany("INSERT INTO Carts (flight_id, cart_identifier) VALUES (%s, %s)",
+                           [(flight_id, cart_identifier) for cart_identifier, _ in delta["carritos_nuevos"]])
+        cursor.execute("SELECT cart_identifier, cart_id FROM Carts WHERE flight_id = %s", (flight_id,))
+        ids_por_identificador = dict(cursor.fetchall())
+        for cart_identifier, items in delta["carritos_nuevos"]:
+            new_cart_id = ids_por_identificador[cart_identifier]
+            items_insertar.extend((new_cart_id, sku, cantidad) for sku, cantidad in items.items())
+            cajones_reescribir.append((new_cart_id, _cajones_de(items)))
+
+    if items_insertar:
+        cursor.executemany("INSERT INTO Cart_Items (cart_id, product_sku, cantidad_requerida) VALUES (%s, %s, %s)",
+                           items_insertar)
+
+    if cajones_reescribir:
+        marcadores = ", ".join(["%s"] * len(cajones_reescribir))
+        cursor.execute(f"DELETE FROM Cart_Drawers WHERE cart_id IN ({marcadores})",
+                       tuple(cart_id for cart_id, _ in cajones_reescribir))
+        cursor.executemany(
+            "INSERT INTO Cart_Drawers (cart_id, numero_cajon, product_sku, cantidad_requerida) VALUES (%s, %s, %s, %s)",
+            [(cart_id, numero, sku, cantidad) for cart_id, cajones in cajones_reescribir for numero, sku, cantidad in cajones]
         )
-        cursor = conn.cursor()
-        print(f"\nConectado a Snowflake. Mandando orden para {flight_number}...")
-
-        # Borrar orden vieja
-        cursor.execute("SELECT flight_id FROM Flights WHERE flight_number = %s AND departure_date = %s",
-                       (flight_number, departure_date_str))
-        resultado = cursor.fetchone()
-
-        if resultado:
-            old_flight_id = resultado[0]
-            print(f"Vuelo anterior encontrado (ID: {old_flight_id}). Borrando orden vieja...")
-            cursor.execute("DELETE FROM Scan_Records WHERE cart_id IN (SELECT cart_id FROM Carts WHERE flight_id = %s)",
-                           (old_flight_id,))
-            cursor.execute("DELETE FROM Cart_Items WHERE cart_id IN (SELECT cart_id FROM Carts WHERE flight_id = %s)",
-                           (old_flight_id,))
-            cursor.execute("DELETE FROM Carts WHERE flight_id = %s", (old_flight_id,))
-            cursor.execute("DELETE FROM Flights WHERE flight_id = %s", (old_flight_id,))
-            print("Orden vieja borrada.")
+
+
+def leer_carritos_publicados(cursor, flight_id):
+    """Carritos del vuelo con el formato de las entradas de cache (cargador_ordenes.py)"""
+    cursor.execute("""
+        SELECT c.cart_id, c.cart_identifier, p.sku, ci.cantidad_requerida, p.peso_unitario_g, p.peso_tolerancia
+        FROM Carts c
+        JOIN Cart_Items ci ON c.cart_id = ci.cart_id
+        JOIN Products p ON ci.product_sku = p.sku
+        WHERE c.flight_id = %s
+        ORDER BY c.cart_id, p.sku
+    """, (flight_id,))
+
+    carritos = {}
+    for cart_id, cart_identifier, sku, cantidad, peso, tolerancia in cursor.fetchall():
+        carrito = carritos.setdefault(cart_id, {
+            "cart_id": cart_id,
+            "cart_identifier": cart_identifier,
+            "items_requeridos": []
+        })
+        carrito["items_requeridos"].append({
+            "sku": sku,
+            "cantidad_requerida": cantidad,
+            "peso_unitario_g": float(peso) if peso is not None else 0.0,
+            "peso_tolerancia": float(tolerancia) if tolerancia is not None else 0.0
+        })
+    return adjuntar_cajones(list(carritos.values()), leer_cajones(cursor, "c.flight_id = %s", (flight_id,)))
+
+
+def parchar_caches(flight_number, departure_date_str, carritos, version, cart_ids_previos):
+    """
+    Actualiza en su lugar las entradas de cache de la orden en vez de borrarlas.
+    Las entradas sin fecha ('any') solo se parchan si todos sus carritos son de
+    este vuelo/fecha; si mezclan otra fecha se invalidan. Las órdenes
+    filtradas por carrito, la copia del almacén de planes (almacen_planes.py)
+    y los reportes de validación del vuelo sí se descartan (cache_validaciones.py).
+    """
+    cart_ids_propios = set(cart_ids_previos) | {carrito["cart_id"] for carrito in carritos}
+
+    def parche(resultado):
+        if not {c["cart_id"] for c in resultado.get("carritos", [])} <= cart_ids_propios:
+            return None
+        resultado = dict(resultado, carritos=carritos, order_version=version)
+        if "total_carritos_en_vuelo" in resultado:
+            resultado["total_carritos_en_vuelo"] = len(carritos)
+        return resultado
+
+    for tipo, clave in (('crear_orden', (flight_number, departure_date_str)),
+                        ('crear_orden', (flight_number, None)),
+                        ('orden_vuelo', (flight_number, None))):
+        try:
+            parchar_entrada(tipo, clave, parche)
+        except OSError as e:
+            print(f"Advertencia: no se pudo parchar la cache {tipo} de {flight_number}: {e}", file=sys.stderr)
+            invalidar(tipo, *clave)
+
+    # El respaldo de la orden (resiliencia_ordenes.py) se conserva aunque no se pueda
+    # parchar, y se crea si el vuelo todavía no tenía
+    def parche_respaldo(resultado):
+        parchado = parche(resultado)
+        return resultado if parchado is None else dict(parchado, guardada=time.time())
+
+    try:
+        parchado = parchar_entrada('respaldo_orden', (flight_number,), parche_respaldo)
+    except OSError as e:
+        print(f"Advertencia: no se pudo parchar el respaldo de {flight_number}: {e}", file=sys.stderr)
+    else:
+        if not parchado:
+            guardar_respaldo_orden(flight_number, {"flight_number": flight_number, "carritos": carritos,
+                                                   "order_version": version})
+
+    # Las órdenes filtradas por carrito, el almacén de planes y los reportes
+    # de validación eran de la versión anterior
+    try:
+        invalidar_prefijo('orden_carritos', flight_number)
+        invalidar_planes(flight_number)
+        marcar_republicacion(flight_number, departure_date_str, version)
+    except OSError as e:
+        print(f"Advertencia: no se pudieron invalidar las validaciones de {flight_number}: {e}", file=sys.stderr)
+
+
+def publicar_reparto(conn, flight_number, departure_date_str, lista_de_carritos, detallado=True):
+    """
+    Publica un reparto ya calculado sobre una conexión abierta: aplica solo la
+    diferencia contra la orden existente, en una sola transacción. Cada
+    publicación con cambios sube FLIGHTS.ORDER_VERSION y reescribe las filas
+    del vuelo en ORDER_PLAN (plan_orden.py); re-publicar la misma orden no
+    escribe nada. Los errores hacen rollback y se propagan.
+    Requiere asegurar_esquema_ordenes() antes.
+    """
+    def log(mensaje):
+        if detallado:
+            print(mensaje)
+
+    numero_total_carritos = len(lista_de_carritos)
+    cursor = conn.cursor()
+    try:
+        cursor.execute("BEGIN")
+        actual = leer_orden_actual(cursor, flight_number, departure_date_str)
+
+        if actual is None:
+            log(f"No existe orden previa para el vuelo {flight_number} en la fecha {departure_date_str}. Se creará una nueva.")
+            cursor.execute(
+                "INSERT INTO Flights (flight_number, departure_date, numero_de_carritos, order_version) VALUES (%s, %s, %s, 1)",
+                (flight_number, departure_date_str, numero_total_carritos)
+            )
+            cursor.execute("SELECT flight_id FROM Flights WHERE flight_number = %s AND departure_date = %s",
+                           (flight_number, departure_date_str))
+            flight_id = cursor.fetchone()[0]
+            version = 1
+            carritos_actuales = {}
         else:
-            print(
-                f"No existe orden previa para el vuelo {flight_number} en la fecha {departure_date_str}. Se creará una nueva.")
+            flight_id = actual["flight_id"]
+            version = actual["version"]
+            carritos_actuales = actual["carritos"]
+            log(f"Vuelo encontrado (ID: {flight_id}, versión {version}). Calculando diferencias...")
 
-        # Crear el nuevo vuelo
-        cursor.execute(
-            "INSERT INTO Flights (flight_number, departure_date, numero_de_carritos) VALUES (%s, %s, %s)",
-            (flight_number, departure_date_str, numero_total_carritos)
-        )
-        cursor.execute("SELECT MAX(flight_id) FROM Flights;")
-        new_flight_id = cursor.fetchone()[0]
-        print(f"Nuevo vuelo creado con flight_id: {new_flight_id} (Total Carritos: {numero_total_carritos})")
-
-        # Insertar carritos y sus ítems
-        cart_counter = 1
-        for carrito_items in lista_de_carritos:
-            cart_identifier = f"Carrito {cart_counter} - Mixto"
-            cursor.execute("INSERT INTO Carts (flight_id, cart_identifier) VALUES (%s, %s)",
-                           (new_flight_id, cart_identifier))
-
-            cursor.execute("SELECT MAX(cart_id) FROM Carts;")
-            new_cart_id = cursor.fetchone()[0]
-            print(f"  > Creando {cart_identifier} (cart_id: {new_cart_id})...")
-
-            for sku, cantidad in carrito_items.items():
-                cursor.execute(
-                    "INSERT INTO Cart_Items (cart_id, product_sku, cantidad_requerida) VALUES (%s, %s, %s)",
-                    (new_cart_id, sku, cantidad)
-                )
-            cart_counter += 1
+        delta = calcular_delta(carritos_actuales, lista_de_carritos)
+        cambios = resumen_delta(delta)
+
+        if actual is not None and not any(cambios.values()):
+            conn.rollback()
+            log("La orden publicada ya es idéntica. No hay cambios que aplicar.")
+            return {"success": True, "message": f"Orden sin cambios para vuelo {flight_number}",
+                    "num_carritos": numero_total_carritos, "version": version, "cambios": cambios}
+
+        aplicar_delta(cursor, flight_id, delta)
 
+        if actual is not None:
+            # Control optimista: si otro proceso publicó en medio, se aborta
+            cursor.execute("""
+                UPDATE Flights SET numero_de_carritos = %s, order_version = COALESCE(order_version, 1) + 1
+                WHERE flight_id = %s AND COALESCE(order_version, 1) = %s
+            """, (numero_total_carritos, flight_id, version))
+            if cursor.rowcount != 1:
+                raise RuntimeError(f"La orden de {flight_number} cambió durante la publicación; reintentar.")
+            version += 1
+
+        carritos_publicados = adjuntar_totales(leer_carritos_publicados(cursor, flight_id))
+        # El plan desnormalizado que leen las estaciones cambia en la misma transacción
+        escribir_plan_orden(cursor, flight_number, departure_date_str, flight_id, version, carritos_publicados)
         conn.commit()
-        print("\n¡Éxito! Nueva orden enviada a Snowflake.")
-        return {"success": True, "message": f"Orden creada para vuelo {flight_number}", "num_carritos": numero_total_carritos}
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+    log(f"\n¡Éxito! Orden versión {version} enviada a Snowflake: {cambios}")
+    parchar_caches(flight_number, departure_date_str, carritos_publicados, version,
+                   [carrito["cart_id"] for carrito in carritos_actuales.values()])
+
+    return {"success": True, "message": f"Orden publicada para vuelo {flight_number}",
+            "num_carritos": numero_total_carritos, "version": version, "cambios": cambios}
+
+
+def mandar_orden_a_db(flight_number, departure_date_str, orden_maestra, limite_items):
+    """
+    Toma la orden maestra, la reparte con los pesos de PRODUCTS y publica la
+    diferencia contra la orden que ya existe (ver publicar_reparto).
+    """
+
+    conn = None
+    try:
+        conn = conectar_snowflake()
+        print(f"Conectado a Snowflake. Preparando orden para {flight_number}...")
+
+        pesos_g = leer_pesos_productos(conn.cursor(), orden_maestra)
+        desconocidos = skus_desconocidos(orden_maestra, pesos_g)
+        if desconocidos:
+            raise ValueError(f"SKUs que no existen en PRODUCTS: {', '.join(desconocidos)}")
+
+        reparto = repartir_carritos(orden_maestra, limite_items, pesos_g=pesos_g)
+        lista_de_carritos = reparto["carritos"]
+
+        print("\n--- PLAN DE REPARTO GENERADO ---")
+        for carrito, uso in zip(lista_de_carritos, reparto["utilizacion"]):
+            print(f"  Carrito {uso['carrito']}: {uso['items']} ítems, {uso['peso_g'] / 1000:.1f} kg, "
+                  f"{uso['cajones']} cajones {uso['utilizacion_pct']} -> {carrito}")
+
+        print(f"\nMandando orden para {flight_number}...")
+        asegurar_esquema_ordenes(conn.cursor())
+        resultado = publicar_reparto(conn, flight_number, departure_date_str, lista_de_carritos)
+        resultado["utilizacion"] = reparto["utilizacion"]
+        return resultado
 
     except Exception as e:
-        if conn:
-            conn.rollback()
         print(f"\nError: {e}", file=sys.stderr)
         return {"success": False, "error": str(e)}
     finally:
@@ -147,8 +419,13 @@ if __name__ == "__main__":
     else:
         VUELO_A_MANDAR = sys.argv[1]
         FECHA_DEL_VUELO = sys.argv[2]
-        # For custom orders, you would parse sys.argv[3] as JSON
-        ORDEN_A_MANDAR = ORDEN_MAESTRA_AM241
+        # Orden personalizada opcional como JSON: {"sku": cantidad, ...}
+        # (para muchos vuelos a la vez ver publicar_ordenes.py)
+        try:
+            ORDEN_A_MANDAR = json.loads(sys.argv[3]) if len(sys.argv) > 3 else ORDEN_MAESTRA_AM241
+        except json.JSONDecodeError as e:
+            print(json.dumps({"success": False, "error": f"Orden JSON inválida: {e}"}))
+            sys.exit(1)
 
     result = mandar_orden_a_db(
         VUELO_A_MANDAR,
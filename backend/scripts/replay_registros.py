@@ -0,0 +1,391 @@
+#!/usr/bin/env python3
+"""
+Motor de replay offline para analizar_registros.
+
+Recorre un directorio (recursivo) o un archivo .zip / .tar / .tar.gz con pares
+históricos orden/registro, re-ejecuta la validación en paralelo y escribe un
+JSON con resultados agregados: frecuencia de errores por SKU, deriva de tara
+por caja y tasa de aciertos del solver de discrepancias.
+
+Todos los pares se validan contra el mismo modelo de tara, cargado una vez y
+congelado (modelo_tara.ModeloTaraCongelado): los resultados no dependen del
+número de workers ni del orden de los lotes, y el replay no altera la
+calibración de producción. La deriva de tara sale de las observaciones que
+cada par le habría enseñado al modelo (tara observada menos estimada por
+caja en los carritos que validaron limpios).
+
+Los pares se emparejan por sufijo dentro de la misma carpeta:
+    orden_por_carritos_AM241.json  <->  registro_AM241.json
+    orden_AM241_2025-10-25.json    <->  registro_AM241_2025-10-25.json
+
+Uso:
+    python3 replay_registros.py <directorio|archivo.zip|archivo.tar.gz> [salida.json] [--workers N]
+"""
+
+import json
+import os
+import statistics
+import sys
+import tarfile
+import zipfile
+from collections import Counter, defaultdict
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from analizar_registro import analizar_datos
+from modelo_tara import ModeloTara, ModeloTaraCongelado
+
+PREFIJOS_ORDEN = ("orden_por_carritos_", "orden_")
+PREFIJO_REGISTRO = "registro_"
+
+ARCHIVO_SALIDA_DEFAULT = "replay_resultados.json"
+
+# Pares por tarea enviada al pool; reduce el overhead de IPC con historiales grandes
+PARES_POR_TAREA = 16
+
+# Lotes de un .tar leídos y en vuelo por worker; acota la memoria con historiales grandes
+LOTES_EN_VUELO_POR_WORKER = 2
+
+
+# --- DESCUBRIMIENTO DE PARES ---
+def _clave_par(ruta):
+    """
+    Regresa ('orden'|'registro', clave) para un nombre de archivo, o None
+    si el archivo no forma parte de un par.
+    """
+    carpeta, nombre = os.path.split(ruta)
+    if not nombre.endswith(".json"):
+        return None
+    base = nombre[:-len(".json")]
+
+    for prefijo in PREFIJOS_ORDEN:
+        if base.startswith(prefijo):
+            return "orden", (carpeta, base[len(prefijo):])
+    if base.startswith(PREFIJO_REGISTRO):
+        return "registro", (carpeta, base[len(PREFIJO_REGISTRO):])
+    return None
+
+
+def emparejar(rutas):
+    """
+    Agrupa una lista de rutas en pares (ruta_orden, ruta_registro).
+    Los archivos sin pareja se ignoran.
+    """
+    ordenes = {}
+    registros = {}
+    for ruta in rutas:
+        clave = _clave_par(ruta)
+        if clave is None:
+            continue
+        tipo, llave = clave
+        if tipo == "orden":
+            ordenes[llave] = ruta
+        else:
+            registros[llave] = ruta
+
+    return [(ordenes[llave], registros[llave]) for llave in sorted(ordenes) if llave in registros]
+
+
+def listar_directorio(directorio):
+    """Lista recursivamente todos los .json de un directorio"""
+    rutas = []
+    for raiz, _, archivos in os.walk(directorio):
+        for nombre in archivos:
+            if nombre.endswith(".json"):
+                rutas.append(os.path.join(raiz, nombre))
+    return rutas
+
+
+# --- LECTURA DE ARCHIVOS ---
+def cargar_json(ruta):
+    """Carga un JSON de disco; json.loads acepta los bytes tal cual (sin decodificar a str)"""
+    with open(ruta, 'rb') as f:
+        contenido = f.read()
+    if not contenido:
+        raise ValueError(f"Archivo vacío: {ruta}")
+    return json.loads(contenido)
+
+
+# --- AGREGACIÓN ---
+def agregado_vacio():
+    """Estructura de resultados parciales; se combina con combinar_agregados"""
+    return {
+        "pares_procesados": 0,
+        "pares_con_error": [],
+        "carritos_procesados": 0,
+        "carritos_por_status": Counter(),
+        "errores_por_sku": defaultdict(Counter),
+        "deriva_tara_por_caja_g": [],
+        "deriva_tara_por_tipo_caja_g": defaultdict(list),
+        "solver_invocaciones": 0,
+        "solver_resueltas": 0,
+    }
+
+
+def acumular_reporte(agregado, reporte, observaciones_tara=()):
+    """
+    Suma un reporte de analizar_datos, y las observaciones de tara del par
+    (ModeloTaraCongelado.observaciones), a un agregado parcial
+    """
+    agregado["pares_procesados"] += 1
+
+    for carrito in reporte.get("reporte_carritos", []):
+        agregado["carritos_procesados"] += 1
+        agregado["carritos_por_status"][carrito.get("status", "ERROR")] += 1
+
+        for sku in carrito.get("productos_incorrectos", []):
+            agregado["errores_por_sku"][sku]["incorrecto"] += 1
+        for sku in carrito.get("productos_faltantes", []):
+            agregado["errores_por_sku"][sku]["faltante"] += 1
+
+        if "sugerencia_encontrada" in carrito:
+            agregado["solver_invocaciones"] += 1
+            if carrito["sugerencia_encontrada"]:
+                agregado["solver_resueltas"] += 1
+
+    for observacion in observaciones_tara:
+        agregado["deriva_tara_por_caja_g"].append(observacion["deriva_g"])
+        agregado["deriva_tara_por_tipo_caja_g"][observacion["tipo_caja"] or "sin_tipo"].append(observacion["deriva_g"])
+
+
+def combinar_agregados(destino, parcial):
+    """Combina un agregado parcial (de un worker) en el agregado total"""
+    destino["pares_procesados"] += parcial["pares_procesados"]
+    destino["pares_con_error"].extend(parcial["pares_con_error"])
+    destino["carritos_procesados"] += parcial["carritos_procesados"]
+    destino["carritos_por_status"].update(parcial["carritos_por_status"])
+    for sku, conteo in parcial["errores_por_sku"].items():
+        destino["errores_por_sku"][sku].update(conteo)
+    destino["deriva_tara_por_caja_g"].extend(parcial["deriva_tara_por_caja_g"])
+    for tipo_caja, derivas in parcial["deriva_tara_por_tipo_caja_g"].items():
+        destino["deriva_tara_por_tipo_caja_g"][tipo_caja].extend(derivas)
+    destino["solver_invocaciones"] += parcial["solver_invocaciones"]
+    destino["solver_resueltas"] += parcial["solver_resueltas"]
+
+
+def resumir(agregado):
+    """Convierte un agregado total en el JSON final de resultados"""
+    deriva = agregado["deriva_tara_por_caja_g"]
+    invocaciones = agregado["solver_invocaciones"]
+
+    errores_por_sku = {
+        sku: {
+            "incorrecto": conteo.get("incorrecto", 0),
+            "faltante": conteo.get("faltante", 0),
+            "total": sum(conteo.values())
+        }
+        for sku, conteo in sorted(agregado["errores_por_sku"].items(),
+                                  key=lambda par: sum(par[1].values()), reverse=True)
+    }
+
+    return {
+        "pares_procesados": agregado["pares_procesados"],
+        # Los lotes terminan en cualquier orden; el reporte no debe depender de eso
+        "pares_con_error": sorted(agregado["pares_con_error"], key=lambda error: error["par"]),
+        "carritos_procesados": agregado["carritos_procesados"],
+        "carritos_por_status": dict(sorted(agregado["carritos_por_status"].items())),
+        "errores_por_sku": errores_por_sku,
+        "deriva_tara_por_caja_g": {
+            "muestras": len(deriva),
+            "media": round(statistics.fmean(deriva), 2) if deriva else None,
+            "mediana": round(statistics.median(deriva), 2) if deriva else None,
+            "desviacion_estandar": round(statistics.pstdev(deriva), 2) if len(deriva) > 1 else None,
+        },
+        "deriva_tara_por_tipo_caja_g": {
+            tipo_caja: {"muestras": len(derivas), "media": round(statistics.fmean(derivas), 2)}
+            for tipo_caja, derivas in sorted(agregado["deriva_tara_por_tipo_caja_g"].items())
+        },
+        "solver": {
+            "invocaciones": invocaciones,
+            "resueltas": agregado["solver_resueltas"],
+            "tasa_acierto": round(agregado["solver_resueltas"] / invocaciones, 4) if invocaciones else None,
+        },
+    }
+
+
+# --- WORKERS ---
+# Modelo de tara congelado que el proceso principal carga una vez y entrega a
+# cada worker al arrancar (initializer del pool)
+_modelo_tara_worker = None
+
+
+def _iniciar_worker(modelo_tara):
+    global _modelo_tara_worker
+    _modelo_tara_worker = modelo_tara
+
+
+def _analizar_par(agregado, nombre_par, datos_orden, datos_registro):
+    _modelo_tara_worker.observaciones.clear()
+    reporte = analizar_datos(datos_orden, datos_registro, modelo_tara=_modelo_tara_worker)
+    if "error" in reporte:
+        agregado["pares_con_error"].append({"par": nombre_par, "error": reporte["error"]})
+    else:
+        acumular_reporte(agregado, reporte, _modelo_tara_worker.observaciones)
+
+
+def procesar_pares_directorio(pares):
+    """Worker: analiza un lote de pares que están en disco"""
+    agregado = agregado_vacio()
+    for ruta_orden, ruta_registro in pares:
+        try:
+            _analizar_par(agregado, ruta_registro, cargar_json(ruta_orden), cargar_json(ruta_registro))
+        except Exception as e:
+            agregado["pares_con_error"].append({"par": ruta_registro, "error": str(e)})
+    return agregado
+
+
+def procesar_pares_zip(ruta_zip, pares):
+    """Worker: analiza un lote de pares dentro de un .zip (acceso aleatorio por miembro)"""
+    agregado = agregado_vacio()
+    with zipfile.ZipFile(ruta_zip) as zf:
+        for miembro_orden, miembro_registro in pares:
+            try:
+                datos_orden = json.loads(zf.read(miembro_orden))
+                datos_registro = json.loads(zf.read(miembro_registro))
+                _analizar_par(agregado, miembro_registro, datos_orden, datos_registro)
+            except Exception as e:
+                agregado["pares_con_error"].append({"par": miembro_registro, "error": str(e)})
+    return agregado
+
+
+def procesar_pares_bytes(pares):
+    """Worker: analiza un lote de pares ya leídos como bytes (archivos .tar en streaming)"""
+    agregado = agregado_vacio()
+    for nombre_par, bytes_orden, bytes_registro in pares:
+        try:
+            _analizar_par(agregado, nombre_par, json.loads(bytes_orden), json.loads(bytes_registro))
+        except Exception as e:
+            agregado["pares_con_error"].append({"par": nombre_par, "error": str(e)})
+    return agregado
+
+
+def _lotes(elementos, tamano):
+    for i in range(0, len(elementos), tamano):
+        yield elementos[i:i + tamano]
+
+
+def _lotes_tar(ruta_tar, pares):
+    """
+    Lee el .tar secuencialmente (un tar comprimido no permite acceso aleatorio
+    barato) y va entregando lotes de pares como bytes.
+    """
+    # Pares que espera cada miembro, y cuántos pares faltan por despachar de cada orden
+    pares_por_miembro = defaultdict(list)
+    usos_orden = Counter()
+    for par in pares:
+        ruta_orden, ruta_registro = par
+        pares_por_miembro[ruta_orden].append(par)
+        pares_por_miembro[ruta_registro].append(par)
+        usos_orden[ruta_orden] += 1
+
+    leidos = {}
+    lote = []
+    with tarfile.open(ruta_tar, 'r:*') as tf:
+        for miembro in tf:
+            if not miembro.isfile() or miembro.name not in pares_por_miembro:
+                continue
+            leidos[miembro.name] = tf.extractfile(miembro).read()
+
+            # Solo se revisan los pares de este miembro; una orden se libera con su último par
+            for ruta_orden, ruta_registro in pares_por_miembro.pop(miembro.name):
+                if ruta_orden in leidos and ruta_registro in leidos:
+                    lote.append((ruta_registro, leidos[ruta_orden], leidos.pop(ruta_registro)))
+                    usos_orden[ruta_orden] -= 1
+                    if not usos_orden[ruta_orden]:
+                        del leidos[ruta_orden]
+
+            if len(lote) >= PARES_POR_TAREA:
+                yield lote
+                lote = []
+    if lote:
+        yield lote
+
+
+def _combinar_en_ventana(pool, total, funcion, lotes, en_vuelo):
+    """
+    Envía los lotes al pool con a lo más 'en_vuelo' pendientes: el siguiente
+    lote se lee solo cuando termina uno, así el .tar no se carga completo en
+    memoria si los workers van más lento que la lectura.
+    """
+    pendientes = set()
+    for lote in lotes:
+        if len(pendientes) >= en_vuelo:
+            terminados, pendientes = wait(pendientes, return_when=FIRST_COMPLETED)
+            for futuro in terminados:
+                combinar_agregados(total, futuro.result())
+        pendientes.add(pool.submit(funcion, lote))
+    for futuro in wait(pendientes).done:
+        combinar_agregados(total, futuro.result())
+
+
+def ejecutar_replay(origen, workers=None):
+    """
+    Re-ejecuta la validación sobre todos los pares de 'origen' y regresa
+    el resumen agregado.
+    """
+    total = agregado_vacio()
+    futuros = []
+    modelo_tara = ModeloTaraCongelado(ModeloTara.cargar())
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_iniciar_worker, initargs=(modelo_tara,)) as pool:
+        if os.path.isdir(origen):
+            pares = emparejar(listar_directorio(origen))
+            print(f"Replay de {len(pares)} pares en {origen}...", file=sys.stderr)
+            futuros = [pool.submit(procesar_pares_directorio, lote) for lote in _lotes(pares, PARES_POR_TAREA)]
+
+        elif zipfile.is_zipfile(origen):
+            with zipfile.ZipFile(origen) as zf:
+                pares = emparejar(zf.namelist())
+            print(f"Replay de {len(pares)} pares en {origen}...", file=sys.stderr)
+            futuros = [pool.submit(procesar_pares_zip, origen, lote) for lote in _lotes(pares, PARES_POR_TAREA)]
+
+        elif tarfile.is_tarfile(origen):
+            with tarfile.open(origen, 'r:*') as tf:
+                pares = emparejar(tf.getnames())
+            print(f"Replay de {len(pares)} pares en {origen}...", file=sys.stderr)
+            en_vuelo = LOTES_EN_VUELO_POR_WORKER * (workers or os.cpu_count() or 1)
+            _combinar_en_ventana(pool, total, procesar_pares_bytes, _lotes_tar(origen, pares), en_vuelo)
+
+        else:
+            return {"error": f"'{origen}' no es un directorio ni un archivo .zip/.tar válido."}
+
+        for futuro in futuros:
+            combinar_agregados(total, futuro.result())
+
+    return resumir(total)
+
+
+# --- MAIN EXECUTION ---
+if __name__ == "__main__":
+    argumentos = sys.argv[1:]
+    workers = None
+    if "--workers" in argumentos:
+        i = argumentos.index("--workers")
+        try:
+            workers = int(argumentos[i + 1])
+        except (IndexError, ValueError):
+            print(json.dumps({"error": "--workers requiere un número entero"}))
+            sys.exit(1)
+        del argumentos[i:i + 2]
+
+    if not argumentos:
+        print(json.dumps({"error": "Uso: python3 replay_registros.py <directorio|archivo> [salida.json] [--workers N]"}))
+        sys.exit(1)
+
+    origen = argumentos[0]
+    archivo_salida = argumentos[1] if len(argumentos) > 1 else ARCHIVO_SALIDA_DEFAULT
+
+    if not os.path.exists(origen):
+        print(json.dumps({"error": f"No existe '{origen}'"}))
+        sys.exit(1)
+
+    resultados = ejecutar_replay(origen, workers)
+
+    if "error" in resultados:
+        print(json.dumps(resultados, ensure_ascii=False))
+        sys.exit(1)
+
+    with open(archivo_salida, 'w', encoding='utf-8') as f:
+        json.dump(resultados, f, indent=2, ensure_ascii=False)
+
+    print(f"Resultados escritos en {archivo_salida}", file=sys.stderr)
+    print(json.dumps(resultados["solver"], ensure_ascii=False))
@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+"""
+Carga de órdenes resistente a incidentes del warehouse.
+
+Cuando Snowflake está lento o caído, cada validación se quedaba bloqueada en
+el connect (sin connect_timeout) y terminaba en "Vuelo no encontrado". Aquí:
+
+- las conexiones llevan connect_timeout y network_timeout acotados,
+- un fallo se reintenta con espera exponencial con jitter, sin pasar de
+  PRESUPUESTO_WAREHOUSE_S en total: cada intento conecta con lo que quede
+  del presupuesto como timeout, y no se empieza uno con menos de
+  MIN_INTENTO_S por delante,
+- un circuit breaker compartido por todos los procesos del host (archivo
+  bajo flock en ORDENES_CACHE_DIR, como cargador_ordenes.py) se abre tras
+  FALLAS_PARA_ABRIR fallos seguidos; mientras está abierto las llamadas
+  fallan al instante, y al vencer CIRCUITO_ABIERTO_S una sola llamada prueba
+  el warehouse (semiabierto) antes de cerrarlo,
+- cada orden completa que sí se obtiene se guarda como respaldo
+  ("last known good"). Si la carga falla, la validación usa ese respaldo y
+  el reporte lo marca con "orden_desactualizada".
+
+Uso:
+    python3 resiliencia_ordenes.py            # estado del circuito
+    python3 resiliencia_ordenes.py --cerrar   # cerrarlo a mano
+"""
+
+import fcntl
+import json
+import os
+import math
+import random
+import sys
+import threading
+import time
+from datetime import datetime
+
+from cargador_ordenes import ORDENES_CACHE_DIR, escribir_entrada, leer_entrada, ruta_entrada
+from metricas import incrementar
+
+WAREHOUSE_CONNECT_TIMEOUT_S = int(os.getenv('WAREHOUSE_CONNECT_TIMEOUT_S', '5'))
+WAREHOUSE_NETWORK_TIMEOUT_S = int(os.getenv('WAREHOUSE_NETWORK_TIMEOUT_S', '10'))
+
+# Intentos por llamada y tope de tiempo de todos ellos juntos
+INTENTOS_WAREHOUSE = int(os.getenv('WAREHOUSE_INTENTOS', '3'))
+PRESUPUESTO_WAREHOUSE_S = float(os.getenv('WAREHOUSE_PRESUPUESTO_S', '20'))
+
+# Espera antes del reintento n: uniforme en [0, min(ESPERA_MAX_S, ESPERA_BASE_S * 2^n)]
+ESPERA_BASE_S = 0.25
+ESPERA_MAX_S = 2.0
+
+# Presupuesto mínimo que tiene que quedar para empezar un intento
+MIN_INTENTO_S = 1.0
+
+FALLAS_PARA_ABRIR = int(os.getenv('CIRCUITO_FALLAS', '3'))
+CIRCUITO_ABIERTO_S = float(os.getenv('CIRCUITO_ABIERTO_S', '30'))
+
+# Un respaldo más viejo que esto ya no se sirve
+RESPALDO_TTL_S = float(os.getenv('RESPALDO_ORDENES_TTL_S', str(72 * 3600)))
+
+RUTA_CIRCUITO = os.path.join(ORDENES_CACHE_DIR, 'circuito_warehouse.json')
+
+
+class CircuitoAbierto(Exception):
+    """El warehouse falló hace poco; no se intenta hasta que venza el circuito"""
+
+
+# Límite (time.monotonic) de la llamada a llamar_warehouse en curso en este hilo
+_presupuesto = threading.local()
+
+
+def opciones_conexion():
+    """
+    Opciones de conectar_snowflake() con los tiempos acotados; dentro de
+    llamar_warehouse, además, por lo que quede de su presupuesto.
+    """
+    connect_timeout, network_timeout = WAREHOUSE_CONNECT_TIMEOUT_S, WAREHOUSE_NETWORK_TIMEOUT_S
+    limite = getattr(_presupuesto, 'limite', None)
+    if limite is not None:
+        restante = max(1, math.ceil(limite - time.monotonic()))
+        connect_timeout = min(connect_timeout, restante)
+        network_timeout = min(network_timeout, max(1, restante - connect_timeout))
+    return {"connect_timeout": connect_timeout, "network_timeout": network_timeout}
+
+
+# --- CIRCUIT BREAKER ---
+def _leer_circuito():
+    try:
+        with open(RUTA_CIRCUITO, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {"fallas": 0, "abierto_hasta": 0.0}
+
+
+def _actualizar_circuito(cambio):
+    """Aplica cambio(estado) bajo el lock del circuito y regresa lo que cambio() regrese"""
+    os.makedirs(ORDENES_CACHE_DIR, exist_ok=True)
+    with open(RUTA_CIRCUITO + '.lock', 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        estado = _leer_circuito()
+        resultado = cambio(estado)
+        ruta_tmp = f"{RUTA_CIRCUITO}.{os.getpid()}.tmp"
+        with open(ruta_tmp, 'w', encoding='utf-8') as f:
+            json.dump(estado, f)
+        os.replace(ruta_tmp, RUTA_CIRCUITO)
+        return resultado
+
+
+def estado_circuito(ahora=None):
+    """'cerrado', 'abierto' o 'semiabierto' (vencido, esperando una prueba)"""
+    ahora = time.time() if ahora is None else ahora
+    estado = _leer_circuito()
+    if estado["fallas"] < FALLAS_PARA_ABRIR:
+        return 'cerrado'
+    return 'abierto' if estado["abierto_hasta"] > ahora else 'semiabierto'
+
+
+def _pedir_paso():
+    """
+    Regresa True si la llamada es la prueba de un circuito semiabierto,
+    False si el circuito está cerrado; lanza CircuitoAbierto si no puede pasar.
+    """
+    if estado_circuito() == 'cerrado':
+        return False
+
+    def reclamar(estado):
+        ahora = time.time()
+        if estado["fallas"] < FALLAS_PARA_ABRIR:
+            return False
+        if estado["abierto_hasta"] > ahora:
+            return None
+        # La prueba reabre el circuito mientras dura: las demás llamadas no pasan
+        estado["abierto_hasta"] = ahora + CIRCUITO_ABIERTO_S
+        return True
+
+    prueba = _actualizar_circuito(reclamar)
+    if prueba is None:
+        incrementar('warehouse_circuito_total', evento='rechazada')
+        raise CircuitoAbierto(f"Circuito del warehouse abierto ({FALLAS_PARA_ABRIR}+ fallos seguidos)")
+    return prueba
+
+
+def _registrar_exito():
+    if _leer_circuito()["fallas"] == 0:
+        return
+
+    def cerrar(estado):
+        estado["fallas"] = 0
+        estado["abierto_hasta"] = 0.0
+
+    _actualizar_circuito(cerrar)
+    incrementar('warehouse_circuito_total', evento='cerrado')
+
+
+def _registrar_falla():
+    def contar(estado):
+        estado["fallas"] += 1
+        if estado["fallas"] >= FALLAS_PARA_ABRIR:
+            estado["abierto_hasta"] = time.time() + CIRCUITO_ABIERTO_S
+            return True
+        return False
+
+    if _actualizar_circuito(contar):
+        incrementar('warehouse_circuito_total', evento='abierto')
+
+
+def cerrar_circuito():
+    _actualizar_circuito(lambda estado: estado.update(fallas=0, abierto_hasta=0.0))
+
+
+def _espera(reintento):
+    return random.uniform(0, min(ESPERA_MAX_S, ESPERA_BASE_S * 2 ** reintento))
+
+
+def llamar_warehouse(funcion, *args, **kwargs):
+    """
+    funcion(*args, **kwargs) con reintentos y el circuit breaker. La
+    excepción del último intento se propaga; CircuitoAbierto si no se intentó.
+    """
+    try:
+        prueba = _pedir_paso()
+    except OSError as e:
+        # Sin directorio de cache no hay circuito compartido: se llama directo
+        print(f"Advertencia: circuito del warehouse no disponible ({e}).", file=sys.stderr)
+        return funcion(*args, **kwargs)
+
+    intentos = 1 if prueba else INTENTOS_WAREHOUSE
+    limite = time.monotonic() + PRESUPUESTO_WAREHOUSE_S
+    limite_anterior = getattr(_presupuesto, 'limite', None)
+    _presupuesto.limite = limite
+    try:
+        return _intentar(funcion, args, kwargs, intentos, limite)
+    finally:
+        _presupuesto.limite = limite_anterior
+
+
+def _intentar(funcion, args, kwargs, intentos, limite):
+    for intento in range(intentos):
+        try:
+            resultado = funcion(*args, **kwargs)
+        except Exception as e:
+            espera = _espera(intento)
+            ultimo_intento = intento + 1 == intentos or time.monotonic() + espera + MIN_INTENTO_S >= limite
+            print(f"Advertencia: fallo del warehouse (intento {intento + 1}/{intentos}): {e}", file=sys.stderr)
+            if ultimo_intento:
+                _registrar_falla()
+                raise
+            incrementar('warehouse_reintentos_total')
+            time.sleep(espera)
+        else:
+            _registrar_exito()
+            return resultado
+
+
+# --- RESPALDO (LAST KNOWN GOOD) ---
+def guardar_respaldo_orden(flight_number, orden):
+    """Guarda la orden completa del vuelo como respaldo; solo advierte si falla"""
+    try:
+        escribir_entrada(ruta_entrada('respaldo_orden', flight_number),
+                         dict(orden, guardada=time.time()), RESPALDO_TTL_S)
+    except OSError as e:
+        print(f"Advertencia: no se pudo guardar el respaldo de la orden {flight_number}: {e}", file=sys.stderr)
+
+
+def orden_de_respaldo(flight_number, motivo):
+    """
+    El último respaldo de la orden con la marca "desactualizada"
+    {"guardada", "antiguedad_s", "motivo"}, o None si no hay.
+    """
+    entrada = leer_entrada(ruta_entrada('respaldo_orden', flight_number))
+    if entrada is None or entrada['negativo']:
+        incrementar('ordenes_respaldo_total', resultado='sin_respaldo')
+        return None
+
+    orden = dict(entrada['resultado'])
+    guardada = orden.pop('guardada')
+    orden['desactualizada'] = {
+        "guardada": datetime.fromtimestamp(guardada).isoformat(),
+        "antiguedad_s": int(time.time() - guardada),
+        "motivo": str(motivo),
+    }
+    incrementar('ordenes_respaldo_total', resultado='servida')
+    print(f"Advertencia: se usa el respaldo de la orden {flight_number} "
+          f"({orden['desactualizada']['antiguedad_s']} s de antigüedad).", file=sys.stderr)
+    return orden
+
+
+# --- MAIN EXECUTION ---
+if __name__ == "__main__":
+    if sys.argv[1:] == ["--cerrar"]:
+        cerrar_circuito()
+    elif sys.argv[1:]:
+        print(json.dumps({"error": "Uso: python3 resiliencia_ordenes.py [--cerrar]"}))
+        sys.exit(1)
+    print(json.dumps(dict(_leer_circuito(), estado=estado_circuito())))
@@ -0,0 +1,328 @@
+#!/usr/bin/env python3
+"""
+Resolutor de etiquetas de visión a SKUs de PRODUCTS.
+
+La visión no siempre regresa el SKU exacto ("Principe", "agua ciel",
+"canelitas_35" en vez de "canelitas_35g"), y la validación comparaba por
+string exacto, así que cada variante salía como "Productos INCORRECTOS".
+El índice se arma una vez por catálogo con:
+
+- formas normalizadas (minúsculas, sin acentos, separadores como '_') del
+  SKU y del nombre del producto,
+- alias automáticos: el SKU sin su sufijo de tamaño ('principe_49g' ->
+  'principe') cuando no es ambiguo, más los de ALIAS_SKUS_PATH
+  ({"alias": "sku"}, opcional),
+- postings de palabras: si todas las palabras de la etiqueta aparecen en un
+  solo SKU ("agua ciel" -> agua_mineral_ciel_363g), ese es el SKU,
+- postings de trigramas para lo demás (similitud de Dice; se acepta solo un
+  ganador claro).
+
+El índice se guarda en la cache de órdenes (cargador_ordenes.py) con su
+huella (catálogo y alias). Al vencer INDICE_SKUS_TTL_S se vuelve a leer
+PRODUCTS (sku, product_name) y solo se reconstruye si la huella cambió;
+precarga_vuelos.py lo deja listo en cada pasada. Los workers del servicio
+arman su resolutor una vez por huella (resolutor_por_huella), y con él la
+TablaSkus del catálogo sobre la que se compilan los planes (tabla_skus()).
+
+Uso:
+    python3 resolutor_skus.py <etiqueta> [<etiqueta> ...]
+    python3 resolutor_skus.py --reconstruir
+"""
+
+import hashlib
+import json
+import os
+import re
+import sys
+import unicodedata
+from collections import OrderedDict
+
+from cargador_ordenes import cargar_coalescido, escribir_entrada, invalidar, leer_entrada, ruta_entrada
+from conexion import conectar_snowflake
+from resiliencia_ordenes import llamar_warehouse, opciones_conexion
+from tabla_skus import TablaSkus
+
+INDICE_SKUS_TTL_S = float(os.getenv('INDICE_SKUS_TTL_S', '900'))
+
+ALIAS_SKUS_PATH = os.getenv('ALIAS_SKUS_PATH', '')
+
+# Similitud mínima y ventaja mínima sobre el segundo candidato para aceptar un trigrama
+UMBRAL_SIMILITUD = 0.6
+MARGEN_SIMILITUD = 0.1
+
+# Etiquetas memorizadas por resolutor (LRU)
+MAX_MEMO_ETIQUETAS = 4096
+
+_SUFIJO_TAMANO = re.compile(r'_\d+(?:[.,]\d+)?(?:g|kg|ml|l|oz|pz)$')
+
+
+def normalizar(texto):
+    """'Agua Mineral Ciel 363g' -> 'agua_mineral_ciel_363g'"""
+    texto = unicodedata.normalize('NFKD', str(texto))
+    texto = ''.join(c for c in texto if not unicodedata.combining(c)).lower()
+    return re.sub(r'[^a-z0-9]+', '_', texto).strip('_')
+
+
+def trigramas(texto_normalizado):
+    relleno = f"  {texto_normalizado.replace('_', ' ')} "
+    return {relleno[i:i + 3] for i in range(len(relleno) - 2)}
+
+
+def huella_catalogo(filas, alias=None):
+    """sha256 del catálogo y de los alias: cambiar cualquiera de los dos reconstruye el índice"""
+    contenido = json.dumps([sorted([str(sku), str(nombre or '')] for sku, nombre in filas),
+                            sorted((alias or {}).items())])
+    return hashlib.sha256(contenido.encode('utf-8')).hexdigest()
+
+
+def _leer_alias():
+    if not ALIAS_SKUS_PATH:
+        return {}
+    try:
+        with open(ALIAS_SKUS_PATH, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        print(f"Advertencia: no se pudieron leer los alias de SKUs ({e}).", file=sys.stderr)
+        return {}
+
+
+def construir_indice(filas, alias=None):
+    """
+    Índice serializable a partir de [(sku, product_name), ...]:
+    {"huella", "exactas": {forma: sku}, "palabras": {palabra: [sku, ...]},
+     "claves": [[forma, sku], ...], "postings": {trigrama: [i_clave, ...]}}
+    """
+    # Las formas del SKU mismo son fijas: un nombre o alias corto nunca les gana
+    exactas = {}
+    for sku, _ in filas:
+        exactas[str(sku)] = str(sku)
+        exactas[normalizar(sku)] = str(sku)
+    fijas = set(exactas)
+    ambiguas = set()
+
+    def agregar(forma, sku):
+        if not forma or forma in fijas or forma in ambiguas:
+            return
+        if exactas.get(forma, sku) != sku:
+            ambiguas.add(forma)
+            del exactas[forma]
+            return
+        exactas[forma] = sku
+
+    for sku, nombre in filas:
+        agregar(normalizar(nombre or ''), str(sku))
+    for sku, nombre in filas:
+        for forma in (normalizar(sku), normalizar(nombre or '')):
+            base = _SUFIJO_TAMANO.sub('', forma)
+            if base != forma:
+                agregar(base, str(sku))
+    skus = {str(sku) for sku, _ in filas}
+    for etiqueta, sku in (alias or {}).items():
+        if sku in skus and normalizar(etiqueta) not in fijas:
+            exactas[normalizar(etiqueta)] = sku
+
+    palabras = {}
+    for sku, nombre in filas:
+        for palabra in set(normalizar(sku).split('_')) | set(normalizar(nombre or '').split('_')):
+            if palabra:
+                palabras.setdefault(palabra, set()).add(str(sku))
+
+    claves = sorted({(forma, sku) for forma, sku in exactas.items() if forma == normalizar(forma)})
+    postings = {}
+    for i, (forma, _) in enumerate(claves):
+        for grama in trigramas(forma):
+            postings.setdefault(grama, []).append(i)
+
+    return {
+        "huella": huella_catalogo(filas, alias),
+        "exactas": exactas,
+        "palabras": {palabra: sorted(skus_palabra) for palabra, skus_palabra in palabras.items()},
+        "claves": [list(clave) for clave in claves],
+        "postings": postings,
+    }
+
+
+class ResolutorSkus:
+    """Resuelve etiquetas con un índice ya construido; memoriza las últimas que resolvió"""
+
+    def __init__(self, indice):
+        self.indice = indice
+        self._memo = OrderedDict()
+        self._tabla = None
+
+    def tabla_skus(self):
+        """TablaSkus de todos los SKUs del catálogo, armada una vez; se usa a través de extension()"""
+        if self._tabla is None:
+            self._tabla = TablaSkus(self.indice["exactas"].values())
+        return self._tabla
+
+    def resolver(self, etiqueta):
+        """SKU de la etiqueta, o None si no hay un candidato claro"""
+        if etiqueta in self._memo:
+            self._memo.move_to_end(etiqueta)
+            return self._memo[etiqueta]
+
+        exactas = self.indice["exactas"]
+        forma = normalizar(etiqueta)
+        sku = exactas.get(etiqueta) or exactas.get(forma) or exactas.get(_SUFIJO_TAMANO.sub('', forma))
+        if sku is None and forma:
+            sku = self._por_palabras(forma) or self._por_trigramas(forma)
+        self._memo[etiqueta] = sku
+        if len(self._memo) > MAX_MEMO_ETIQUETAS:
+            self._memo.popitem(last=False)
+        return sku
+
+    def _por_palabras(self, forma):
+        candidatos = None
+        for palabra in forma.split('_'):
+            skus = self.indice["palabras"].get(palabra)
+            if not skus:
+                return None
+            candidatos = set(skus) if candidatos is None else candidatos & set(skus)
+        return next(iter(candidatos)) if candidatos and len(candidatos) == 1 else None
+
+    def _por_trigramas(self, forma):
+        gramas = trigramas(forma)
+        compartidos = {}
+        for grama in gramas:
+            for i in self.indice["postings"].get(grama, ()):
+                compartidos[i] = compartidos.get(i, 0) + 1
+
+        # Mejor similitud por SKU (un SKU puede tener varias formas)
+        por_sku = {}
+        for i, comunes in compartidos.items():
+            forma_clave, sku = self.indice["claves"][i]
+            similitud = 2 * comunes / (len(gramas) + len(trigramas(forma_clave)))
+            por_sku[sku] = max(similitud, por_sku.get(sku, 0.0))
+
+        ranking = sorted(por_sku.items(), key=lambda par: -par[1])
+        if not ranking or ranking[0][1] < UMBRAL_SIMILITUD:
+            return None
+        if len(ranking) > 1 and ranking[0][1] - ranking[1][1] < MARGEN_SIMILITUD:
+            return None
+        return ranking[0][0]
+
+    def resolver_etiquetas(self, etiquetas):
+        """
+        Regresa (skus, correcciones): las etiquetas sin candidato se dejan
+        tal cual; 'correcciones' es {etiqueta: sku} de las que cambiaron.
+        """
+        skus = []
+        correcciones = {}
+        for etiqueta in etiquetas:
+            sku = self.resolver(etiqueta)
+            if sku is None:
+                skus.append(etiqueta)
+            else:
+                skus.append(sku)
+                if sku != etiqueta:
+                    correcciones[etiqueta] = sku
+        return skus, correcciones
+
+
+def consultar_catalogo():
+    """[(sku, product_name), ...] de PRODUCTS, con reintentos y circuit breaker"""
+    return llamar_warehouse(_consultar_catalogo)
+
+
+def _consultar_catalogo():
+    conn = conectar_snowflake(**opciones_conexion())
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT sku, product_name FROM PRODUCTS ORDER BY sku")
+            return [(row[0], row[1]) for row in cursor.fetchall()]
+    finally:
+        conn.close()
+
+
+def _indice_para(filas):
+    """El índice guardado si su huella coincide con 'filas' y los alias (aunque ya haya vencido), o uno nuevo"""
+    alias = _leer_alias()
+    anterior = leer_entrada(ruta_entrada('indice_skus'), ahora=0)
+    if (anterior is not None and not anterior['negativo']
+            and anterior['resultado'].get('huella') == huella_catalogo(filas, alias)):
+        return anterior['resultado']
+    return construir_indice(filas, alias)
+
+
+def guardar_indice(filas):
+    """
+    Guarda el índice del catálogo 'filas' (lo llaman precarga_vuelos.py y
+    snapshot_vuelos.py con el catálogo que ya leyeron). Si la huella no cambió solo se renueva su vigencia.
+    """
+    indice = _indice_para(filas)
+    escribir_entrada(ruta_entrada('indice_skus'), indice, INDICE_SKUS_TTL_S)
+    return indice
+
+
+_resolutores = {}
+
+
+def cargar_resolutor():
+    """
+    ResolutorSkus del catálogo vigente. Si el warehouse no responde se usa
+    el último índice guardado aunque haya vencido; sin ninguno regresa None
+    (la validación sigue comparando por string exacto).
+    """
+    def reconstruir():
+        filas = consultar_catalogo()
+        return _indice_para(filas) if filas else None
+
+    try:
+        indice = cargar_coalescido('indice_skus', (), reconstruir, ttl_s=INDICE_SKUS_TTL_S)
+    except Exception as e:
+        anterior = leer_entrada(ruta_entrada('indice_skus'), ahora=0)
+        if anterior is None or anterior['negativo']:
+            print(f"Advertencia: no se pudo cargar el índice de SKUs ({e}); se compara por SKU exacto.",
+                  file=sys.stderr)
+            return None
+        print(f"Advertencia: no se pudo renovar el índice de SKUs ({e}); se usa el anterior.", file=sys.stderr)
+        indice = anterior['resultado']
+    return None if indice is None else _resolutor_de(indice)
+
+
+def _resolutor_de(indice):
+    # Un proceso largo conserva el resolutor (y su memo) mientras la huella no cambie
+    resolutor = _resolutores.get(indice["huella"])
+    if resolutor is None:
+        _resolutores.clear()
+        resolutor = _resolutores[indice["huella"]] = ResolutorSkus(indice)
+    return resolutor
+
+
+def resolutor_por_huella(huella):
+    """
+    ResolutorSkus del índice con esa huella, armado una vez por proceso a
+    partir del índice guardado (los workers del servicio reciben solo la
+    huella). Si el guardado ya es otro se usa ese; sin ninguno, cargar_resolutor().
+    """
+    if huella is None:
+        return None
+    resolutor = _resolutores.get(huella)
+    if resolutor is not None:
+        return resolutor
+    guardado = leer_entrada(ruta_entrada('indice_skus'), ahora=0)
+    if guardado is None or guardado['negativo']:
+        return cargar_resolutor()
+    return _resolutor_de(guardado['resultado'])
+
+
+# --- MAIN EXECUTION ---
+if __name__ == "__main__":
+    argumentos = sys.argv[1:]
+    if not argumentos:
+        print(json.dumps({"error": "Uso: python3 resolutor_skus.py <etiqueta> [...] | --reconstruir"}))
+        sys.exit(1)
+
+    if argumentos == ["--reconstruir"]:
+        invalidar('indice_skus')
+        resolutor = cargar_resolutor()
+        if resolutor is None:
+            sys.exit(1)
+        print(json.dumps({"huella": resolutor.indice["huella"], "formas": len(resolutor.indice["exactas"])}))
+        sys.exit(0)
+
+    resolutor = cargar_resolutor()
+    if resolutor is None:
+        sys.exit(1)
+    print(json.dumps({etiqueta: resolutor.resolver(etiqueta) for etiqueta in argumentos}, ensure_ascii=False))
@@ -0,0 +1,393 @@
+#!/usr/bin/env python3
+"""
+Rollup incremental diario de EMPLOYEE_PERFORMANCE_METRICS.
+
+Procesa solo las sesiones (INVENTORY_SESSIONS) y errores (ERROR_LOG) posteriores
+a la marca de agua guardada en ROLLUP_WATERMARKS, recalcula los días afectados
+de cada empleado y los fusiona con MERGE en la tabla de agregados.
+Re-ejecutarlo con la misma marca de agua produce el mismo resultado.
+
+Las claves (empleado, día) afectadas incluyen la clave anterior de cada sesión
+(ROLLUP_SESSION_KEYS): una sesión que cambia de empleado, de día o de status, o
+que se borra, también recalcula la clave que deja. Una clave que se queda sin
+sesiones completadas se borra de la tabla. En el mismo paso se mantiene
+ERROR_TYPE_DAILY_METRICS (errores por día y tipo), de donde leen las vistas
+del dashboard junto con EMPLOYEE_PERFORMANCE_METRICS.
+
+ERROR_LOG se trata como solo-inserciones (marca de agua por ERROR_ID); si se
+borran errores, `--completo` recalcula todas las claves, incluidas las que ya
+no tienen filas de origen.
+
+Uso:
+    python3 rollup_metricas_empleados.py             # incremental
+    python3 rollup_metricas_empleados.py --completo  # reprocesa todo el historial
+"""
+
+import json
+import sys
+
+from conexion import conectar_snowflake
+
+NOMBRE_JOB = 'EMPLOYEE_PERFORMANCE_METRICS_DAILY'
+
+# Marca de agua inicial (equivale a "nunca se ha procesado nada")
+WATERMARK_INICIAL_TS = '1970-01-01 00:00:00'
+WATERMARK_INICIAL_ERROR_ID = 0
+
+
+def get_connection():
+    """Crea y regresa una conexión a Snowflake"""
+    return conectar_snowflake(connect_timeout=30)
+
+
+def crear_tablas_rollup(cursor):
+    """Crea ROLLUP_WATERMARKS, ROLLUP_SESSION_KEYS y ERROR_TYPE_DAILY_METRICS si no existen"""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS ROLLUP_WATERMARKS (
+            JOB_NAME VARCHAR(100) PRIMARY KEY,
+            LAST_SESSION_UPDATED_AT TIMESTAMP_NTZ,
+            LAST_ERROR_ID INTEGER,
+            UPDATED_AT TIMESTAMP_NTZ DEFAULT CURRENT_TIMESTAMP()
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS ROLLUP_SESSION_KEYS (
+            SESSION_ID VARCHAR(50) PRIMARY KEY,
+            EMPLOYEE_ID VARCHAR(50) NOT NULL,
+            METRIC_DATE DATE NOT NULL,
+            UPDATED_AT TIMESTAMP_NTZ DEFAULT CURRENT_TIMESTAMP()
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS ERROR_TYPE_DAILY_METRICS (
+            METRIC_DATE DATE NOT NULL,
+            ERROR_TYPE VARCHAR(50) NOT NULL,
+            ERROR_COUNT INTEGER DEFAULT 0,
+            CRITICAL_COUNT INTEGER DEFAULT 0,
+            UPDATED_AT TIMESTAMP_NTZ DEFAULT CURRENT_TIMESTAMP(),
+            UNIQUE (METRIC_DATE, ERROR_TYPE)
+        )
+    """)
+
+
+def leer_watermark(cursor):
+    """
+    Regresa (ultima_sesion_ts, ultimo_error_id) del job.
+    Si el job nunca ha corrido regresa la marca de agua inicial.
+    """
+    cursor.execute(
+        "SELECT LAST_SESSION_UPDATED_AT, LAST_ERROR_ID FROM ROLLUP_WATERMARKS WHERE JOB_NAME = %s",
+        (NOMBRE_JOB,)
+    )
+    fila = cursor.fetchone()
+    if not fila:
+        return WATERMARK_INICIAL_TS, WATERMARK_INICIAL_ERROR_ID
+
+    ultima_sesion_ts = fila[0] if fila[0] is not None else WATERMARK_INICIAL_TS
+    ultimo_error_id = fila[1] if fila[1] is not None else WATERMARK_INICIAL_ERROR_ID
+    return ultima_sesion_ts, ultimo_error_id
+
+
+def leer_limite_superior(cursor):
+    """
+    Fija el límite superior de esta corrida antes de agregar, para que las filas
+    que lleguen mientras corre el MERGE queden para la siguiente ejecución.
+    """
+    cursor.execute("SELECT MAX(UPDATED_AT) FROM INVENTORY_SESSIONS")
+    max_sesion_ts = cursor.fetchone()[0]
+    cursor.execute("SELECT MAX(ERROR_ID) FROM ERROR_LOG")
+    max_error_id = cursor.fetchone()[0]
+    return max_sesion_ts, max_error_id
+
+
+# Las claves (EMPLOYEE_ID, METRIC_DATE) afectadas se recalculan completas a partir
+# de los logs crudos de ese día, en lugar de sumar deltas: así una sesión que se
+# actualiza dos veces o un re-run tras un fallo no duplican conteos. Son las claves
+# nuevas y las anteriores (ROLLUP_SESSION_KEYS) de las sesiones que cambiaron, las
+# de sesiones borradas, las de errores nuevos y, con --completo, todas las que ya
+# están en la tabla. Una clave afectada sin sesiones completadas se borra.
+SQL_MERGE_METRICAS = """
+MERGE INTO EMPLOYEE_PERFORMANCE_METRICS m
+USING (
+    WITH claves_afectadas AS (
+        SELECT s.EMPLOYEE_ID, TO_DATE(s.START_TIME) AS METRIC_DATE
+        FROM INVENTORY_SESSIONS s
+        WHERE s.UPDATED_AT > %(desde_sesion_ts)s
+          AND s.UPDATED_AT <= %(hasta_sesion_ts)s
+        UNION
+        SELECT k.EMPLOYEE_ID, k.METRIC_DATE
+        FROM ROLLUP_SESSION_KEYS k
+        JOIN INVENTORY_SESSIONS s ON s.SESSION_ID = k.SESSION_ID
+        WHERE s.UPDATED_AT > %(desde_sesion_ts)s
+          AND s.UPDATED_AT <= %(hasta_sesion_ts)s
+        UNION
+        SELECT k.EMPLOYEE_ID, k.METRIC_DATE
+        FROM ROLLUP_SESSION_KEYS k
+        LEFT JOIN INVENTORY_SESSIONS s ON s.SESSION_ID = k.SESSION_ID
+        WHERE s.SESSION_ID IS NULL
+        UNION
+        SELECT s.EMPLOYEE_ID, TO_DATE(s.START_TIME) AS METRIC_DATE
+        FROM ERROR_LOG e
+        JOIN INVENTORY_SESSIONS s ON e.SESSION_ID = s.SESSION_ID
+        WHERE e.ERROR_ID > %(desde_error_id)s
+          AND e.ERROR_ID <= %(hasta_error_id)s
+        UNION
+        SELECT EMPLOYEE_ID, METRIC_DATE
+        FROM EMPLOYEE_PERFORMANCE_METRICS
+        WHERE %(completo)s
+    ),
+    sesiones AS (
+        SELECT
+            s.EMPLOYEE_ID,
+            TO_DATE(s.START_TIME) AS METRIC_DATE,
+            COUNT(DISTINCT s.SESSION_ID) AS TOTAL_SESSIONS,
+            COUNT(DISTINCT s.CART_ID) AS TOTAL_CARTS_COMPLETED,
+            COALESCE(SUM(s.ITEMS_SCANNED), 0) AS TOTAL_ITEMS_PROCESSED,
+            COALESCE(SUM(s.ERRORS_DETECTED), 0) AS ERRORES_SESION,
+            COALESCE(SUM(s.DURATION_SECONDS), 0) AS TOTAL_DURATION_SECONDS
+        FROM INVENTORY_SESSIONS s
+        JOIN claves_afectadas k
+          ON s.EMPLOYEE_ID = k.EMPLOYEE_ID
+         AND TO_DATE(s.START_TIME) = k.METRIC_DATE
+        WHERE s.STATUS = 'COMPLETED'
+        GROUP BY s.EMPLOYEE_ID, TO_DATE(s.START_TIME)
+    ),
+    errores AS (
+        SELECT
+            s.EMPLOYEE_ID,
+            TO_DATE(s.START_TIME) AS METRIC_DATE,
+            COUNT(*) AS ERRORES_LOG
+        FROM ERROR_LOG e
+        JOIN INVENTORY_SESSIONS s ON e.SESSION_ID = s.SESSION_ID
+        JOIN claves_afectadas k
+          ON s.EMPLOYEE_ID = k.EMPLOYEE_ID
+         AND TO_DATE(s.START_TIME) = k.METRIC_DATE
+        WHERE s.STATUS = 'COMPLETED'
+        GROUP BY s.EMPLOYEE_ID, TO_DATE(s.START_TIME)
+    ),
+    agregados AS (
+        SELECT
+            ses.EMPLOYEE_ID,
+            ses.METRIC_DATE,
+            ses.TOTAL_SESSIONS,
+            ses.TOTAL_CARTS_COMPLETED,
+            ses.TOTAL_ITEMS_PROCESSED,
+            -- El contador de la sesión puede quedarse atrás si los errores se registran después de cerrarla
+            GREATEST(ses.ERRORES_SESION, COALESCE(err.ERRORES_LOG, 0)) AS TOTAL_ERRORS,
+            ses.TOTAL_DURATION_SECONDS
+        FROM sesiones ses
+        LEFT JOIN errores err
+          ON ses.EMPLOYEE_ID = err.EMPLOYEE_ID
+         AND ses.METRIC_DATE = err.METRIC_DATE
+    )
+    -- Las claves sin agregados traen TOTAL_SESSIONS en NULL: se borran
+    SELECT
+        k.EMPLOYEE_ID,
+        k.METRIC_DATE,
+        a.TOTAL_SESSIONS,
+        a.TOTAL_CARTS_COMPLETED,
+        a.TOTAL_ITEMS_PROCESSED,
+        a.TOTAL_ERRORS,
+        a.TOTAL_DURATION_SECONDS,
+        ROUND(a.TOTAL_DURATION_SECONDS / NULLIF(a.TOTAL_CARTS_COMPLETED, 0), 2) AS AVG_TIME_PER_CART_SECONDS,
+        ROUND(a.TOTAL_ERRORS * 100.0 / NULLIF(a.TOTAL_ITEMS_PROCESSED, 0), 2) AS ERROR_RATE_PERCENT,
+        ROUND(a.TOTAL_ITEMS_PROCESSED / NULLIF(a.TOTAL_DURATION_SECONDS / 3600.0, 0), 2) AS ITEMS_PER_HOUR,
+        ROUND(100 - (a.TOTAL_ERRORS * 100.0 / NULLIF(a.TOTAL_ITEMS_PROCESSED, 0)), 2) AS ACCURACY_SCORE
+    FROM claves_afectadas k
+    LEFT JOIN agregados a
+      ON k.EMPLOYEE_ID = a.EMPLOYEE_ID
+     AND k.METRIC_DATE = a.METRIC_DATE
+) src
+ON m.EMPLOYEE_ID = src.EMPLOYEE_ID AND m.METRIC_DATE = src.METRIC_DATE
+WHEN MATCHED AND src.TOTAL_SESSIONS IS NULL THEN DELETE
+WHEN MATCHED THEN UPDATE SET
+    TOTAL_SESSIONS = src.TOTAL_SESSIONS,
+    TOTAL_CARTS_COMPLETED = src.TOTAL_CARTS_COMPLETED,
+    TOTAL_ITEMS_PROCESSED = src.TOTAL_ITEMS_PROCESSED,
+    TOTAL_ERRORS = src.TOTAL_ERRORS,
+    TOTAL_DURATION_SECONDS = src.TOTAL_DURATION_SECONDS,
+    AVG_TIME_PER_CART_SECONDS = src.AVG_TIME_PER_CART_SECONDS,
+    ERROR_RATE_PERCENT = src.ERROR_RATE_PERCENT,
+    ITEMS_PER_HOUR = src.ITEMS_PER_HOUR,
+    ACCURACY_SCORE = src.ACCURACY_SCORE,
+    UPDATED_AT = CURRENT_TIMESTAMP()
+WHEN NOT MATCHED AND src.TOTAL_SESSIONS IS NOT NULL THEN INSERT (
+    EMPLOYEE_ID, METRIC_DATE, TOTAL_SESSIONS, TOTAL_CARTS_COMPLETED,
+    TOTAL_ITEMS_PROCESSED, TOTAL_ERRORS, TOTAL_DURATION_SECONDS,
+    AVG_TIME_PER_CART_SECONDS, ERROR_RATE_PERCENT, ITEMS_PER_HOUR, ACCURACY_SCORE
+) VALUES (
+    src.EMPLOYEE_ID, src.METRIC_DATE, src.TOTAL_SESSIONS, src.TOTAL_CARTS_COMPLETED,
+    src.TOTAL_ITEMS_PROCESSED, src.TOTAL_ERRORS, src.TOTAL_DURATION_SECONDS,
+    src.AVG_TIME_PER_CART_SECONDS, src.ERROR_RATE_PERCENT, src.ITEMS_PER_HOUR, src.ACCURACY_SCORE
+)
+"""
+
+# Después del MERGE de métricas: la clave con que quedó cada sesión procesada,
+# y fuera las de sesiones borradas (ya se recalcularon)
+SQL_MERGE_CLAVES_SESIONES = """
+MERGE INTO ROLLUP_SESSION_KEYS k
+USING (
+    SELECT SESSION_ID, EMPLOYEE_ID, TO_DATE(START_TIME) AS METRIC_DATE
+    FROM INVENTORY_SESSIONS
+    WHERE UPDATED_AT > %(desde_sesion_ts)s
+      AND UPDATED_AT <= %(hasta_sesion_ts)s
+) src
+ON k.SESSION_ID = src.SESSION_ID
+WHEN MATCHED THEN UPDATE SET
+    EMPLOYEE_ID = src.EMPLOYEE_ID,
+    METRIC_DATE = src.METRIC_DATE,
+    UPDATED_AT = CURRENT_TIMESTAMP()
+WHEN NOT MATCHED THEN INSERT (SESSION_ID, EMPLOYEE_ID, METRIC_DATE)
+VALUES (src.SESSION_ID, src.EMPLOYEE_ID, src.METRIC_DATE)
+"""
+
+SQL_BORRAR_CLAVES_HUERFANAS = """
+DELETE FROM ROLLUP_SESSION_KEYS k
+WHERE NOT EXISTS (SELECT 1 FROM INVENTORY_SESSIONS s WHERE s.SESSION_ID = k.SESSION_ID)
+"""
+
+# Errores por día y tipo (VW_ERROR_TYPE_DISTRIBUTION): se recalculan completos los
+# días con errores nuevos (o todos con --completo); un tipo que ya no tiene errores
+# ese día se borra
+SQL_MERGE_ERRORES_POR_TIPO = """
+MERGE INTO ERROR_TYPE_DAILY_METRICS t
+USING (
+    WITH dias_afectados AS (
+        SELECT TO_DATE(CREATED_AT) AS METRIC_DATE
+        FROM ERROR_LOG
+        WHERE ERROR_ID > %(desde_error_id)s
+          AND ERROR_ID <= %(hasta_error_id)s
+        UNION
+        SELECT METRIC_DATE
+        FROM ERROR_TYPE_DAILY_METRICS
+        WHERE %(completo)s
+    ),
+    conteos AS (
+        SELECT
+            TO_DATE(e.CREATED_AT) AS METRIC_DATE,
+            e.ERROR_TYPE,
+            COUNT(*) AS ERROR_COUNT,
+            SUM(CASE WHEN e.SEVERITY = 'CRITICAL' THEN 1 ELSE 0 END) AS CRITICAL_COUNT
+        FROM ERROR_LOG e
+        JOIN dias_afectados d ON TO_DATE(e.CREATED_AT) = d.METRIC_DATE
+        GROUP BY TO_DATE(e.CREATED_AT), e.ERROR_TYPE
+    ),
+    claves AS (
+        SELECT t.METRIC_DATE, t.ERROR_TYPE
+        FROM ERROR_TYPE_DAILY_METRICS t
+        JOIN dias_afectados d ON t.METRIC_DATE = d.METRIC_DATE
+        UNION
+        SELECT METRIC_DATE, ERROR_TYPE
+        FROM conteos
+    )
+    SELECT c.METRIC_DATE, c.ERROR_TYPE, n.ERROR_COUNT, n.CRITICAL_COUNT
+    FROM claves c
+    LEFT JOIN conteos n
+      ON c.METRIC_DATE = n.METRIC_DATE
+     AND c.ERROR_TYPE = n.ERROR_TYPE
+) src
+ON t.METRIC_DATE = src.METRIC_DATE AND t.ERROR_TYPE = src.ERROR_TYPE
+WHEN MATCHED AND src.ERROR_COUNT IS NULL THEN DELETE
+WHEN MATCHED THEN UPDATE SET
+    ERROR_COUNT = src.ERROR_COUNT,
+    CRITICAL_COUNT = src.CRITICAL_COUNT,
+    UPDATED_AT = CURRENT_TIMESTAMP()
+WHEN NOT MATCHED AND src.ERROR_COUNT IS NOT NULL THEN INSERT (METRIC_DATE, ERROR_TYPE, ERROR_COUNT, CRITICAL_COUNT)
+VALUES (src.METRIC_DATE, src.ERROR_TYPE, src.ERROR_COUNT, src.CRITICAL_COUNT)
+"""
+
+SQL_MERGE_WATERMARK = """
+MERGE INTO ROLLUP_WATERMARKS w
+USING (
+    SELECT %(job)s AS JOB_NAME,
+           %(sesion_ts)s::TIMESTAMP_NTZ AS LAST_SESSION_UPDATED_AT,
+           %(error_id)s::INTEGER AS LAST_ERROR_ID
+) src
+ON w.JOB_NAME = src.JOB_NAME
+WHEN MATCHED THEN UPDATE SET
+    LAST_SESSION_UPDATED_AT = src.LAST_SESSION_UPDATED_AT,
+    LAST_ERROR_ID = src.LAST_ERROR_ID,
+    UPDATED_AT = CURRENT_TIMESTAMP()
+WHEN NOT MATCHED THEN INSERT (JOB_NAME, LAST_SESSION_UPDATED_AT, LAST_ERROR_ID)
+VALUES (src.JOB_NAME, src.LAST_SESSION_UPDATED_AT, src.LAST_ERROR_ID)
+"""
+
+
+def ejecutar_rollup(completo=False):
+    """
+    Ejecuta una corrida del rollup dentro de una sola transacción:
+    los MERGE de métricas, de claves de sesión y de errores por tipo y el
+    avance de la marca de agua se confirman juntos, así que una corrida
+    fallida no deja la marca adelantada.
+    """
+    conn = None
+    try:
+        conn = get_connection()
+        cursor = conn.cursor()
+
+        crear_tablas_rollup(cursor)
+
+        if completo:
+            desde_sesion_ts, desde_error_id = WATERMARK_INICIAL_TS, WATERMARK_INICIAL_ERROR_ID
+        else:
+            desde_sesion_ts, desde_error_id = leer_watermark(cursor)
+
+        hasta_sesion_ts, hasta_error_id = leer_limite_superior(cursor)
+        if hasta_sesion_ts is None:
+            hasta_sesion_ts = desde_sesion_ts
+        if hasta_error_id is None:
+            hasta_error_id = desde_error_id
+
+        print(f"Procesando sesiones en ({desde_sesion_ts}, {hasta_sesion_ts}] "
+              f"y errores en ({desde_error_id}, {hasta_error_id}]", file=sys.stderr)
+
+        ventana = {
+            'desde_sesion_ts': desde_sesion_ts,
+            'hasta_sesion_ts': hasta_sesion_ts,
+            'desde_error_id': desde_error_id,
+            'hasta_error_id': hasta_error_id,
+            'completo': completo,
+        }
+
+        cursor.execute("BEGIN")
+        # Las métricas primero: leen las claves anteriores de las sesiones antes de actualizarlas
+        cursor.execute(SQL_MERGE_METRICAS, ventana)
+        filas_afectadas = cursor.rowcount
+        cursor.execute(SQL_MERGE_CLAVES_SESIONES, ventana)
+        cursor.execute(SQL_BORRAR_CLAVES_HUERFANAS)
+        cursor.execute(SQL_MERGE_ERRORES_POR_TIPO, ventana)
+        filas_errores = cursor.rowcount
+
+        cursor.execute(SQL_MERGE_WATERMARK, {
+            'job': NOMBRE_JOB,
+            'sesion_ts': hasta_sesion_ts,
+            'error_id': hasta_error_id,
+        })
+        conn.commit()
+
+        return {
+            "success": True,
+            "job": NOMBRE_JOB,
+            "filas_fusionadas": filas_afectadas,
+            "filas_errores_por_tipo": filas_errores,
+            "watermark_sesiones": str(hasta_sesion_ts),
+            "watermark_errores": hasta_error_id
+        }
+
+    except Exception as e:
+        if conn:
+            conn.rollback()
+        print(f"Error en rollup de métricas: {e}", file=sys.stderr)
+        return {"success": False, "error": str(e)}
+    finally:
+        if conn:
+            conn.close()
+
+
+if __name__ == "__main__":
+    completo = '--completo' in sys.argv[1:]
+    resultado = ejecutar_rollup(completo=completo)
+    print(json.dumps(resultado, ensure_ascii=False))
+
+    if not resultado.get("success"):
+        sys.exit(1)
@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+"""
+Servicio asyncio de carga de órdenes y validación de inventario.
+
+Un solo proceso atiende a muchas estaciones a la vez en lugar de lanzar un
+script por petición:
+- Las consultas a Snowflake (bloqueantes) corren en un pool de hilos acotado.
+- Las peticiones concurrentes del mismo vuelo comparten una sola consulta
+  en curso (single-flight).
+- La validación y el solver de discrepancias (CPU) corren en un pool de procesos.
+  La orden se carga una vez en el almacén compartido del host
+  (almacen_planes.py) y los workers la leen de ahí por mmap, sin copias.
+- Un reenvío idéntico de /validar regresa el reporte guardado, y los
+  duplicados simultáneos esperan al primero (ver cache_validaciones.py).
+
+Expone HTTP/JSON con los mismos cuerpos que los endpoints de server.js:
+    POST /orden    {"flight_number": "AM241"}
+    POST /validar  {"flight_number": "AM241", "scanned_data": [...]}
+    GET  /salud
+    GET  /metricas  (texto de Prometheus, ver metricas.py)
+
+Uso:
+    python3 servicio_validacion.py [puerto]
+"""
+
+import asyncio
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from cache_validaciones import clave_validacion, guardar_validacion, leer_validacion
+from metricas import iniciar_worker, texto_prometheus, volcar
+from resolutor_skus import cargar_resolutor, resolutor_por_huella
+from almacen_planes import abrir_planes
+from validate_inventory import (carritos_escaneados, obtener_orden_vuelo, publicar_en_almacen, validar_contra_orden,
+                                validar_desde_almacen)
+
+SERVICIO_HOST = os.getenv('SERVICIO_HOST', '127.0.0.1')
+SERVICIO_PUERTO = int(os.getenv('SERVICIO_PUERTO', '8765'))
+
+# Consultas simultáneas máximas contra el warehouse
+MAX_CONSULTAS_CONCURRENTES = int(os.getenv('MAX_CONSULTAS_CONCURRENTES', '8'))
+
+# Procesos para validación/solver (None = uno por CPU)
+PROCESOS_SOLVER = int(os.getenv('PROCESOS_SOLVER', '0')) or None
+
+# Igual que el límite de express.json en server.js
+MAX_CUERPO_BYTES = 50 * 1024 * 1024
+
+MENSAJES_HTTP = {200: "OK", 400: "Bad Request", 404: "Not Found", 413: "Payload Too Large",
+                 500: "Internal Server Error"}
+
+
+class SingleFlight:
+    """
+    Agrupa llamadas concurrentes con la misma clave: la primera ejecuta la
+    función y las demás esperan su mismo resultado (o excepción).
+    """
+
+    def __init__(self):
+        self._en_vuelo = {}
+
+    async def ejecutar(self, clave, funcion):
+        futuro = self._en_vuelo.get(clave)
+        if futuro is not None:
+            # shield: si una de las esperas se cancela, no se cancela la consulta compartida
+            return await asyncio.shield(futuro)
+
+        futuro = asyncio.ensure_future(funcion())
+        self._en_vuelo[clave] = futuro
+        try:
+            return await asyncio.shield(futuro)
+        finally:
+            if self._en_vuelo.get(clave) is futuro:
+                del self._en_vuelo[clave]
+
+
+def _en_worker(funcion, *args):
+    """Corre una tarea en un worker del pool y vuelca sus métricas al terminarla"""
+    try:
+        return funcion(*args)
+    finally:
+        volcar()
+
+
+def _validar_en_worker(validar, huella_catalogo, *args):
+    """
+    validar(*args, resolutor) en un worker. Solo viaja la huella del índice
+    de SKUs: el worker arma su resolutor una vez por huella y conserva su memo.
+    """
+    return validar(*args, resolutor_por_huella(huella_catalogo))
+
+
+class ServicioValidacion:
+    """Orquesta la carga de órdenes (hilos) y la validación (procesos)"""
+
+    def __init__(self, max_consultas=MAX_CONSULTAS_CONCURRENTES, procesos=PROCESOS_SOLVER):
+        self.hilos_warehouse = ThreadPoolExecutor(max_workers=max_consultas, thread_name_prefix='warehouse')
+        self.procesos_solver = ProcessPoolExecutor(max_workers=procesos, initializer=iniciar_worker)
+        self.ordenes_en_vuelo = SingleFlight()
+        self.planes_en_vuelo = SingleFlight()
+        self.validaciones_en_vuelo = SingleFlight()
+
+    async def obtener_orden(self, flight_number, cart_ids=None):
+        """
+        Orden del vuelo (solo los carritos 'cart_ids' si se pasan); las
+        peticiones simultáneas de la misma orden comparten la consulta.
+        """
+        loop = asyncio.get_running_loop()
+        clave = (flight_number, None if cart_ids is None else tuple(sorted(cart_ids)))
+        return await self.ordenes_en_vuelo.ejecutar(
+            clave,
+            lambda: loop.run_in_executor(self.hilos_warehouse, obtener_orden_vuelo, flight_number, cart_ids)
+        )
+
+    async def publicar_planes(self, flight_number):
+        """
+        True si la orden vigente del vuelo está en el almacén compartido; si
+        no, la carga completa (una sola vez para las peticiones simultáneas).
+        """
+        if abrir_planes(flight_number) is not None:
+            return True
+        loop = asyncio.get_running_loop()
+        return await self.planes_en_vuelo.ejecutar(
+            flight_number,
+            lambda: loop.run_in_executor(self.hilos_warehouse, publicar_en_almacen, flight_number)
+        )
+
+    async def validar(self, flight_number, scanned_data):
+        """Equivalente asíncrono de validate_inventory.validar_inventario"""
+        clave = clave_validacion(flight_number, scanned_data)
+        guardado = leer_validacion(clave)
+        if guardado is not None:
+            return guardado
+        return await self.validaciones_en_vuelo.ejecutar(
+            clave, lambda: self._validar_y_guardar(clave, flight_number, scanned_data))
+
+    async def _validar_y_guardar(self, clave, flight_number, scanned_data):
+        resultado = await self._validar_sin_cache(flight_number, scanned_data)
+        try:
+            guardar_validacion(clave, resultado)
+        except OSError as e:
+            print(f"Advertencia: no se pudo guardar la validación en cache: {e}", file=sys.stderr)
+        return resultado
+
+    async def _validar_sin_cache(self, flight_number, scanned_data):
+        loop = asyncio.get_running_loop()
+        cart_ids = carritos_escaneados(scanned_data)
+        resolutor = await loop.run_in_executor(self.hilos_warehouse, cargar_resolutor)
+        huella_catalogo = None if resolutor is None else resolutor.indice["huella"]
+
+        # Los workers leen los carritos escaneados del almacén compartido
+        if await self.publicar_planes(flight_number):
+            resultado = await loop.run_in_executor(
+                self.procesos_solver, _en_worker, _validar_en_worker, validar_desde_almacen, huella_catalogo,
+                flight_number, cart_ids, scanned_data
+            )
+            if resultado is not None:
+                return resultado
+
+        # Sin almacén (o con la orden de respaldo) la orden viaja con la petición
+        datos_orden = await self.obtener_orden(flight_number, cart_ids)
+        if not datos_orden:
+            return {"error": f"Vuelo '{flight_number}' no encontrado o sin carritos asignados."}
+
+        return await loop.run_in_executor(
+            self.procesos_solver, _en_worker, _validar_en_worker, validar_contra_orden, huella_catalogo,
+            flight_number, datos_orden, scanned_data
+        )
+
+    def cerrar(self):
+        self.hilos_warehouse.shutdown(wait=False)
+        self.procesos_solver.shutdown(wait=True)
+
+
+# --- HTTP MÍNIMO ---
+async def _leer_peticion(reader):
+    """Regresa (metodo, ruta, cuerpo_json) o lanza ValueError si la petición es inválida"""
+    linea = await reader.readline()
+    if not linea:
+        raise ConnectionResetError()
+    partes = linea.decode('latin-1').split()
+    if len(partes) < 2:
+        raise ValueError("Línea de petición inválida")
+    metodo, ruta = partes[0].upper(), partes[1]
+
+    encabezados = {}
+    while True:
+        linea = await reader.readline()
+        if linea in (b'\r\n', b'\n', b''):
+            break
+        nombre, _, valor = linea.decode('latin-1').partition(':')
+        encabezados[nombre.strip().lower()] = valor.strip()
+
+    longitud = int(encabezados.get('content-length', '0') or 0)
+    if longitud > MAX_CUERPO_BYTES:
+        raise OverflowError()
+    cuerpo = json.loads(await reader.readexactly(longitud)) if longitud else {}
+    return metodo, ruta, cuerpo
+
+
+async def _responder(writer, codigo, datos):
+    """'datos' se responde como JSON, o tal cual si ya es texto"""
+    if isinstance(datos, str):
+        cuerpo, tipo = datos.encode('utf-8'), "text/plain; version=0.0.4; charset=utf-8"
+    else:
+        cuerpo, tipo = json.dumps(datos, ensure_ascii=False).encode('utf-8'), "application/json; charset=utf-8"
+    writer.write(
+        f"HTTP/1.1 {codigo} {MENSAJES_HTTP.get(codigo, '')}\r\n"
+        f"Content-Type: {tipo}\r\n"
+        f"Content-Length: {len(cuerpo)}\r\n"
+        f"Connection: close\r\n\r\n".encode('latin-1') + cuerpo
+    )
+    await writer.drain()
+    writer.close()
+
+
+async def _despachar(servicio, metodo, ruta, cuerpo):
+    """Regresa (codigo_http, respuesta_json)"""
+    if metodo == 'GET' and ruta == '/salud':
+        return 200, {"status": "ok"}
+
+    if metodo == 'GET' and ruta in ('/metricas', '/metrics'):
+        return 200, texto_prometheus()
+
+    if metodo != 'POST' or ruta not in ('/orden', '/validar'):
+        return 404, {"error": f"Ruta no encontrada: {metodo} {ruta}"}
+
+    flight_number = cuerpo.get('flight_number') if isinstance(cuerpo, dict) else None
+    if not flight_number:
+        return 400, {"error": "flight_number es requerido"}
+
+    if ruta == '/orden':
+        datos_orden = await servicio.obtener_orden(flight_number)
+        if not datos_orden:
+            return 404, {"error": f"Vuelo '{flight_number}' no encontrado o sin carritos asignados."}
+        return 200, datos_orden
+
+    scanned_data = cuerpo.get('scanned_data')
+    if not isinstance(scanned_data, list):
+        return 400, {"error": "flight_number y scanned_data (array) son requeridos"}
+
+    resultado = await servicio.validar(flight_number, scanned_data)
+    return (400 if "error" in resultado else 200), resultado
+
+
+def crear_manejador(servicio):
+    async def manejar(reader, writer):
+        try:
+            metodo, ruta, cuerpo = await _leer_peticion(reader)
+        except ConnectionResetError:
+            writer.close()
+            return
+        except OverflowError:
+            await _responder(writer, 413, {"error": "Cuerpo demasiado grande"})
+            return
+        except (ValueError, asyncio.IncompleteReadError) as e:
+            await _responder(writer, 400, {"error": f"Petición inválida: {e}"})
+            return
+
+        try:
+            codigo, respuesta = await _despachar(servicio, metodo, ruta, cuerpo)
+        except Exception as e:
+            print(f"Error atendiendo {metodo} {ruta}: {e}", file=sys.stderr)
+            codigo, respuesta = 500, {"error": f"Error interno: {e}"}
+        await _responder(writer, codigo, respuesta)
+
+    return manejar
+
+
+async def main(puerto=SERVICIO_PUERTO):
+    servicio = ServicioValidacion()
+    servidor = await asyncio.start_server(crear_manejador(servicio), SERVICIO_HOST, puerto)
+    print(f"Servicio de validación escuchando en http://{SERVICIO_HOST}:{puerto}", file=sys.stderr)
+    try:
+        async with servidor:
+            await servidor.serve_forever()
+    finally:
+        servicio.cerrar()
+
+
+if __name__ == "__main__":
+    puerto = int(sys.argv[1]) if len(sys.argv) > 1 else SERVICIO_PUERTO
+    try:
+        asyncio.run(main(puerto))
+    except KeyboardInterrupt:
+        pass
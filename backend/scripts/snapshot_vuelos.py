@@ -0,0 +1,383 @@
+#!/usr/bin/env python3
+"""
+Snapshot de las órdenes de un día para las estaciones de galley.
+
+Las estaciones pedían cada orden al API (y éste al warehouse) al momento de
+escanear. exportar_snapshot() escribe en un solo archivo las órdenes de
+todas las salidas de una fecha, codificadas con formato_planes.py, junto con
+el índice de SKUs del catálogo (resolutor_skus.py):
+
+    cabecera   CABECERA
+    fecha      utf-8
+    vuelos     n_vuelos   x VUELO    bloque de la orden, número de vuelo y order_version
+    índice     capacidad  x RANURA   tabla hash número de vuelo -> vuelo (sondeo lineal)
+    nombres    utf-8: números de vuelo
+    órdenes    un bloque de formato_planes.py por vuelo
+    catálogo   JSON del índice de SKUs (vacío si no se pudo leer PRODUCTS)
+
+La cabecera lleva el formato, la hora de generación y una huella del
+contenido; cada reporte validado con el archivo dice de cuál salió. Con
+SNAPSHOT_VUELOS_PATH apuntando al archivo, validate_inventory.py lo abre con
+mmap y valida sin red los vuelos que trae: encontrar el vuelo y luego el
+carrito es O(1) y solo se decodifican los carritos escaneados. El snapshot
+solo se usa el día de su fecha y si su versión de la orden no es más vieja
+que la que la estación ya conoce; los demás casos, y los vuelos que no vienen
+en el snapshot, siguen por el camino de siempre.
+
+El archivo se reemplaza con os.replace: una estación que ya lo tenía mapeado
+termina con el anterior y la siguiente validación abre el nuevo.
+
+Uso:
+    python3 snapshot_vuelos.py --exportar [--fecha AAAA-MM-DD] [--salida ruta]
+    python3 snapshot_vuelos.py [ruta]       # contenido del snapshot
+"""
+
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import zlib
+from datetime import date, datetime
+
+from cache_validaciones import marcador_version, marcar_republicacion
+from formato_planes import RANURA, RANURA_VACIA, PlanesBinarios, capacidad_indice, codificar_orden
+
+SNAPSHOT_VUELOS_PATH = os.getenv('SNAPSHOT_VUELOS_PATH', '')
+
+MAGIA = b'GGSN'
+FORMATO = 2
+
+# magia, formato, largo de la fecha, generada (epoch), n_vuelos, capacidad del índice,
+# offset y largo del catálogo, huella (blake2b de todo lo que sigue a la cabecera)
+CABECERA = struct.Struct('<4sHHdIIQQ16s')
+# offset del bloque en el archivo, largo del bloque, número de vuelo (offset, largo), order_version
+VUELO = struct.Struct('<QIIHI')
+
+
+def _ranura_vuelo(nombre, mascara):
+    return zlib.crc32(nombre) & mascara
+
+
+def codificar_snapshot(fecha, ordenes, versiones, indice_catalogo=None, generada=None):
+    """
+    Bytes del snapshot. 'ordenes' es {flight_number: {"carritos": [...]}},
+    'versiones' {flight_number: order_version} e 'indice_catalogo' el índice
+    de resolutor_skus.construir_indice (o None).
+    """
+    texto_fecha = str(fecha).encode('utf-8')
+    vuelos = sorted(ordenes)
+    capacidad = capacidad_indice(len(vuelos))
+
+    nombres = bytearray()
+    posiciones_nombres = []
+    for flight_number in vuelos:
+        nombre = str(flight_number).encode('utf-8')
+        posiciones_nombres.append((len(nombres), len(nombre)))
+        nombres.extend(nombre)
+
+    bloques = [codificar_orden(flight_number, ordenes[flight_number]["carritos"]) for flight_number in vuelos]
+    catalogo = b'' if indice_catalogo is None else json.dumps(
+        indice_catalogo, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+    o_vuelos = CABECERA.size + len(texto_fecha)
+    offset_bloque = o_vuelos + len(vuelos) * VUELO.size + capacidad * RANURA.size + len(nombres)
+    filas_vuelos = []
+    for flight_number, (offset_nombre, largo_nombre), bloque in zip(vuelos, posiciones_nombres, bloques):
+        filas_vuelos.append((offset_bloque, len(bloque), offset_nombre, largo_nombre,
+                             int(versiones.get(flight_number) or 1)))
+        offset_bloque += len(bloque)
+
+    indice = [RANURA_VACIA] * capacidad
+    for i, (offset_nombre, largo_nombre) in enumerate(posiciones_nombres):
+        ranura = _ranura_vuelo(bytes(nombres[offset_nombre:offset_nombre + largo_nombre]), capacidad - 1)
+        while indice[ranura] != RANURA_VACIA:
+            ranura = (ranura + 1) & (capacidad - 1)
+        indice[ranura] = i
+
+    cuerpo = b''.join([texto_fecha]
+                      + [VUELO.pack(*fila) for fila in filas_vuelos]
+                      + [RANURA.pack(ranura) for ranura in indice]
+                      + [bytes(nombres)] + bloques + [catalogo])
+    generada = datetime.now().timestamp() if generada is None else generada
+    huella = hashlib.blake2b(cuerpo, digest_size=16).digest()
+    return CABECERA.pack(MAGIA, FORMATO, len(texto_fecha), generada, len(vuelos), capacidad,
+                         offset_bloque, len(catalogo), huella) + cuerpo
+
+
+class SnapshotVuelos:
+    """Lectura en su lugar de un snapshot (bytes o mmap)"""
+
+    def __init__(self, buffer):
+        self._buf = memoryview(buffer)
+        (magia, formato, largo_fecha, self.generada, self.n_vuelos, self._capacidad,
+         self._o_catalogo, self._largo_catalogo, huella) = CABECERA.unpack_from(self._buf)
+        if magia != MAGIA or formato != FORMATO:
+            raise ValueError(f"No es un snapshot de vuelos compatible (magia {magia!r}, formato {formato})")
+        if self._o_catalogo + self._largo_catalogo > len(self._buf):
+            raise ValueError("Snapshot de vuelos truncado")
+
+        self.huella = huella.hex()
+        self.fecha = str(self._buf[CABECERA.size:CABECERA.size + largo_fecha], 'utf-8')
+        self._o_vuelos = CABECERA.size + largo_fecha
+        self._o_indice = self._o_vuelos + self.n_vuelos * VUELO.size
+        self._o_nombres = self._o_indice + self._capacidad * RANURA.size
+        self._planes = {}
+        self._resolutor = None
+
+    def _fila_vuelo(self, i):
+        return VUELO.unpack_from(self._buf, self._o_vuelos + i * VUELO.size)
+
+    def _nombre(self, fila):
+        inicio = self._o_nombres + fila[2]
+        return bytes(self._buf[inicio:inicio + fila[3]])
+
+    def _fila(self, flight_number):
+        """Fila VUELO del vuelo, o None si no viene en el snapshot"""
+        if not self.n_vuelos:
+            return None
+        nombre = str(flight_number).encode('utf-8')
+        mascara = self._capacidad - 1
+        ranura = _ranura_vuelo(nombre, mascara)
+        while True:
+            (i,) = RANURA.unpack_from(self._buf, self._o_indice + ranura * RANURA.size)
+            if i == RANURA_VACIA:
+                return None
+            fila = self._fila_vuelo(i)
+            if self._nombre(fila) == nombre:
+                return fila
+            ranura = (ranura + 1) & mascara
+
+    def __contains__(self, flight_number):
+        return self._fila(flight_number) is not None
+
+    def vuelos(self):
+        return [str(self._nombre(self._fila_vuelo(i)), 'utf-8') for i in range(self.n_vuelos)]
+
+    def planes(self, flight_number):
+        """PlanesBinarios de la orden del vuelo, o None"""
+        planes = self._planes.get(flight_number)
+        if planes is None:
+            fila = self._fila(flight_number)
+            if fila is None:
+                return None
+            planes = self._planes[flight_number] = PlanesBinarios(self._buf, inicio=fila[0])
+        return planes
+
+    def orden(self, flight_number, cart_ids=None):
+        """La orden del vuelo (solo los carritos 'cart_ids' si se pasan), o None"""
+        planes = self.planes(flight_number)
+        return None if planes is None else planes.orden(cart_ids)
+
+    def version(self, flight_number):
+        """order_version del vuelo en el snapshot, o None"""
+        fila = self._fila(flight_number)
+        return None if fila is None else fila[4]
+
+    def resolutor(self):
+        """ResolutorSkus del catálogo del snapshot (se parsea la primera vez), o None"""
+        if self._resolutor is None and self._largo_catalogo:
+            from resolutor_skus import ResolutorSkus
+
+            catalogo = self._buf[self._o_catalogo:self._o_catalogo + self._largo_catalogo]
+            self._resolutor = ResolutorSkus(json.loads(str(catalogo, 'utf-8')))
+        return self._resolutor
+
+    def descripcion(self, flight_number=None):
+        descripcion = {
+            "fecha": self.fecha,
+            "generada": datetime.fromtimestamp(self.generada).isoformat(),
+            "huella": self.huella,
+        }
+        if flight_number is not None:
+            descripcion["order_version"] = self.version(flight_number)
+        return descripcion
+
+
+_abierto = {}
+
+
+def abrir_snapshot(ruta=None):
+    """
+    SnapshotVuelos del archivo (SNAPSHOT_VUELOS_PATH por defecto), mapeado
+    una vez por proceso mientras no se reemplace; None si no hay o no sirve.
+    """
+    ruta = SNAPSHOT_VUELOS_PATH if ruta is None else ruta
+    if not ruta:
+        return None
+    try:
+        estado = os.stat(ruta)
+    except FileNotFoundError:
+        print(f"Advertencia: no existe el snapshot de vuelos {ruta}.", file=sys.stderr)
+        return None
+
+    clave = (ruta, estado.st_ino, estado.st_mtime_ns)
+    if clave not in _abierto:
+        try:
+            with open(ruta, 'rb') as f:
+                snapshot = SnapshotVuelos(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+        except (OSError, ValueError, struct.error) as e:
+            print(f"Advertencia: snapshot de vuelos ilegible en {ruta}: {e}", file=sys.stderr)
+            return None
+        _abierto.clear()
+        _abierto[clave] = snapshot
+    return _abierto[clave]
+
+
+_avisados = set()
+
+
+def _avisar(snapshot, flight_number, mensaje):
+    """Advierte una sola vez por proceso por snapshot, vuelo y motivo"""
+    if (snapshot.huella, flight_number, mensaje) not in _avisados:
+        _avisados.add((snapshot.huella, flight_number, mensaje))
+        print(f"Advertencia: {mensaje}; {flight_number} se valida con la orden del warehouse.", file=sys.stderr)
+
+
+def snapshot_para(flight_number, hoy=None):
+    """
+    El snapshot (SNAPSHOT_VUELOS_PATH) si sirve para validar el vuelo, o None.
+    Tiene que ser de hoy (el mismo número de vuelo sale todos los días) y su
+    order_version no puede ser más vieja que la del marcador local. Si es más
+    nueva avanza el marcador, lo que descarta los reportes guardados de la
+    versión anterior (cache_validaciones.py).
+    """
+    snapshot = abrir_snapshot()
+    if snapshot is None or flight_number not in snapshot:
+        return None
+
+    hoy = date.today().isoformat() if hoy is None else hoy
+    if snapshot.fecha != hoy:
+        _avisar(snapshot, flight_number, f"el snapshot de vuelos es del {snapshot.fecha} y hoy es {hoy}")
+        return None
+
+    version = snapshot.version(flight_number)
+    marcador = marcador_version(flight_number)
+    if marcador is not None:
+        local = (str(marcador['departure_date']), int(marcador['version']))
+        if local == (hoy, version):
+            return snapshot
+        if local > (hoy, version):
+            _avisar(snapshot, flight_number, f"el snapshot trae la versión {version} de la orden y ya se "
+                                             f"publicó la {local[1]} del {local[0]}")
+            return None
+    marcar_republicacion(flight_number, hoy, version)
+    return snapshot
+
+
+# --- EXPORTACIÓN ---
+def consultar_dia(cursor, fecha):
+    """
+    ({flight_number: orden}, {flight_number: order_version}) de las salidas
+    de la fecha: un scan de ORDER_PLAN y el join para los vuelos que no estén.
+    """
+    from plan_orden import leer_plan_orden
+    from precarga_vuelos import TAMANO_LOTE, consultar_lote_join
+
+    cursor.execute("""
+        SELECT flight_number, COALESCE(order_version, 1)
+        FROM Flights
+        WHERE departure_date = %s
+        ORDER BY flight_number
+    """, (fecha,))
+    versiones = {flight_number: version for flight_number, version in cursor.fetchall()}
+
+    ordenes = leer_plan_orden(cursor, "departure_date = %s", (fecha,))
+    faltantes = [flight_number for flight_number in versiones if flight_number not in ordenes]
+    for i in range(0, len(faltantes), TAMANO_LOTE):
+        ordenes.update(consultar_lote_join(cursor, faltantes[i:i + TAMANO_LOTE]))
+    return ordenes, versiones
+
+
+def exportar_snapshot(fecha, ruta):
+    """Escribe el snapshot de la fecha en 'ruta' (temporal + os.replace) y regresa un resumen"""
+    from conexion import conectar_snowflake
+    from resolutor_skus import guardar_indice
+
+    conn = conectar_snowflake(connect_timeout=30)
+    try:
+        with conn.cursor() as cursor:
+            ordenes, versiones = consultar_dia(cursor, fecha)
+            cursor.execute("SELECT sku, product_name FROM PRODUCTS ORDER BY sku")
+            filas_catalogo = [(row[0], row[1]) for row in cursor.fetchall()]
+    finally:
+        conn.close()
+
+    indice_catalogo = None
+    if filas_catalogo:
+        try:
+            indice_catalogo = guardar_indice(filas_catalogo)
+        except OSError as e:
+            print(f"Advertencia: no se pudo guardar el índice de SKUs: {e}", file=sys.stderr)
+            from resolutor_skus import construir_indice
+            indice_catalogo = construir_indice(filas_catalogo)
+
+    contenido = codificar_snapshot(fecha, ordenes, versiones, indice_catalogo)
+    directorio = os.path.dirname(os.path.abspath(ruta))
+    fd, ruta_tmp = tempfile.mkstemp(dir=directorio, suffix='.tmp')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(contenido)
+    os.replace(ruta_tmp, ruta)
+
+    return {
+        "success": True,
+        "ruta": ruta,
+        "fecha": str(fecha),
+        "vuelos": len(ordenes),
+        "vuelos_sin_carritos": sorted(set(versiones) - set(ordenes)),
+        "carritos": sum(len(orden["carritos"]) for orden in ordenes.values()),
+        "bytes": len(contenido),
+        "huella": SnapshotVuelos(contenido).huella,
+    }
+
+
+def resumen(snapshot):
+    vuelos = []
+    for flight_number in snapshot.vuelos():
+        planes = snapshot.planes(flight_number)
+        vuelos.append({"flight_number": flight_number, "order_version": snapshot.version(flight_number),
+                       "carritos": planes.n_carritos, "bytes": planes.tamano})
+    return dict(snapshot.descripcion(), catalogo=snapshot.resolutor() is not None, vuelos=vuelos)
+
+
+def _valor_argumento(argumentos, nombre, default):
+    if nombre not in argumentos:
+        return default
+    i = argumentos.index(nombre)
+    if i + 1 >= len(argumentos):
+        print(json.dumps({"error": f"{nombre} requiere un valor"}))
+        sys.exit(1)
+    return argumentos[i + 1]
+
+
+# --- MAIN EXECUTION ---
+if __name__ == "__main__":
+    argumentos = sys.argv[1:]
+
+    if "--exportar" in argumentos:
+        fecha = _valor_argumento(argumentos, "--fecha", date.today().isoformat())
+        try:
+            fecha = date.fromisoformat(fecha).isoformat()
+        except ValueError:
+            print(json.dumps({"error": f"Fecha inválida: {fecha} (se espera AAAA-MM-DD)"}, ensure_ascii=False))
+            sys.exit(1)
+        salida = _valor_argumento(argumentos, "--salida", SNAPSHOT_VUELOS_PATH or f"snapshot_vuelos_{fecha}.bin")
+        try:
+            print(json.dumps(exportar_snapshot(fecha, salida), ensure_ascii=False))
+        except Exception as e:
+            print(json.dumps({"success": False, "error": str(e)}))
+            sys.exit(1)
+        sys.exit(0)
+
+    if len(argumentos) > 1:
+        print(json.dumps({"error": "Uso: python3 snapshot_vuelos.py --exportar [--fecha AAAA-MM-DD] "
+                                   "[--salida ruta] | [ruta]"}))
+        sys.exit(1)
+
+    snapshot = abrir_snapshot(argumentos[0] if argumentos else None)
+    if snapshot is None:
+        print(json.dumps({"error": "No hay snapshot de vuelos (ruta o SNAPSHOT_VUELOS_PATH)"}))
+        sys.exit(1)
+    print(json.dumps(resumen(snapshot), ensure_ascii=False))
@@ -0,0 +1,87 @@
+"""
+Tabla de internado de SKUs para comparar plan contra visión con bits.
+
+Cada SKU de la orden recibe un id entero denso (en orden alfabético), y un
+conjunto de SKUs se guarda como un entero con un bit por id. Los faltantes y
+sobrantes de un carrito son entonces un par de operaciones de bits:
+
+    no_esperados  = detectados & ~esperados
+    no_detectados = esperados & ~detectados
+
+Los nombres solo se decodifican al armar el reporte. Una etiqueta de visión
+que no está en la orden se interna al vuelo con el siguiente id.
+
+La tabla del catálogo completo se arma una vez por huella (resolutor_skus.py)
+y no se modifica: cada validación trabaja sobre una extensión() que lee sus
+ids sin copiarlos e interna aparte las etiquetas y SKUs que no conoce. Así
+los ids del catálogo son los mismos en todas las validaciones del proceso.
+"""
+
+
+class TablaSkus:
+    """SKU <-> id denso; las máscaras son enteros de Python (sin límite de bits)"""
+
+    def __init__(self, skus=(), base=None):
+        self.ids = {}
+        self.nombres_por_id = []
+        self._base = base
+        self._n_base = 0 if base is None else len(base)
+        # Mientras los ids sigan el orden alfabético, decodificar no necesita sorted()
+        self._ordenada = True if base is None else base._ordenada
+        for sku in sorted(set(skus)):
+            self.id_de(sku)
+
+    def __len__(self):
+        return self._n_base + len(self.nombres_por_id)
+
+    def extension(self):
+        """Tabla con los mismos ids que ésta que interna aparte los SKUs nuevos"""
+        return TablaSkus(base=self)
+
+    def _ultimo(self):
+        if self.nombres_por_id:
+            return self.nombres_por_id[-1]
+        return self._base._ultimo() if self._base is not None else None
+
+    def _buscar(self, sku):
+        id_sku = self.ids.get(sku)
+        if id_sku is None and self._base is not None:
+            return self._base._buscar(sku)
+        return id_sku
+
+    def _nombre(self, id_sku):
+        if id_sku < self._n_base:
+            return self._base._nombre(id_sku)
+        return self.nombres_por_id[id_sku - self._n_base]
+
+    def id_de(self, sku):
+        """Id del SKU, internándolo si es nuevo"""
+        id_sku = self._buscar(sku)
+        if id_sku is None:
+            id_sku = len(self)
+            ultimo = self._ultimo()
+            if ultimo is not None and sku < ultimo:
+                self._ordenada = False
+            self.ids[sku] = id_sku
+            self.nombres_por_id.append(sku)
+        return id_sku
+
+    def mascara(self, skus):
+        """Máscara de bits de un iterable de SKUs"""
+        mascara = 0
+        for sku in skus:
+            mascara |= 1 << self.id_de(sku)
+        return mascara
+
+    def nombres(self, mascara):
+        """SKUs de la máscara en orden alfabético"""
+        nombres = []
+        while mascara:
+            bit_bajo = mascara & -mascara
+            nombres.append(self._nombre(bit_bajo.bit_length() - 1))
+            mascara ^= bit_bajo
+        return nombres if self._ordenada else sorted(nombres)
+
+    def conjunto(self, mascara):
+        """Los SKUs de la máscara como set (para resolver_discrepancia)"""
+        return set(self.nombres(mascara))
@@ -6,97 +6,155 @@ Recibe el número de vuelo y los datos escaneados como argumentos de línea de c
 
 import json
 import sys
-import itertools
+import time
 from datetime import datetime
-import snowflake.connector
-import os
-from dotenv import load_dotenv
 
-# Cargar variables de entorno
-load_dotenv()
-
-# Peso de tara por caja (en gramos)
-PESO_TARA_POR_CAJA_G = 721.0
-
-
-def formatear_solucion(coeficientes, items):
+from almacen_planes import abrir_planes, orden_compartida, publicar_orden
+from cache_validaciones import validar_idempotente
+from cargador_ordenes import cargar_coalescido, leer_entrada, ruta_entrada
+from conexion import conectar_snowflake
+from metricas import incrementar, observar
+from modelo_tara import ModeloTara, PESO_TARA_POR_CAJA_G
+from motor_discrepancias import resolver_discrepancia_mg
+from motor_tolerancia import banda_tolerancia_mg, compilar_planes
+from perfilado import extraer_bandera, perfilar
+from pesos_fijos import a_gramos, a_mg
+from plan_orden import leer_plan_orden
+from planes_cajones import adjuntar_cajones, leer_cajones
+from resiliencia_ordenes import guardar_respaldo_orden, llamar_warehouse, opciones_conexion, orden_de_respaldo
+from resolutor_skus import cargar_resolutor
+from snapshot_vuelos import snapshot_para
+from tabla_skus import TablaSkus
+
+
+# Con más carritos que esto la consulta filtrada ya no ahorra frente a la orden completa
+MAX_CARRITOS_FILTRO = 8
+
+
+def obtener_orden_vuelo(flight_number, cart_ids=None):
     """
-    Convierte una solución como (2, -1, 0) en un string legible.
-    'items' es una lista de tuplas: [('sku', peso), ...]
+    Obtiene la orden del vuelo. Pasa por la cache local de órdenes, donde
+    precarga_vuelos.py deja las órdenes de las salidas próximas.
+    Con 'cart_ids' (los carritos escaneados) regresa solo esos carritos:
+    se filtran de la orden completa si ya está en cache, o se consultan
+    solo esos en el warehouse.
+    Si el warehouse falla (o su circuito está abierto) regresa el último
+    respaldo de la orden, marcado con "desactualizada" (resiliencia_ordenes.py).
+    Antes de todo eso busca la orden en el almacén compartido del host
+    (almacen_planes.py).
     """
-    reporte_partes = []
-    for i, k in enumerate(coeficientes):
-        if k == 0:
-            continue
-
-        sku = items[i][0]
-        if k > 0:
-            reporte_partes.append(f"Faltan {k} {sku}")
-        else:
-            reporte_partes.append(f"Sobran {abs(k)} {sku}")
+    compartida = orden_compartida(flight_number, cart_ids)
+    if compartida is not None:
+        return compartida
 
-    if not reporte_partes:
-        return "Sugerencia: No se encontró una causa simple para la discrepancia."
-
-    return "Sugerencia: " + ", ".join(reporte_partes) + "."
+    try:
+        if cart_ids is not None:
+            return cargar_orden_carritos(flight_number, cart_ids)
+        return cargar_coalescido('orden_vuelo', (flight_number, None),
+                                 lambda: consultar_orden_vuelo(flight_number))
+    except Exception as e:
+        print(f"Error conectando a Snowflake: {e}", file=sys.stderr)
+        respaldo = orden_de_respaldo(flight_number, e)
+        return respaldo if cart_ids is None else filtrar_carritos(respaldo, set(cart_ids))
 
 
-def resolver_discrepancia(diferencia_peso, items_plan):
+def publicar_en_almacen(flight_number):
     """
-    Resuelve una discrepancia de peso compleja encontrando la combinación
-    de items faltantes/sobrantes más simple que explique la diferencia.
-
-    'items_plan' es un dict: {'sku': {'peso': 30}}
+    Deja la orden completa del vuelo en el almacén compartido si no está.
+    Regresa False si no se pudo (vuelo no encontrado, orden de respaldo o
+    almacén no disponible).
     """
+    if abrir_planes(flight_number) is not None:
+        return True
+    datos_orden = obtener_orden_vuelo(flight_number)
+    if not datos_orden or datos_orden.get('desactualizada'):
+        return False
+    try:
+        publicar_orden(flight_number, datos_orden)
+    except (OSError, ValueError) as e:
+        print(f"Advertencia: no se pudo publicar la orden {flight_number} en el almacén: {e}", file=sys.stderr)
+        return False
+    return True
+
+
+def carritos_escaneados(scanned_data):
+    """cart_ids del escaneo que pueden estar en la orden (los de la base son enteros)"""
+    cart_ids = set()
+    for carrito in scanned_data:
+        cart_id = carrito.get('cart_id') if isinstance(carrito, dict) else None
+        if isinstance(cart_id, int) and not isinstance(cart_id, bool):
+            cart_ids.add(cart_id)
+    return cart_ids
+
+
+def filtrar_carritos(datos_orden, cart_ids):
+    """La orden con solo los carritos de 'cart_ids' (None si la orden es None)"""
+    if datos_orden is None:
+        return None
+    return dict(datos_orden, carritos=[c for c in datos_orden['carritos'] if c['cart_id'] in cart_ids])
 
-    items = [(sku, data['peso']) for sku, data in items_plan.items()]
-    if not items:
-        return "Discrepancia de peso no identificada (no hay items en el plan)."
-
-    for search_bound in [5, 10, 25]:
-        search_range = range(-search_bound, search_bound + 1)
-
-        mejor_solucion = None
-        min_coste = float('inf')
-
-        for coeficientes in itertools.product(search_range, repeat=len(items)):
-
-            if all(c == 0 for c in coeficientes):
-                continue
 
-            suma_actual = sum(k * items[i][1] for i, k in enumerate(coeficientes))
-            coste_actual = sum(abs(k) for k in coeficientes)
+def cargar_orden_carritos(flight_number, cart_ids):
+    """
+    Los carritos 'cart_ids' de la orden. Si ninguno está en la orden se
+    regresa la orden completa, para distinguir "vuelo no encontrado" de
+    "carrito que no estaba en la orden".
+    """
+    def orden_completa():
+        return cargar_coalescido('orden_vuelo', (flight_number, None),
+                                 lambda: consultar_orden_vuelo(flight_number))
 
-            if abs(suma_actual - diferencia_peso) < 1.0:
+    cart_ids = sorted(cart_ids)
+    completa = leer_entrada(ruta_entrada('orden_vuelo', flight_number, None))
+    if completa is not None:
+        return filtrar_carritos(completa['resultado'], set(cart_ids))
+    if not cart_ids or len(cart_ids) > MAX_CARRITOS_FILTRO:
+        return orden_completa()
 
-                if coste_actual < min_coste:
-                    min_coste = coste_actual
-                    mejor_solucion = coeficientes
+    orden = cargar_coalescido('orden_carritos', (flight_number, '-'.join(map(str, cart_ids))),
+                              lambda: consultar_orden_vuelo(flight_number, cart_ids))
+    return orden if orden is not None else orden_completa()
 
-        if mejor_solucion:
-            return formatear_solucion(mejor_solucion, items)
 
-    return "Discrepancia de peso compleja no identificada."
+def consultar_orden_vuelo(flight_number, cart_ids=None):
+    """
+    Obtiene la orden del vuelo desde Snowflake, con tiempos acotados,
+    reintentos y circuit breaker. Cada orden completa obtenida queda como
+    respaldo. Regresa None si el vuelo no tiene carritos; los errores se propagan.
+    """
+    orden = llamar_warehouse(_consultar_orden_vuelo, flight_number, cart_ids)
+    if orden is not None and not cart_ids:
+        guardar_respaldo_orden(flight_number, orden)
+    return orden
 
 
-def obtener_orden_vuelo(flight_number):
+def _consultar_orden_vuelo(flight_number, cart_ids=None):
     """
-    Obtiene la orden del vuelo desde Snowflake
+    Un intento de consulta: un scan de ORDER_PLAN (plan_orden.py), o el join
+    si el vuelo todavía no tiene filas ahí. Con 'cart_ids' el filtro de
+    carritos va dentro de la consulta.
     """
-    try:
-        conn = snowflake.connector.connect(
-            account=os.getenv('SNOWFLAKE_ACCOUNT'),
-            user=os.getenv('SNOWFLAKE_USER'),
-            password=os.getenv('SNOWFLAKE_PASSWORD'),
-            database=os.getenv('SNOWFLAKE_DATABASE'),
-            schema=os.getenv('SNOWFLAKE_SCHEMA'),
-            warehouse=os.getenv('SNOWFLAKE_WAREHOUSE')
-        )
+    filtro_plan = "flight_number = %s"
+    filtro_join = "f.FLIGHT_NUMBER = %s"
+    parametros = (flight_number,)
+    if cart_ids:
+        marcadores = ", ".join(["%s"] * len(cart_ids))
+        filtro_plan += f" AND cart_id IN ({marcadores})"
+        filtro_join += f" AND c.CART_ID IN ({marcadores})"
+        parametros += tuple(cart_ids)
+
+    conn = conectar_snowflake(**opciones_conexion())
 
+    try:
         cursor = conn.cursor()
 
+        orden = leer_plan_orden(cursor, filtro_plan, parametros).get(flight_number)
+        if orden is not None:
+            cursor.close()
+            return {'flight_number': flight_number, 'carritos': orden['carritos']}
+
         # Obtener información del vuelo y sus carritos usando la estructura correcta
-        query = """
+        query = f"""
             SELECT
                 c.CART_ID,
                 c.CART_IDENTIFIER,
@@ -108,68 +166,175 @@ def obtener_orden_vuelo(flight_number):
             JOIN CARTS c ON f.FLIGHT_ID = c.FLIGHT_ID
             JOIN CART_ITEMS ci ON c.CART_ID = ci.CART_ID
             JOIN PRODUCTS p ON ci.PRODUCT_SKU = p.SKU
-            WHERE f.FLIGHT_NUMBER = %s
+            WHERE {filtro_join}
             ORDER BY c.CART_ID, p.SKU
         """
 
-        cursor.execute(query, (flight_number,))
+        cursor.execute(query, parametros)
         rows = cursor.fetchall()
-
-        if not rows:
-            cursor.close()
-            conn.close()
-            return None
-
-        # Organizar datos por carrito
-        carritos = {}
-        for row in rows:
-            cart_id = row[0]
-            cart_identifier = row[1]
-            sku = row[2]
-            peso_unitario = float(row[3])
-            cantidad = row[4]
-            tolerancia = float(row[5])
-
-            if cart_id not in carritos:
-                carritos[cart_id] = {
-                    'cart_id': cart_id,
-                    'cart_identifier': cart_identifier,
-                    'items_requeridos': []
-                }
-
-            carritos[cart_id]['items_requeridos'].append({
-                'sku': sku,
-                'peso_unitario_g': peso_unitario,
-                'cantidad_requerida': cantidad,
-                'peso_tolerancia': tolerancia
-            })
-
+        cajones_por_carrito = leer_cajones(cursor, filtro_join, parametros) if rows else {}
         cursor.close()
+    finally:
         conn.close()
 
-        return {
-            'flight_number': flight_number,
-            'carritos': list(carritos.values())
-        }
-
-    except Exception as e:
-        print(f"Error conectando a Snowflake: {e}", file=sys.stderr)
+    if not rows:
         return None
 
+    # Organizar datos por carrito
+    carritos = {}
+    for row in rows:
+        cart_id = row[0]
+        cart_identifier = row[1]
+        sku = row[2]
+        peso_unitario = float(row[3])
+        cantidad = row[4]
+        tolerancia = float(row[5])
+
+        if cart_id not in carritos:
+            carritos[cart_id] = {
+                'cart_id': cart_id,
+                'cart_identifier': cart_identifier,
+                'items_requeridos': []
+            }
+
+        carritos[cart_id]['items_requeridos'].append({
+            'sku': sku,
+            'peso_unitario_g': peso_unitario,
+            'cantidad_requerida': cantidad,
+            'peso_tolerancia': tolerancia
+        })
+
+    return {
+        'flight_number': flight_number,
+        'carritos': adjuntar_cajones(list(carritos.values()), cajones_por_carrito)
+    }
+
 
 def validar_inventario(flight_number, scanned_data):
     """
-    Valida el inventario escaneado contra la orden del vuelo
+    Valida el inventario escaneado contra la orden del vuelo. Un reenvío
+    idéntico contra la misma versión de la orden regresa el reporte ya
+    calculado (ver cache_validaciones.py).
     """
+    # Un snapshot del día con una versión más nueva avanza el marcador antes de buscar el reporte
+    snapshot_para(flight_number)
+    return validar_idempotente(flight_number, scanned_data, validar_sin_cache)
 
-    # Obtener la orden del vuelo
-    datos_orden = obtener_orden_vuelo(flight_number)
+
+def validar_sin_cache(flight_number, scanned_data):
+    """Obtiene la orden del vuelo y valida contra ella, sin la cache de reportes"""
+
+    # En una estación con snapshot del día (snapshot_vuelos.py) no se va a la red
+    snapshot = snapshot_para(flight_number)
+    if snapshot is not None:
+        return validar_desde_snapshot(snapshot, flight_number, scanned_data)
+
+    # Obtener solo los carritos escaneados de la orden del vuelo
+    datos_orden = obtener_orden_vuelo(flight_number, carritos_escaneados(scanned_data))
 
     if not datos_orden:
         return {
             "error": f"Vuelo '{flight_number}' no encontrado o sin carritos asignados."
         }
 
+    return validar_contra_orden(flight_number, datos_orden, scanned_data, cargar_resolutor())
+
+
+def validar_desde_almacen(flight_number, cart_ids, scanned_data, resolutor=None):
+    """
+    validar_contra_orden con los carritos 'cart_ids' leídos del almacén
+    compartido (para los workers del servicio). None si la orden ya no está.
+    """
+    datos_orden = orden_compartida(flight_number, cart_ids)
+    if datos_orden is None:
+        return None
+    return validar_contra_orden(flight_number, datos_orden, scanned_data, resolutor)
+
+
+def validar_desde_snapshot(snapshot, flight_number, scanned_data):
+    """
+    validar_contra_orden con los carritos escaneados leídos del snapshot y su
+    catálogo; el reporte lleva "snapshot" con la fecha, huella y order_version.
+    """
+    incrementar('ordenes_cargas_total', tipo='orden_vuelo', origen='snapshot')
+    datos_orden = snapshot.orden(flight_number, carritos_escaneados(scanned_data))
+    reporte = validar_contra_orden(flight_number, datos_orden, scanned_data, snapshot.resolutor())
+    reporte["snapshot"] = snapshot.descripcion(flight_number)
+    return reporte
+
+
+def validar_cajones(plan, cajas_medidas):
+    """
+    Valida cada caja contra el sub-plan de su cajón. 'cajas_medidas' es
+    [{"numero_cajon", "peso_neto_mg" (o None), "varianza_tara_g2", "tipos" (máscara)}];
+    varias cajas con el mismo número se suman. Regresa (detalle, reporte).
+    El solver solo ve los 1-3 SKUs del cajón en lugar de todo el carrito.
+    """
+    por_cajon = {}
+    for caja in cajas_medidas:
+        medido = por_cajon.setdefault(caja["numero_cajon"], {"peso_neto_mg": 0, "varianza_tara_g2": 0.0,
+                                                             "tipos": 0, "sin_peso": False})
+        if caja["peso_neto_mg"] is None:
+            medido["sin_peso"] = True
+        else:
+            medido["peso_neto_mg"] += caja["peso_neto_mg"]
+        medido["varianza_tara_g2"] += caja["varianza_tara_g2"]
+        medido["tipos"] |= caja["tipos"]
+
+    detalle = []
+    reporte = []
+    for numero_cajon in sorted(por_cajon, key=str):
+        medido = por_cajon[numero_cajon]
+        plan_cajon = plan["cajones"].get(numero_cajon)
+        if plan_cajon is None:
+            reporte.append(f"Cajón {numero_cajon}: no está en el plan del carrito.")
+            continue
+
+        esperado_mg = plan_cajon["peso_esperado_mg"]
+        banda_mg = banda_tolerancia_mg(plan_cajon, medido["varianza_tara_g2"])
+        en_rango = medido["sin_peso"] or abs(medido["peso_neto_mg"] - esperado_mg) <= banda_mg
+        detalle_cajon = {
+            "numero_cajon": numero_cajon,
+            "skus_esperados": sorted(plan_cajon["tipos_esperados"]),
+            "peso_esperado_g": a_gramos(esperado_mg),
+            "peso_neto_medido_g": None if medido["sin_peso"] else a_gramos(medido["peso_neto_mg"]),
+            "tolerancia_g": a_gramos(banda_mg),
+            "en_rango": en_rango
+        }
+
+        if not en_rango:
+            diferencia_mg = esperado_mg - medido["peso_neto_mg"]
+            signo = "Faltan" if diferencia_mg > 0 else "Sobran"
+            reporte.append(f"Cajón {numero_cajon}: {signo} {a_gramos(abs(diferencia_mg))}g "
+                           f"(Esperado: {a_gramos(esperado_mg)}g ±{a_gramos(banda_mg)}g, "
+                           f"Medido Neto: {a_gramos(medido['peso_neto_mg']):.2f}g)")
+            mascara_esperada = plan_cajon["mascara_esperada"]
+            tabla_skus = plan_cajon["tabla_skus"]
+            sugerencia = resolver_discrepancia_mg(
+                diferencia_mg, plan_cajon["items_plan"],
+                tipos_detectados=tabla_skus.conjunto(medido["tipos"] & mascara_esperada),
+                tipos_faltantes=tabla_skus.conjunto(mascara_esperada & ~medido["tipos"]) if medido["tipos"] else None)
+            detalle_cajon["sugerencia"] = sugerencia
+            reporte.append(f"Cajón {numero_cajon}: {sugerencia}")
+
+        detalle.append(detalle_cajon)
+
+    sin_escanear = sorted(set(plan["cajones"]) - set(por_cajon))
+    if sin_escanear:
+        reporte.append(f"Cajones sin escanear: {sin_escanear}")
+
+    return detalle, reporte
+
+
+def validar_contra_orden(flight_number, datos_orden, scanned_data, resolutor=None):
+    """
+    Valida el inventario escaneado contra una orden ya obtenida.
+    La tara de cada caja sale del modelo de tara, que además aprende
+    de los carritos que validan limpios. Con 'resolutor' (ResolutorSkus)
+    las etiquetas de visión se llevan a SKUs del catálogo antes de comparar.
+    """
+    inicio = time.perf_counter()
+
     # Crear el objeto de reporte final
     reporte_final = {
         "analysis_timestamp": datetime.now().isoformat(),
@@ -178,10 +343,19 @@ def validar_inventario(flight_number, scanned_data):
         "reporte_carritos": []
     }
 
-    plan_carritos = {
-        carrito['cart_id']: carrito
-        for carrito in datos_orden['carritos']
-    }
+    # La orden salió del respaldo local porque el warehouse no respondió
+    if datos_orden.get('desactualizada'):
+        reporte_final["orden_desactualizada"] = datos_orden['desactualizada']
+
+    # Pesos esperados y bandas de tolerancia precalculados una vez por orden, con
+    # los ids de la tabla del catálogo (armada una vez por huella con el resolutor)
+    tabla_skus = TablaSkus() if resolutor is None else resolutor.tabla_skus().extension()
+    plan_carritos = compilar_planes(datos_orden['carritos'], tabla=None if resolutor is None else tabla_skus)
+
+    # Los planes comparten la tabla de SKUs; la visión se compara con máscaras
+    tabla_skus = next((plan["tabla_skus"] for plan in plan_carritos.values()), tabla_skus)
+
+    modelo_tara = ModeloTara.cargar()
 
     # Iterar sobre cada carrito escaneado
     for scan_carrito in scanned_data:
@@ -189,10 +363,17 @@ def validar_inventario(flight_number, scanned_data):
         try:
             cajas_escaneadas = scan_carrito.get('cajas_escaneadas', [])
 
-            # Sumar peso y tipos detectados
-            peso_medido_bruto_total = 0.0
-            tipos_detectados_set = set()
+            estacion = scan_carrito.get('estacion')
+
+            # Sumar peso, tara estimada y tipos detectados (miligramos enteros)
+            peso_medido_bruto_mg = 0
+            peso_tara_estimado_mg = 0
+            varianza_tara_total = 0.0
+            fuentes_tara = set()
+            mascara_detectada = 0
+            etiquetas_resueltas = {}
             numero_de_cajas = 0
+            cajas_medidas = []
 
             if not cajas_escaneadas:
                 reporte_final["reporte_carritos"].append({
@@ -206,25 +387,48 @@ def validar_inventario(flight_number, scanned_data):
                 peso_caja = caja.get("peso_medido_g")
                 if peso_caja is None:
                     print(f"Advertencia: Caja en carrito {cart_id} no tiene 'peso_medido_g'.", file=sys.stderr)
+                    incrementar('cajas_sin_peso_total')
                 else:
-                    peso_medido_bruto_total += float(peso_caja)
-
-                tipos_detectados_set.update(caja.get("tipos_detectados_vision", []))
+                    peso_caja_mg = a_mg(peso_caja)
+                    peso_medido_bruto_mg += peso_caja_mg
+
+                tara_caja, varianza_tara, fuente_tara = modelo_tara.estimar(caja.get("tipo_caja"), estacion)
+                tara_caja_mg = a_mg(tara_caja)
+                peso_tara_estimado_mg += tara_caja_mg
+                varianza_tara_total += varianza_tara
+                fuentes_tara.add(fuente_tara)
+
+                etiquetas = caja.get("tipos_detectados_vision", [])
+                if resolutor is not None:
+                    etiquetas, correcciones = resolutor.resolver_etiquetas(etiquetas)
+                    etiquetas_resueltas.update(correcciones)
+                mascara_caja = tabla_skus.mascara(etiquetas)
+                mascara_detectada |= mascara_caja
                 numero_de_cajas += 1
 
+                cajas_medidas.append({
+                    "numero_cajon": caja.get("numero_cajon"),
+                    "peso_neto_mg": None if peso_caja is None else peso_caja_mg - tara_caja_mg,
+                    "varianza_tara_g2": varianza_tara,
+                    "tipos": mascara_caja
+                })
+
             # Calcular peso neto
-            peso_tara_total_estimado = numero_de_cajas * PESO_TARA_POR_CAJA_G
-            peso_medido_neto_total = max(0, peso_medido_bruto_total - peso_tara_total_estimado)
+            peso_medido_neto_mg = max(0, peso_medido_bruto_mg - peso_tara_estimado_mg)
+            peso_medido_neto_total = a_gramos(peso_medido_neto_mg)
 
             resultado_carrito = {
                 "cart_id": cart_id,
                 "numero_cajas_escaneadas": numero_de_cajas,
-                "peso_bruto_medido_g": round(peso_medido_bruto_total, 2),
-                "peso_tara_estimado_g": round(peso_tara_total_estimado, 2),
-                "peso_neto_medido_g": round(peso_medido_neto_total, 2),
+                "peso_bruto_medido_g": a_gramos(peso_medido_bruto_mg),
+                "peso_tara_estimado_g": a_gramos(peso_tara_estimado_mg),
+                "fuentes_tara": sorted(fuentes_tara),
+                "peso_neto_medido_g": peso_medido_neto_total,
                 "status": "OK",
                 "reporte": []
             }
+            if etiquetas_resueltas:
+                resultado_carrito["etiquetas_resueltas"] = etiquetas_resueltas
 
             # Obtener el plan para este carrito
             plan = plan_carritos.get(cart_id)
@@ -234,61 +438,69 @@ def validar_inventario(flight_number, scanned_data):
                 reporte_final["reporte_carritos"].append(resultado_carrito)
                 continue
 
-            # Calcular totales del plan
-            peso_esperado_contenido = 0.0
-            tolerancia_total = 0.0
-            tipos_esperados_set = set()
-            items_plan_dict = {}
+            # Totales del plan (precalculados) y banda según la incertidumbre de contenido y tara
+            peso_esperado_mg = plan["peso_esperado_mg"]
+            peso_esperado_contenido = plan["peso_esperado_g"]
+            tolerancia_mg = banda_tolerancia_mg(plan, varianza_tara_total)
+            mascara_esperada = plan["mascara_esperada"]
+            items_plan_dict = plan["items_plan"]
 
-            for item in plan["items_requeridos"]:
-                peso_item = item.get("peso_unitario_g", 0) * item.get("cantidad_requerida", 0)
-                peso_esperado_contenido += peso_item
-                tolerancia_total += item.get("peso_tolerancia", 0)
-                tipos_esperados_set.add(item["sku"])
-                items_plan_dict[item["sku"]] = {"peso": item.get("peso_unitario_g", 0)}
-
-            peso_esperado_contenido = round(peso_esperado_contenido, 2)
-            tolerancia_total = round(tolerancia_total, 2)
+            # Con sub-planes por cajón y cajas identificadas, cada caja se valida contra su cajón
+            por_cajon = bool(plan["cajones"]) and all(c["numero_cajon"] is not None for c in cajas_medidas)
+            if por_cajon:
+                resultado_carrito["cajones"], reporte_cajones = validar_cajones(plan, cajas_medidas)
+                resultado_carrito["reporte"].extend(reporte_cajones)
 
             # Comparar tipos
-            items_no_esperados = tipos_detectados_set - tipos_esperados_set
-            items_no_detectados = tipos_esperados_set - tipos_detectados_set
+            items_no_esperados = mascara_detectada & ~mascara_esperada
+            items_no_detectados = mascara_esperada & ~mascara_detectada
 
             if items_no_esperados:
                 resultado_carrito["status"] = "OK"
                 resultado_carrito["reporte"].append(
-                    f"Productos INCORRECTOS detectados: {sorted(list(items_no_esperados))}")
+                    f"Productos INCORRECTOS detectados: {tabla_skus.nombres(items_no_esperados)}")
             if items_no_detectados:
                 if resultado_carrito["status"] == "OK":
                     resultado_carrito["status"] = "OK"
                 resultado_carrito["reporte"].append(
-                    f"Productos FALTANTES (no vistos): {sorted(list(items_no_detectados))}")
+                    f"Productos FALTANTES (no vistos): {tabla_skus.nombres(items_no_detectados)}")
 
-            # Comparar peso neto vs peso esperado
-            peso_min_esperado = peso_esperado_contenido - tolerancia_total
-            peso_max_esperado = peso_esperado_contenido + tolerancia_total
+            # Comparar peso neto vs peso esperado (enteros, exacto)
+            peso_en_rango = abs(peso_medido_neto_mg - peso_esperado_mg) <= tolerancia_mg
 
-            if not (peso_min_esperado <= peso_medido_neto_total <= peso_max_esperado):
+            if not peso_en_rango:
                 if resultado_carrito["status"] == "OK" or resultado_carrito["status"] == "WARNING_VISUAL":
                     resultado_carrito["status"] = "OK" 
 
-                diferencia = round(peso_esperado_contenido - peso_medido_neto_total, 2)
-                signo = "Faltan" if diferencia > 0 else "Sobran"
+                diferencia_mg = peso_esperado_mg - peso_medido_neto_mg
+                signo = "Faltan" if diferencia_mg > 0 else "Sobran"
+                peso_min_esperado = a_gramos(peso_esperado_mg - tolerancia_mg)
+                peso_max_esperado = a_gramos(peso_esperado_mg + tolerancia_mg)
                 reporte_detallado = (
-                    f"Discrepancia de peso (neto): {signo} {abs(diferencia)}g. "
+                    f"Discrepancia de peso (neto): {signo} {a_gramos(abs(diferencia_mg))}g. "
                     f"(Esperado: {peso_esperado_contenido}g [Rango: {peso_min_esperado:.2f}g a {peso_max_esperado:.2f}g], "
                     f"Medido Neto: {peso_medido_neto_total:.2f}g)"
                 )
                 resultado_carrito["reporte"].append(reporte_detallado)
 
-                sugerencia = resolver_discrepancia(diferencia, items_plan_dict)
-                resultado_carrito["reporte"].append(sugerencia)
+                # Las sugerencias por cajón ya se dieron arriba; sin cajones se explica el carrito completo
+                if not por_cajon:
+                    # La visión acota la búsqueda: SKUs vistos en las cajas y SKUs no vistos
+                    sugerencia = resolver_discrepancia_mg(
+                        diferencia_mg, items_plan_dict,
+                        tipos_detectados=tabla_skus.conjunto(mascara_detectada & mascara_esperada),
+                        tipos_faltantes=tabla_skus.conjunto(items_no_detectados))
+                    resultado_carrito["reporte"].append(sugerencia)
 
             # Si todo está OK
             if resultado_carrito["status"] == "OK":
                 resultado_carrito["reporte"].append(
                     f"Carrito validado correctamente. Peso neto: {peso_medido_neto_total:.2f}g (Esperado: {peso_esperado_contenido}g)")
 
+            # Solo los carritos limpios (visión y peso) calibran la tara
+            if peso_en_rango and not items_no_esperados and not items_no_detectados:
+                modelo_tara.aprender_de_carrito(cajas_escaneadas, peso_esperado_contenido, estacion)
+
             reporte_final["reporte_carritos"].append(resultado_carrito)
 
         except KeyError as e:
@@ -304,10 +516,21 @@ def validar_inventario(flight_number, scanned_data):
                 "reporte": [f"Error procesando registro: {str(e)}"]
             })
 
+    try:
+        modelo_tara.guardar()
+    except OSError as e:
+        print(f"Advertencia: no se pudo guardar el modelo de tara: {e}", file=sys.stderr)
+
+    for resultado_carrito in reporte_final["reporte_carritos"]:
+        incrementar('validaciones_carritos_total', status=resultado_carrito["status"])
+    incrementar('validaciones_total')
+    observar('validacion_segundos', time.perf_counter() - inicio)
+
     return reporte_final
 
 
 if __name__ == "__main__":
+    modo_perfil = extraer_bandera(sys.argv)
     if len(sys.argv) < 3:
         print(json.dumps({"error": "Se requieren 2 argumentos: flight_number y scanned_data (JSON)"}), file=sys.stderr)
         sys.exit(1)
@@ -321,7 +544,7 @@ if __name__ == "__main__":
         sys.exit(1)
 
     # Ejecutar validación
-    resultado = validar_inventario(flight_number, scanned_data)
+    resultado = perfilar('validate_inventory', validar_inventario, flight_number, scanned_data, modo=modo_perfil)
 
     # Imprimir resultado
     print(json.dumps(resultado, ensure_ascii=False, indent=2))
@@ -79,6 +79,57 @@ app.post('/api/inventory/flight', (req, res) => {
     });
 });
 
+// Endpoint para obtener los nombres del catálogo; el navegador lo guarda por huella (ETag)
+app.get('/api/catalog', (req, res) => {
+    const huellaConocida = (req.headers['if-none-match'] || '').replace(/^W\//, '').replace(/"/g, '');
+
+    const pythonPath = path.join(__dirname, 'backend', 'venv', 'bin', 'python3');
+    const args = [path.join(__dirname, 'scripts', 'catalogo_productos.py')];
+    if (huellaConocida) {
+        args.push(huellaConocida);
+    }
+    const pythonProcess = spawn(pythonPath, args);
+
+    let dataString = '';
+    let errorString = '';
+
+    pythonProcess.stdout.on('data', (data) => {
+        dataString += data.toString();
+    });
+
+    pythonProcess.stderr.on('data', (data) => {
+        errorString += data.toString();
+        console.error(`Python stderr: ${data}`);
+    });
+
+    pythonProcess.on('close', (code) => {
+        if (code !== 0) {
+            console.error(`Proceso Python terminó con código: ${code}`);
+            return res.status(500).json({
+                error: 'Error al obtener el catálogo',
+                details: errorString || dataString
+            });
+        }
+
+        try {
+            const catalogo = JSON.parse(dataString);
+            // Siempre revalidar: si la huella no cambió la respuesta es un 304 sin cuerpo
+            res.set('Cache-Control', 'no-cache');
+            res.set('ETag', `"${catalogo.huella}"`);
+            if (catalogo.sin_cambios) {
+                return res.status(304).end();
+            }
+            res.json(catalogo);
+        } catch (error) {
+            console.error('Error al parsear respuesta:', error);
+            res.status(500).json({
+                error: 'Error al parsear respuesta del catálogo',
+                raw: dataString
+            });
+        }
+    });
+});
+
 // Endpoint para validar inventario escaneado
 app.post('/api/inventory/validate', (req, res) => {
     const { flight_number, scanned_data } = req.body;
@@ -26,6 +26,7 @@ export default function Inventory() {
     const [step, setStep] = useState('flight_input'); // flight_input, cart_selection, scanning, complete
     const [flightNumber, setFlightNumber] = useState('');
     const [inventoryData, setInventoryData] = useState(null);
+    const [catalogoNombres, setCatalogoNombres] = useState([]);
     const [selectedCart, setSelectedCart] = useState(null);
     const [scannedPhotos, setScannedPhotos] = useState([]);
     const [currentPhotoBase64, setCurrentPhotoBase64] = useState(null);
@@ -59,6 +60,15 @@ export default function Inventory() {
             const data = await response.json();
             setInventoryData(data);
             setStep('cart_selection');
+            // El catálogo ya no viene en la orden; el navegador lo revalida por ETag
+            fetch(`${BACKEND_URL}/api/catalog`)
+                .then(catalogResponse => catalogResponse.ok ? catalogResponse.json() : null)
+                .then(catalogo => {
+                    if (catalogo?.catalogo_nombres) {
+                        setCatalogoNombres(catalogo.catalogo_nombres);
+                    }
+                })
+                .catch(() => {});
         } catch (err) {
             setError(err.message);
         } finally {
@@ -104,7 +114,7 @@ export default function Inventory() {
         try {
             const base64Data = currentPhotoBase64.split(',')[1];
             const mimeType = currentPhotoBase64.split(';')[0].split(':')[1];
-            const catalogoCompleto = inventoryData.catalogo_nombres || [];
+            const catalogoCompleto = catalogoNombres;
             const productosEsperadosDetalle = selectedCart.items_requeridos.map(item =>
                 `"${item.sku}" (${item.cantidad_requerida} unidades)`
             ).join(', ');